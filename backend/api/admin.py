@@ -1,6 +1,7 @@
 # backend/api/admin.py
 from django.contrib import admin
-from .models import Clientes, ConfiguracaoIDMC, ExtracaoLog
+from .extraction.tracing import caminho_critico
+from .models import Clientes, ConfiguracaoIDMC, ExtracaoLog, DuracaoExportacao, SpanExtracao
 
 @admin.register(Clientes)
 class ClientesAdmin(admin.ModelAdmin):
@@ -28,3 +29,39 @@ class ExtracaoLogAdmin(admin.ModelAdmin):
 
     def has_change_permission(self, request, obj=None):
         return False
+
+@admin.register(DuracaoExportacao)
+class DuracaoExportacaoAdmin(admin.ModelAdmin):
+    list_display = ('configuracao', 'tipo_exportacao', 'duracao_media_segundos', 'desvio_medio_segundos', 'amostras', 'atualizado_em')
+    list_filter = ('configuracao',)
+    search_fields = ('tipo_exportacao',)
+    list_select_related = ('configuracao',)
+
+class CaminhoCriticoFilter(admin.SimpleListFilter):
+    # Restringe a lista aos spans do caminho crítico de uma das execuções recentes
+    title = 'caminho crítico da execução'
+    parameter_name = 'caminho_critico'
+
+    def lookups(self, request, model_admin):
+        raizes = SpanExtracao.objects.filter(parent_id__isnull=True).order_by('-inicio')[:20]
+        return [(raiz.execucao_id, f"{raiz.inicio:%d/%m/%Y %H:%M} ({raiz.duracao_segundos:.0f}s)") for raiz in raizes]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        caminho = caminho_critico(SpanExtracao.objects.filter(execucao_id=self.value()).only('span_id', 'parent_id', 'inicio', 'duracao_segundos'))
+        return queryset.filter(span_id__in=[span.span_id for _, span in caminho])
+
+@admin.register(SpanExtracao)
+class SpanExtracaoAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'configuracao', 'tipo_exportacao', 'meter_id', 'inicio', 'duracao_segundos', 'status', 'linhas', 'bytes')
+    list_filter = (CaminhoCriticoFilter, 'nome', 'status', 'configuracao')
+    search_fields = ('execucao_id', 'span_id', 'parent_id', 'tipo_exportacao', 'meter_id')
+    list_select_related = ('configuracao',)
+    readonly_fields = ('execucao_id', 'span_id', 'parent_id', 'configuracao', 'nome', 'tipo_exportacao', 'meter_id', 'inicio', 'duracao_segundos', 'status', 'linhas', 'bytes', 'atributos')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Agregações de IPU por período (dia, semana, mês ou ciclo de faturamento, no fuso de
+# settings.TIME_ZONE = America/Sao_Paulo) e grupo (meter, projeto, ambiente ou organização),
+# calculadas no banco e guardadas no cache do Django (settings.CACHES).
+# Cada configuração tem no cache uma versão que entra na chave das suas agregações;
+# invalidar(configuracao_id) troca a versão (o fetch_ipu_data, ao terminar de carregar a
+# configuração, e o rebuild_rollups) e as entradas antigas deixam de ser lidas. Um cálculo que
+# começou antes da troca grava na versão antiga, então nunca serve dado anterior à carga.
+import hashlib
+import json
+import uuid
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DateField, DateTimeField, Max, Q, Sum, Value, When
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from api.models import CicloFaturamento, ConsumoAsset, ConsumoDiarioMeter, ConsumoDiarioProjeto, ConsumoSummary
+
+PERIODOS = {'dia': 'day', 'semana': 'week', 'mes': 'month', 'ciclo': None}
+
+
+class Fonte:
+    # Tabela agregada para um agrupamento: campo de data, campo do grupo, campo com o nome
+    # exibido do grupo (opcional) e campo de IPU
+    def __init__(self, model, campo_data, campo_grupo, campo_ipu, campo_nome=None):
+        self.model = model
+        self.campo_data = campo_data
+        self.campo_grupo = campo_grupo
+        self.campo_ipu = campo_ipu
+        self.campo_nome = campo_nome
+
+    @property
+    def por_dia(self):
+        # Rollups diários (api.ingestion.rollups): a data já é o dia local
+        return not isinstance(self.model._meta.get_field(self.campo_data), DateTimeField)
+
+
+# Agrupamento -> fonte; sem agrupamento, o total por período sai do rollup por meter
+FONTES = {
+    None: Fonte(ConsumoDiarioMeter, 'dia', None, 'consumption_ipu'),
+    'meter': Fonte(ConsumoDiarioMeter, 'dia', 'meter_id', 'consumption_ipu', campo_nome='meter_name'),
+    'project': Fonte(ConsumoDiarioProjeto, 'dia', 'project_name', 'consumption_ipu'),
+    'environment': Fonte(ConsumoAsset, 'consumption_date', 'runtime_environment', 'consumption_ipu'),
+    'org': Fonte(ConsumoSummary, 'consumption_date', 'org_id', 'consumption_ipu', campo_nome='org_name'),
+}
+
+
+def _inicio_do_dia(dia):
+    return datetime.combine(dia, dt_time.min, tzinfo=timezone.get_default_timezone())
+
+
+def _filtro_dias(fonte, inicio, fim):
+    # [inicio, fim] em dias locais, inclusive
+    filtro = Q()
+    if fonte.por_dia:
+        if inicio:
+            filtro &= Q(**{f'{fonte.campo_data}__gte': inicio})
+        if fim:
+            filtro &= Q(**{f'{fonte.campo_data}__lte': fim})
+        return filtro
+    if inicio:
+        filtro &= Q(**{f'{fonte.campo_data}__gte': _inicio_do_dia(inicio)})
+    if fim:
+        filtro &= Q(**{f'{fonte.campo_data}__lt': _inicio_do_dia(fim + timedelta(days=1))})
+    return filtro
+
+
+def _fim_do_periodo(inicio, periodo):
+    if periodo == 'semana':
+        return inicio + timedelta(days=6)
+    if periodo == 'mes':
+        proximo = inicio.replace(day=28) + timedelta(days=4)
+        return proximo - timedelta(days=proximo.day)
+    return inicio
+
+
+def _expressao_periodo(fonte, periodo, ciclos):
+    if periodo != 'ciclo':
+        return Trunc(fonte.campo_data, PERIODOS[periodo], output_field=DateField(), tzinfo=None if fonte.por_dia else timezone.get_default_timezone())
+    # Poucos ciclos por configuração: um CASE com a faixa de cada um (linhas fora de ciclo ficam nulas)
+    if not ciclos:
+        return Value(None, output_field=DateField())
+    return Case(*(
+        When(_filtro_dias(fonte, inicio, fim), then=Value(inicio))
+        for inicio, fim in ciclos
+    ), output_field=DateField())
+
+
+def calcular(configuracao_id, agrupar=None, periodo='dia', inicio=None, fim=None):
+    # Lista de {'periodo', 'periodo_fim', 'grupo', 'nome', 'consumption_ipu'} ordenada por período e grupo
+    fonte = FONTES[agrupar]
+    ciclos = {}
+    if periodo == 'ciclo':
+        ciclos = dict(
+            CicloFaturamento.objects.filter(configuracao_id=configuracao_id)
+            .values_list('billing_period_start_date', 'billing_period_end_date')
+        )
+    grupos = [fonte.campo_grupo] if fonte.campo_grupo else []
+    agregados = {'r_ipu': Sum(fonte.campo_ipu)}
+    if fonte.campo_nome:
+        agregados['r_nome'] = Max(fonte.campo_nome)
+    consulta = (
+        fonte.model._base_manager.filter(Q(configuracao_id=configuracao_id) & _filtro_dias(fonte, inicio, fim))
+        .annotate(r_periodo=_expressao_periodo(fonte, periodo, ciclos.items()))
+        .exclude(r_periodo__isnull=True)
+        .values('r_periodo', *grupos)
+        .annotate(**agregados)
+        .order_by('r_periodo', *grupos)
+    )
+    resultado = []
+    for linha in consulta:
+        inicio_periodo = linha['r_periodo']
+        resultado.append({
+            'periodo': inicio_periodo.isoformat(),
+            'periodo_fim': (ciclos[inicio_periodo] if periodo == 'ciclo' else _fim_do_periodo(inicio_periodo, periodo)).isoformat(),
+            'grupo': linha[fonte.campo_grupo] if fonte.campo_grupo else None,
+            'nome': linha.get('r_nome'),
+            # Texto: o JSON do DRF converteria Decimal em float
+            'consumption_ipu': None if linha['r_ipu'] is None else str(linha['r_ipu']),
+        })
+    return resultado
+
+
+def _chave_versao(configuracao_id):
+    return f'agregacoes:versao:{configuracao_id}'
+
+
+def invalidar(configuracao_id):
+    # Se a versão sumir do cache (descarte por MAX_ENTRIES), a próxima leitura cria outra: o efeito
+    # é o mesmo de uma invalidação
+    cache.set(_chave_versao(configuracao_id), uuid.uuid4().hex, None)
+
+
+def agregar(configuracao_id, agrupar=None, periodo='dia', inicio=None, fim=None):
+    # calcular() com cache; retorna (resultado, veio_do_cache)
+    versao = cache.get(_chave_versao(configuracao_id))
+    if versao is None:
+        versao = uuid.uuid4().hex
+        if not cache.add(_chave_versao(configuracao_id), versao, None):
+            versao = cache.get(_chave_versao(configuracao_id), versao)
+    parametros = json.dumps([agrupar, periodo, inicio and inicio.isoformat(), fim and fim.isoformat()])
+    chave = f'agregacoes:{configuracao_id}:{versao}:{hashlib.md5(parametros.encode()).hexdigest()}'
+    resultado = cache.get(chave)
+    if resultado is not None:
+        return resultado, True
+    resultado = calcular(configuracao_id, agrupar, periodo, inicio, fim)
+    cache.set(chave, resultado, settings.AGREGACOES_CACHE_TIMEOUT)
+    return resultado, False
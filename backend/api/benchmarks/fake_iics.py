@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# Servidor local que imita os endpoints da IICS usados pelo InformaticaAPIClient: login,
+# criação de job de exportação (ExportMeteringData / ExportServiceJobLevelMeteringData),
+# consulta de status e download do ZIP. Os jobs passam por QUEUED -> IN_PROGRESS -> SUCCESS
+# (ou FAILED) conforme a latência sorteada, e os CSVs do ZIP vêm de api.benchmarks.synthetic, com
+# registros a partir do startDate do job e sem passar do endDate.
+# O download aceita HTTP Range e pode ser cortado no meio (taxa_corte_download) para exercitar a
+# retomada, e as sessões podem expirar (duracao_sessao) para exercitar o novo login. Roda dentro do processo (ServidorFakeIICS) ou como serviço (manage.py fake_iics_server).
+import csv
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from api.benchmarks.synthetic import INICIO_PADRAO, gerar_exportacao
+from api.ingestion.schemas import EXPORT_SPECS, METER_SPECS
+
+PREFIXO_METERING = '/saas/public/core/v3/license/metering'
+_ROTA_STATUS = re.compile(PREFIXO_METERING + r'/ExportMeteringData/([^/]+)$')
+_ROTA_DOWNLOAD = re.compile(PREFIXO_METERING + r'/ExportMeteringData/([^/]+)/download$')
+_RANGE = re.compile(r'bytes=(\d+)-$')
+
+
+class ConfiguracaoFake:
+    def __init__(self, latencia_job=(2.0, 6.0), taxa_falha_job=0.0, taxa_erro_status=0.0, taxa_erro_criacao=0.0,
+                 latencia_http=0.0, linhas=None, linhas_padrao=2000, seed=0, taxa_corte_download=0.0,
+                 duracao_sessao=None):
+        # latencia_job: faixa (segundos) sorteada para cada job ficar pronto
+        self.latencia_job = latencia_job
+        # taxa_falha_job: jobs que terminam em FAILED
+        self.taxa_falha_job = taxa_falha_job
+        # taxa_erro_status / taxa_erro_criacao: respostas 503 transitórias
+        self.taxa_erro_status = taxa_erro_status
+        self.taxa_erro_criacao = taxa_erro_criacao
+        self.latencia_http = latencia_http
+        # taxa_corte_download: downloads encerrados na metade do corpo
+        self.taxa_corte_download = taxa_corte_download
+        # duracao_sessao: segundos após o login em que a sessão passa a receber 401 (None = não expira)
+        self.duracao_sessao = duracao_sessao
+        self.linhas = linhas or {}
+        self.linhas_padrao = linhas_padrao
+        self.seed = seed
+
+
+def _data_do_corpo(valor):
+    # startDate/endDate no formato enviado pelo cliente ('2025-08-01T00:00:00Z'); só o dia importa
+    try:
+        return datetime.strptime((valor or '')[:10], '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+class _Job:
+    def __init__(self, spec, meter_id, inicio, fim, pronto_em, falha):
+        self.spec = spec
+        self.meter_id = meter_id
+        # Janela pedida: os registros do CSV começam em inicio e não passam de fim
+        self.inicio = inicio
+        self.fim = fim
+        self.criado_em = time.monotonic()
+        self.pronto_em = pronto_em
+        self.falha = falha
+
+    def status(self):
+        agora = time.monotonic()
+        if agora >= self.pronto_em:
+            return 'FAILED' if self.falha else 'SUCCESS'
+        # Primeiro terço da espera na fila, o resto em processamento
+        return 'QUEUED' if agora < self.criado_em + (self.pronto_em - self.criado_em) / 3 else 'IN_PROGRESS'
+
+
+class EstadoFake:
+    def __init__(self, config):
+        self.config = config
+        self.jobs = {}
+        # {sessionId: instante do login}
+        self.sessoes = {}
+        self.chamadas = Counter()
+        self._lock = threading.Lock()
+        self._rnd = random.Random(config.seed)
+        self._zips = {}
+
+    def sortear(self):
+        with self._lock:
+            return self._rnd.random()
+
+    def contar(self, rota):
+        with self._lock:
+            self.chamadas[rota] += 1
+
+    def criar_job(self, spec, meter_id, inicio=None, fim=None):
+        minimo, maximo = self.config.latencia_job
+        with self._lock:
+            latencia = self._rnd.uniform(minimo, maximo)
+            falha = self._rnd.random() < self.config.taxa_falha_job
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = _Job(spec, meter_id, inicio or INICIO_PADRAO, fim, time.monotonic() + latencia, falha)
+        return job_id
+
+    def _registros_da_janela(self, job, linhas):
+        # Os geradores passam para o dia seguinte quando as combinações de um dia acabam; o que
+        # cairia depois do fim da janela fica de fora, como numa exportação real
+        registros = gerar_exportacao(job.spec, linhas, seed=self.config.seed, inicio=job.inicio)
+        yield next(registros)
+        if job.fim is None:
+            yield from registros
+            return
+        indice = next(i for i, coluna in enumerate(job.spec.colunas) if coluna.field == job.spec.campo_inicio)
+        limite = job.fim.strftime('%Y-%m-%d')
+        for registro in registros:
+            if registro[indice][:10] > limite:
+                return
+            yield registro
+
+    def zip_do_job(self, job):
+        # Um ZIP por tipo/meter e janela, gerado uma vez e reaproveitado pelos downloads seguintes
+        chave = (job.spec.nome, job.meter_id, job.inicio, job.fim)
+        with self._lock:
+            conteudo = self._zips.get(chave)
+        if conteudo is None:
+            linhas = self.config.linhas.get(job.spec.nome, self.config.linhas_padrao)
+            csv_texto = io.StringIO()
+            csv.writer(csv_texto).writerows(self._registros_da_janela(job, linhas))
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+                arquivo_zip.writestr(f"{job.spec.nome.lower()}.csv", csv_texto.getvalue())
+            conteudo = buffer.getvalue()
+            with self._lock:
+                self._zips[chave] = conteudo
+        return conteudo
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def estado(self):
+        return self.server.estado
+
+    def _responder(self, codigo, corpo=None, tipo='application/json', cabecalhos=None, cortar=False):
+        dados = corpo if isinstance(corpo, bytes) else json.dumps(corpo or {}).encode('utf-8')
+        self.send_response(codigo)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        if cortar:
+            # Metade do corpo anunciado e a conexão é fechada: o cliente recebe menos bytes que o Content-Length
+            self.wfile.write(dados[:len(dados) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(dados)
+
+    def _download(self, job):
+        conteudo = self.estado.zip_do_job(job)
+        total = len(conteudo)
+        faixa = _RANGE.match(self.headers.get('Range') or '')
+        inicio = int(faixa.group(1)) if faixa else 0
+        if inicio >= total and faixa:
+            return self._responder(416, {'error': {'message': 'Range inválido.'}}, cabecalhos={'Content-Range': f'bytes */{total}'})
+        cortar = self.estado.sortear() < self.estado.config.taxa_corte_download
+        if faixa:
+            self.estado.contar('download_retomado')
+            return self._responder(206, conteudo[inicio:], tipo='application/zip', cabecalhos={'Content-Range': f'bytes {inicio}-{total - 1}/{total}', 'Accept-Ranges': 'bytes'}, cortar=cortar)
+        self._responder(200, conteudo, tipo='application/zip', cabecalhos={'Accept-Ranges': 'bytes'}, cortar=cortar)
+
+    def _ler_json(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(tamanho) or b'{}')
+
+    def _autenticado(self):
+        criada_em = self.estado.sessoes.get(self.headers.get('INFA-SESSION-ID'))
+        duracao = self.estado.config.duracao_sessao
+        if criada_em is not None and (duracao is None or time.monotonic() - criada_em < duracao):
+            return True
+        self.estado.contar('sessao_recusada')
+        self._responder(401, {'error': {'code': 'AUTH_01', 'message': 'Sessão inválida.'}})
+        return False
+
+    def _atrasar(self):
+        if self.estado.config.latencia_http:
+            time.sleep(self.estado.config.latencia_http)
+
+    def do_POST(self):
+        self._atrasar()
+        caminho = self.path.split('?')[0]
+        corpo = self._ler_json()
+        if caminho == '/saas/public/core/v3/login':
+            self.estado.contar('login')
+            sessao = uuid.uuid4().hex
+            with self.estado._lock:
+                self.estado.sessoes[sessao] = time.monotonic()
+            base = f"http://{self.headers.get('Host')}/saas"
+            return self._responder(200, {'userInfo': {'sessionId': sessao, 'name': corpo.get('username')}, 'products': [{'name': 'Integration Cloud', 'baseApiUrl': base}]})
+        if caminho in (f'{PREFIXO_METERING}/ExportMeteringData', f'{PREFIXO_METERING}/ExportServiceJobLevelMeteringData'):
+            self.estado.contar('criar_job')
+            if not self._autenticado():
+                return None
+            if self.estado.sortear() < self.estado.config.taxa_erro_criacao:
+                return self._responder(503, {'error': {'message': 'Serviço indisponível (simulado).'}})
+            if corpo.get('meterId'):
+                spec, meter_id = METER_SPECS.get(corpo['meterId']), corpo['meterId']
+            else:
+                spec, meter_id = EXPORT_SPECS.get(corpo.get('jobType')), None
+            if spec is None:
+                return self._responder(400, {'error': {'message': 'jobType/meterId desconhecido.'}})
+            job_id = self.estado.criar_job(spec, meter_id, _data_do_corpo(corpo.get('startDate')), _data_do_corpo(corpo.get('endDate')))
+            return self._responder(200, {'jobId': job_id, 'status': 'QUEUED'})
+        self._responder(404, {'error': {'message': f'Rota desconhecida: {caminho}'}})
+
+    def do_GET(self):
+        self._atrasar()
+        caminho = self.path.split('?')[0]
+        rota = _ROTA_DOWNLOAD.match(caminho) or _ROTA_STATUS.match(caminho)
+        if rota is None:
+            return self._responder(404, {'error': {'message': f'Rota desconhecida: {caminho}'}})
+        download = caminho.endswith('/download')
+        self.estado.contar('download' if download else 'status')
+        if not self._autenticado():
+            return None
+        job = self.estado.jobs.get(rota.group(1))
+        if job is None:
+            return self._responder(404, {'error': {'message': 'Job não encontrado.'}})
+        if download:
+            if job.status() != 'SUCCESS':
+                return self._responder(409, {'error': {'message': 'Job não concluído.'}})
+            return self._download(job)
+        if self.estado.sortear() < self.estado.config.taxa_erro_status:
+            return self._responder(503, {'error': {'message': 'Serviço indisponível (simulado).'}})
+        self._responder(200, {'jobId': rota.group(1), 'status': job.status()})
+
+
+class ServidorFakeIICS:
+    # with ServidorFakeIICS(config) as servidor: ... servidor.url é o iics_pod_url das configurações
+    def __init__(self, config=None, host='127.0.0.1', porta=0):
+        self.estado = EstadoFake(config or ConfiguracaoFake())
+        self._servidor = ThreadingHTTPServer((host, porta), _Handler)
+        self._servidor.daemon_threads = True
+        self._servidor.estado = self.estado
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self._servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    @property
+    def chamadas(self):
+        return dict(self.estado.chamadas)
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._servidor.serve_forever, name="fake_iics", daemon=True)
+        self._thread.start()
+        return self
+
+    def servir(self):
+        self._servidor.serve_forever()
+
+    def parar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.parar()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# Gerador de CSVs sintéticos no formato das exportações da IICS, a partir das ExportSpecs.
+# Usado pelos comandos de benchmark para medir a ingestão sem depender de um pod real.
+# gerar_linhas() preenche qualquer spec com valores genéricos; gerar_exportacao() produz,
+# para cada tipo, valores com a cara dos arquivos reais (datas por dia, meters conhecidos,
+# status, fusos) e cardinalidades configuráveis de orgs, meters, projetos, assets etc.
+import csv
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+INICIO_PADRAO = datetime(2025, 8, 1)
+FORMATO_DATA_HORA = '%Y-%m-%dT%H:%M:%S.000Z'
+
+
+def _valor(coluna, i, rnd, inicio):
+    if coluna.tipo is datetime:
+        return (inicio + timedelta(seconds=i * 7 + rnd.randint(0, 6))).strftime(FORMATO_DATA_HORA)
+    if coluna.tipo is Decimal:
+        return f"{rnd.randint(0, 999)}.{rnd.randint(0, 999999):06d}"
+    if coluna.tipo is int:
+        return str(rnd.randint(0, 86400))
+    if coluna.chave:
+        return f"{coluna.field}-{i}"
+    return f"{coluna.field}-{rnd.randint(0, 50)}"
+
+
+def gerar_linhas(spec, linhas, seed=0, taxa_nulos=0.0, inicio=INICIO_PADRAO):
+    # Colunas chave recebem valores únicos por linha; as demais, valores repetidos como no real
+    rnd = random.Random(seed)
+    yield [coluna.header for coluna in spec.colunas]
+    for i in range(linhas):
+        linha = []
+        for coluna in spec.colunas:
+            if taxa_nulos and not coluna.obrigatoria and rnd.random() < taxa_nulos:
+                linha.append(rnd.choice(('', 'null')))
+            else:
+                linha.append(_valor(coluna, i, rnd, inicio))
+        yield linha
+
+
+def escrever_csv(spec, destino, linhas, seed=0, taxa_nulos=0.0, inicio=INICIO_PADRAO):
+    with open(destino, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(gerar_linhas(spec, linhas, seed, taxa_nulos, inicio))
+    return destino
+
+
+# Quantos valores distintos cada dimensão assume nos arquivos gerados por gerar_exportacao()
+CARDINALIDADES_PADRAO = {
+    'orgs': 3,
+    'meters': 12,
+    'projetos': 20,
+    'pastas': 5,
+    'assets': 500,
+    'tasks': 2000,
+    'ambientes': 4,
+}
+
+METERS_CONHECIDOS = [
+    ("a2nB20h1o0lc7k3P9xtWS8", "Data Integration"),
+    ("bN6mes5n4GGciiMkuoDlCz", "Application Integration"),
+    ("3uIRkIV5Rt9lBbAPzeR5Kj", "Application Integration with Advanced Serverless"),
+    ("9xQ2Lm0ZkC4tHhS7vNbW1e", "Data Integration with Advanced Serverless"),
+]
+TIPOS_ASSET = ['MTT', 'DSS', 'TASKFLOW', 'MAPPING', 'PROCESS', 'CONNECTION']
+STATUS_CDI = ['COMPLETED', 'COMPLETED', 'COMPLETED', 'FAILED', 'WARNING']
+STATUS_CAI = ['Success', 'Success', 'Faulted', 'Suspended']
+FORMATO_DATA = '%Y-%m-%d'
+FORMATO_AUDITORIA = '%Y-%m-%d %H:%M:%S'
+
+
+def _meters(quantidade):
+    meters = list(METERS_CONHECIDOS)
+    for i in range(len(meters), quantidade):
+        meters.append((f"meter{i:018d}", f"Meter sintético {i}"))
+    return meters[:max(1, quantidade)]
+
+
+def _decimal(rnd, inteiro=999, casas=6):
+    return f"{rnd.randint(0, inteiro)}.{rnd.randint(0, 10 ** casas - 1):0{casas}d}"
+
+
+def _linhas_summary(linhas, card, rnd, inicio):
+    orgs, meters = card['orgs'], _meters(card['meters'])
+    # Chave (org, meter, dia): cada dia tem uma linha por org e meter
+    for i in range(linhas):
+        org = i % orgs
+        meter_id, meter_name = meters[(i // orgs) % len(meters)]
+        dia = inicio + timedelta(days=i // (orgs * len(meters)))
+        ciclo = dia.replace(day=1)
+        yield {
+            'OrgId': f"org{org:04d}", 'MeterId': meter_id, 'Date': dia.strftime(FORMATO_DATA), 'MeterName': meter_name,
+            'BillingPeriodStartDate': ciclo.strftime(FORMATO_DATA), 'BillingPeriodEndDate': (ciclo + timedelta(days=30)).strftime(FORMATO_DATA),
+            'MeterUsage': _decimal(rnd), 'IPU': _decimal(rnd, 99), 'Scalar': 'Per Hour', 'MetricCategory': 'Compute',
+            'OrgName': f"Org {org}", 'OrgType': 'Sub-Org' if org else 'Parent', 'IPURate': _decimal(rnd, 2, 4),
+        }
+
+
+def _linhas_project_folder(linhas, card, rnd, inicio):
+    orgs, projetos, pastas = card['orgs'], card['projetos'], card['pastas']
+    por_dia = orgs * projetos * pastas
+    for i in range(linhas):
+        org, projeto, pasta = i % orgs, (i // orgs) % projetos, (i // (orgs * projetos)) % pastas
+        yield {
+            'Date': (inicio + timedelta(days=i // por_dia)).strftime(FORMATO_DATA),
+            'Project': f"Projeto_{projeto:03d}", 'Folder': f"Projeto_{projeto:03d}/Pasta_{pasta:02d}",
+            'Org ID': f"org{org:04d}", 'Org Type': 'Sub-Org' if org else 'Parent', 'Consumption (IPUs)': _decimal(rnd, 50),
+        }
+
+
+def _linhas_asset(linhas, card, rnd, inicio):
+    meters, assets = _meters(card['meters']), card['assets']
+    for i in range(linhas):
+        asset = i % assets
+        meter_id, meter_name = meters[asset % len(meters)]
+        projeto = asset % card['projetos']
+        yield {
+            'Meter ID': meter_id, 'Date': (inicio + timedelta(days=i // assets)).strftime(FORMATO_DATA),
+            'Asset Name': f"asset_{asset:05d}", 'Asset Type': TIPOS_ASSET[asset % len(TIPOS_ASSET)],
+            'Project': f"Projeto_{projeto:03d}", 'Folder': f"Pasta_{asset % card['pastas']:02d}",
+            'Org ID': f"org{asset % card['orgs']:04d}", 'Environment Name': f"Agente_{asset % card['ambientes']:02d}",
+            'Tier': 'Tier 1', 'IPU Per Unit': '0.0025', 'Meter Name': meter_name, 'Org Type': 'Parent',
+            'Environment Type': 'Secure Agent', 'Usage': _decimal(rnd, 9999), 'Consumption (IPUs)': _decimal(rnd, 99),
+        }
+
+
+def _linhas_cdi_job(linhas, card, rnd, inicio):
+    tasks = card['tasks']
+    for i in range(linhas):
+        task = i % tasks
+        comeco = inicio + timedelta(seconds=i * 13 + rnd.randint(0, 12))
+        fim = comeco + timedelta(seconds=rnd.randint(5, 3600))
+        projeto = task % card['projetos']
+        yield {
+            'Task ID': f"task{task:06d}", 'Task Run ID': str(100000 + i), 'Org ID': f"org{task % card['orgs']:04d}",
+            'Environment ID': f"env{task % card['ambientes']:02d}", 'Start Time': comeco.strftime(FORMATO_DATA_HORA),
+            'End Time': fim.strftime(FORMATO_DATA_HORA), 'Task Name': f"mt_carga_{task:06d}", 'Task Object Name': f"m_carga_{task:06d}",
+            'Task Type': TIPOS_ASSET[task % 2], 'Project Name': f"Projeto_{projeto:03d}", 'Folder Name': f"Pasta_{task % card['pastas']:02d}",
+            'Environment': f"Agente_{task % card['ambientes']:02d}", 'Cores Used': str(rnd.choice((1, 2, 4, 8))),
+            'Status': rnd.choice(STATUS_CDI), 'Metered Value': _decimal(rnd, 9),
+            # Audit Time vem sem fuso (horário de São Paulo), como nos arquivos reais
+            'Audit Time': (fim + timedelta(seconds=30)).strftime(FORMATO_AUDITORIA), 'OBM Task Time(s)': str(int((fim - comeco).total_seconds())),
+        }
+
+
+def _linhas_cai_summary(linhas, card, rnd, inicio):
+    assets = card['assets']
+    for i in range(linhas):
+        asset = i % assets
+        yield {
+            'Org ID': f"org{asset % card['orgs']:04d}", 'Executed asset': f"processo_{asset:05d}",
+            'Date (in UTC)': (inicio + timedelta(days=i // assets)).strftime(FORMATO_DATA), 'Execution env': 'Cloud Server',
+            'status': STATUS_CAI[asset % len(STATUS_CAI)], 'Invoked by': f"usuario{asset % 7}@example.com", 'Execution type': 'Process',
+            'Execution count': str(rnd.randint(1, 500)), 'Total Execution time (in hours)': _decimal(rnd, 5),
+            'Average Execution time (in seconds)': _decimal(rnd, 60, 3),
+        }
+
+
+GERADORES = {
+    'SUMMARY': _linhas_summary,
+    'PROJECT_FOLDER': _linhas_project_folder,
+    'ASSET': _linhas_asset,
+    'CDI_JOB': _linhas_cdi_job,
+    'CAI_SUMMARY': _linhas_cai_summary,
+}
+
+
+def gerar_exportacao(spec, linhas, cardinalidades=None, seed=0, taxa_nulos=0.0, inicio=INICIO_PADRAO):
+    # Mesmo cabeçalho (e ordem de colunas) das ExportSpecs, que é o que os loaders leem.
+    # As chaves nunca se repetem: quando as combinações acabam, os registros passam para o dia seguinte.
+    card = {**CARDINALIDADES_PADRAO, **(cardinalidades or {})}
+    card = {nome: max(1, int(valor)) for nome, valor in card.items()}
+    rnd = random.Random(seed)
+    yield [coluna.header for coluna in spec.colunas]
+    for registro in GERADORES[spec.nome](linhas, card, rnd, inicio):
+        linha = []
+        for coluna in spec.colunas:
+            if taxa_nulos and not coluna.obrigatoria and not coluna.chave and rnd.random() < taxa_nulos:
+                linha.append(rnd.choice(('', 'null')))
+            else:
+                linha.append(registro[coluna.header])
+        yield linha
+
+
+def escrever_exportacao(spec, destino, linhas, cardinalidades=None, seed=0, taxa_nulos=0.0, inicio=INICIO_PADRAO):
+    with open(destino, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows(gerar_exportacao(spec, linhas, cardinalidades, seed, taxa_nulos, inicio))
+    return destino
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# Exportação em massa das tabelas de consumo (CSV, CSV gzip ou Parquet) em fluxo: as linhas vêm
+# do banco por cursor no servidor (.iterator(chunk_size)) e saem em blocos de bytes à medida
+# que são lidas, então a memória não cresce com o tamanho do resultado. Usada pela view
+# ConsumoExportView (StreamingHttpResponse) e pelo comando export_consumption.
+# Sem ORDER BY: a ordem é a de leitura das partições, e o banco não precisa ordenar o trimestre
+# inteiro antes de mandar a primeira linha.
+import csv
+import io
+import zlib
+
+from django.db import models, transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Linhas por ida ao cursor do servidor
+CHUNK_SIZE_PADRAO = 5000
+# Bytes acumulados antes de entregar um bloco ao cliente (CSV)
+BLOCO_BYTES = 256 * 1024
+# Linhas por row group do Parquet (o row group inteiro fica em memória, já em formato Arrow)
+LINHAS_POR_GRUPO = 64 * 1024
+# gzip rápido: em CSV o nível 1 já reduz bem, e níveis maiores fariam a compressão, e não o
+# banco ou a rede, limitar a vazão
+NIVEL_GZIP = 1
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def pyarrow_disponivel():
+    return pa is not None
+
+
+def linhas(queryset, colunas, chunk_size=CHUNK_SIZE_PADRAO):
+    # Dentro de uma transação o Django declara o cursor do PostgreSQL sem WITH HOLD; em autocommit,
+    # com WITH HOLD, o servidor materializaria o resultado inteiro antes do primeiro fetch
+    with transaction.atomic(using=queryset.db):
+        yield from queryset.order_by().values_list(*colunas).iterator(chunk_size=chunk_size)
+
+
+def linhas_texto(queryset, colunas, chunk_size=CHUNK_SIZE_PADRAO):
+    # Colunas convertidas para texto pelo banco: sem criar datetime/Decimal no Python só para
+    # formatá-los de volta (metade do tempo da exportação em CSV). Datas saem em UTC.
+    opts = queryset.model._meta
+    textos = {}
+    for coluna in colunas:
+        field = opts.get_field(coluna)
+        if not isinstance(field, (models.CharField, models.TextField)):
+            textos[f'texto_{coluna}'] = Cast(coluna, TextField())
+    nomes = [f'texto_{coluna}' if f'texto_{coluna}' in textos else coluna for coluna in colunas]
+    return linhas(queryset.annotate(**textos), nomes, chunk_size)
+
+
+def gerar_csv(queryset, colunas, chunk_size=CHUNK_SIZE_PADRAO):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(colunas)
+    for linha in linhas_texto(queryset, colunas, chunk_size):
+        writer.writerow(linha)
+        if buffer.tell() >= BLOCO_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gerar_csv_gzip(queryset, colunas, chunk_size=CHUNK_SIZE_PADRAO):
+    # wbits=31: formato gzip (cabeçalho e CRC), para o arquivo abrir com gunzip/pandas
+    compressor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+    for bloco in gerar_csv(queryset, colunas, chunk_size):
+        comprimido = compressor.compress(bloco)
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
+
+
+def _tipo_arrow(field):
+    if isinstance(field, models.ForeignKey):
+        return _tipo_arrow(field.target_field)
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp('us', tz='UTC')
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if isinstance(field, models.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, (models.IntegerField, models.AutoField)):
+        return pa.int64()
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    return pa.string()
+
+
+def _conversor_arrow(field):
+    # Valores que o pyarrow não converte sozinho para o tipo de _tipo_arrow
+    if isinstance(field, models.UUIDField):
+        return lambda valores: [None if valor is None else str(valor) for valor in valores]
+    return None
+
+
+class _Saida:
+    # Arquivo só de escrita para o ParquetWriter: guarda os bytes até serem retirados e mantém a
+    # posição total (tell), que o writer usa nos offsets do rodapé
+    closed = False
+
+    def __init__(self):
+        self.partes = []
+        self.posicao = 0
+
+    def write(self, dados):
+        dados = bytes(dados)
+        self.partes.append(dados)
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def retirar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def gerar_parquet(queryset, colunas, chunk_size=CHUNK_SIZE_PADRAO):
+    opts = queryset.model._meta
+    fields = [opts.get_field(coluna) for coluna in colunas]
+    schema = pa.schema([pa.field(field.name, _tipo_arrow(field)) for field in fields])
+    conversores = [_conversor_arrow(field) for field in fields]
+    saida = _Saida()
+    writer = pq.ParquetWriter(pa.PythonFile(saida, mode='w'), schema, compression='snappy')
+
+    def lote(pendentes):
+        colunas_lote = list(zip(*pendentes))
+        arrays = [
+            pa.array(conversor(valores) if conversor else valores, type=tipo.type)
+            for valores, conversor, tipo in zip(colunas_lote, conversores, schema)
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    lotes, linhas_no_grupo, pendentes = [], 0, []
+    for linha in linhas(queryset, colunas, chunk_size):
+        pendentes.append(linha)
+        if len(pendentes) < chunk_size:
+            continue
+        # As tuplas do Python viram colunas Arrow a cada chunk; só o row group corrente fica em memória
+        lotes.append(lote(pendentes))
+        linhas_no_grupo += len(pendentes)
+        pendentes = []
+        if linhas_no_grupo >= LINHAS_POR_GRUPO:
+            writer.write_table(pa.Table.from_batches(lotes, schema=schema), row_group_size=linhas_no_grupo)
+            lotes, linhas_no_grupo = [], 0
+            yield saida.retirar()
+    if pendentes:
+        lotes.append(lote(pendentes))
+        linhas_no_grupo += len(pendentes)
+    if lotes:
+        writer.write_table(pa.Table.from_batches(lotes, schema=schema), row_group_size=linhas_no_grupo)
+    writer.close()
+    yield saida.retirar()
+
+
+GERADORES = {'csv': gerar_csv, 'csv.gz': gerar_csv_gzip, 'parquet': gerar_parquet}
+
+
+def gerar(formato, queryset, colunas, chunk_size=CHUNK_SIZE_PADRAO):
+    # Iterador de blocos de bytes do arquivo no formato pedido (uma das chaves de FORMATOS)
+    return GERADORES[formato](queryset, colunas, chunk_size)
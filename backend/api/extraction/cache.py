@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Cache em disco das exportações da IICS.
+# Cada entrada é identificada pelo hash de (configuração, tipo de exportação ou meterId, início e
+# fim da janela) e guarda em <hash>.json o job que gerou a exportação e o estado do download:
+#   job      -> o job foi criado; uma nova execução acompanha o mesmo job em vez de criar outro
+#   parcial  -> <hash>.zip.part com parte do arquivo; o download continua com HTTP Range
+#   completo -> <hash>.zip validado (com sha256); a janela é carregada direto do disco
+# A entrada só serve a janelas cuja carga não terminou: depois que o arquivo é carregado com
+# sucesso ela é removida (descartar), e a próxima execução exporta a janela de novo.
+# Entradas mais velhas que o TTL são removidas e, acima do tamanho máximo, saem as usadas há
+# mais tempo (o uso é marcado no mtime do .json).
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+
+from django.conf import settings
+
+ESTADOS_PENDENTES = ('job', 'parcial')
+
+
+def sha256_arquivo(caminho):
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def _ler_metadados(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _remover(*caminhos):
+    for caminho in caminhos:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+class EntradaCache:
+    def __init__(self, cache, chave, descricao):
+        self.cache = cache
+        self.chave = chave
+        self.descricao = descricao
+        base = os.path.join(cache.diretorio, chave[:2], chave)
+        self.caminho = base + '.zip'
+        self.caminho_parcial = base + '.zip.part'
+        self.caminho_metadados = base + '.json'
+
+    def metadados(self):
+        return _ler_metadados(self.caminho_metadados)
+
+    def _gravar_metadados(self, **valores):
+        os.makedirs(os.path.dirname(self.caminho_metadados), exist_ok=True)
+        temporario = f"{self.caminho_metadados}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump({**self.descricao, **valores}, arquivo)
+        os.replace(temporario, self.caminho_metadados)
+
+    def _vigente(self, metadados):
+        return metadados is not None and time.time() - metadados.get('criado_em', 0) < self.cache.ttl
+
+    def artefato(self):
+        # Caminho do ZIP completo dentro do TTL, ou None
+        metadados = self.metadados()
+        if not self._vigente(metadados) or metadados.get('estado') != 'completo' or not os.path.exists(self.caminho):
+            return None
+        os.utime(self.caminho_metadados)
+        return self.caminho
+
+    def job_pendente(self):
+        # JobId de uma exportação criada dentro do TTL e ainda não baixada por completo
+        metadados = self.metadados()
+        if not self._vigente(metadados) or metadados.get('estado') not in ESTADOS_PENDENTES:
+            return None
+        return metadados.get('job_id')
+
+    def registrar_job(self, job_id):
+        metadados = self.metadados()
+        if metadados and metadados.get('job_id') == job_id:
+            return
+        # Job novo: o que havia da exportação anterior não vale mais
+        _remover(self.caminho, self.caminho_parcial)
+        self._gravar_metadados(job_id=job_id, estado='job', criado_em=time.time())
+
+    def preparar_download(self, job_id):
+        # Caminho onde o download deve continuar; o parcial de outro job é descartado
+        metadados = self.metadados()
+        if not metadados or metadados.get('job_id') != job_id:
+            _remover(self.caminho, self.caminho_parcial)
+            metadados = {'criado_em': time.time()}
+        self._gravar_metadados(job_id=job_id, estado='parcial', criado_em=metadados['criado_em'])
+        return self.caminho_parcial
+
+    def concluir(self, job_id):
+        if not zipfile.is_zipfile(self.caminho_parcial):
+            _remover(self.caminho_parcial)
+            raise zipfile.BadZipFile(f"O download do job {job_id} não é um ZIP válido; o parcial foi descartado.")
+        tamanho = os.path.getsize(self.caminho_parcial)
+        resumo = sha256_arquivo(self.caminho_parcial)
+        os.replace(self.caminho_parcial, self.caminho)
+        metadados = self.metadados() or {}
+        self._gravar_metadados(job_id=job_id, estado='completo', criado_em=metadados.get('criado_em', time.time()), bytes=tamanho, sha256=resumo)
+        self.cache.podar()
+        return self.caminho
+
+    def descartar(self):
+        _remover(self.caminho, self.caminho_parcial, self.caminho_metadados)
+
+
+class CacheExportacoes:
+    def __init__(self, diretorio, ttl, max_bytes):
+        self.diretorio = str(diretorio)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @classmethod
+    def das_configuracoes(cls):
+        return cls(settings.EXPORT_CACHE_DIR, settings.EXPORT_CACHE_TTL_SECONDS, settings.EXPORT_CACHE_MAX_BYTES)
+
+    def entrada(self, config, exportacao, inicio, fim):
+        descricao = {'configuracao': config.pk, 'exportacao': exportacao, 'inicio': f"{inicio:%Y-%m-%d}", 'fim': f"{fim:%Y-%m-%d}"}
+        chave = hashlib.sha256(json.dumps(descricao, sort_keys=True).encode('utf-8')).hexdigest()
+        return EntradaCache(self, chave, descricao)
+
+    def _entradas(self):
+        # {base do caminho: [arquivos]} agrupando .json, .zip e .zip.part de cada chave
+        grupos = {}
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                base = nome.split('.', 1)[0]
+                grupos.setdefault(os.path.join(raiz, base), []).append(os.path.join(raiz, nome))
+        return grupos
+
+    def podar(self):
+        # Remove as entradas vencidas e, se o total passar de max_bytes, as usadas há mais tempo.
+        # Retorna (entradas removidas, bytes liberados).
+        with self._lock:
+            agora = time.time()
+            vivas, removidas, liberados = [], 0, 0
+            for base, arquivos in self._entradas().items():
+                try:
+                    estatisticas = {caminho: os.stat(caminho) for caminho in arquivos}
+                except FileNotFoundError:
+                    continue
+                tamanho = sum(st.st_size for st in estatisticas.values())
+                metadados = _ler_metadados(base + '.json') if base + '.json' in estatisticas else None
+                uso = estatisticas[base + '.json'].st_mtime if metadados else max(st.st_mtime for st in estatisticas.values())
+                criado_em = metadados.get('criado_em', 0) if metadados else uso
+                if agora - criado_em >= self.ttl:
+                    _remover(*arquivos)
+                    removidas += 1
+                    liberados += tamanho
+                else:
+                    pendente = bool(metadados) and metadados.get('estado') in ESTADOS_PENDENTES
+                    vivas.append((uso, tamanho, arquivos, pendente))
+            total = sum(tamanho for _, tamanho, _, _ in vivas)
+            for uso, tamanho, arquivos, pendente in sorted(vivas, key=lambda entrada: entrada[0]):
+                if total <= self.max_bytes:
+                    break
+                if pendente:
+                    # Download possivelmente em andamento; sai só pelo TTL
+                    continue
+                _remover(*arquivos)
+                total -= tamanho
+                removidas += 1
+                liberados += tamanho
+            return removidas, liberados
+
+    def tamanho_total(self):
+        return sum(os.path.getsize(caminho) for arquivos in self._entradas().values() for caminho in arquivos if os.path.exists(caminho))
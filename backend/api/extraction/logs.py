@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Gravação em lote dos ExtracaoLog (e dos spans de api.extraction.tracing).
+# As etapas da extração só enfileiram o registro em memória; uma thread em segundo plano grava
+# a fila com bulk_create quando ela atinge TAMANHO_LOTE ou a cada INTERVALO_SEGUNDOS. Assim o
+# log não custa um round trip (nem um commit) no caminho da extração e não entra nas transações
+# de carga. A fila é descarregada no encerramento do comando e no atexit do processo.
+import atexit
+import contextvars
+import sys
+import threading
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db import IntegrityError, connection
+
+TAMANHO_LOTE = 200
+INTERVALO_SEGUNDOS = 2.0
+MAX_PENDENTES = 10000
+
+_suspenso = contextvars.ContextVar('registro_logs_suspenso', default=False)
+
+
+class RegistradorLogs:
+    def __init__(self, modelo='api.ExtracaoLog', tamanho_lote=TAMANHO_LOTE, intervalo=INTERVALO_SEGUNDOS, max_pendentes=MAX_PENDENTES):
+        self.modelo = modelo
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.max_pendentes = max_pendentes
+        self._pendentes = []
+        self._cond = threading.Condition()
+        # Serializa as gravações: descarregar() pode ser chamado de fora da thread de fundo
+        self._gravando = threading.Lock()
+        self._thread = None
+        self._encerrado = False
+        self.gravados = 0
+        self.perdidos = 0
+        self.rejeitados = 0
+
+    def registrar(self, **campos):
+        if _suspenso.get():
+            return None
+        # Os defaults do modelo (ex.: timestamp) são preenchidos aqui, no horário do evento
+        registro = apps.get_model(self.modelo)(**campos)
+        with self._cond:
+            self._pendentes.append(registro)
+            if self._thread is None or not self._thread.is_alive():
+                self._encerrado = False
+                self._thread = threading.Thread(target=self._executar, name=f"registrador_{self.modelo}", daemon=True)
+                self._thread.start()
+            if len(self._pendentes) >= self.tamanho_lote:
+                self._cond.notify()
+        return registro
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                if not self._encerrado and len(self._pendentes) < self.tamanho_lote:
+                    self._cond.wait(self.intervalo)
+                encerrar = self._encerrado
+            self.descarregar()
+            if encerrar:
+                return
+
+    def descarregar(self):
+        with self._gravando:
+            with self._cond:
+                lote, self._pendentes = self._pendentes, []
+            if not lote:
+                return 0
+            try:
+                apps.get_model(self.modelo).objects.bulk_create(lote, batch_size=self.tamanho_lote)
+                self.gravados += len(lote)
+                return len(lote)
+            except IntegrityError:
+                # Um registro inválido (ex.: FK para uma configuração já apagada) derrubaria o lote
+                # inteiro em toda nova tentativa: grava um a um e descarta só os que falham
+                return self._gravar_um_a_um(lote)
+            except Exception as e:
+                self._devolver(lote, e)
+                return 0
+            finally:
+                connection.close()
+
+    def _devolver(self, registros, erro):
+        # Volta para a fila e tenta na próxima rodada; acima do limite os mais antigos se perdem
+        with self._cond:
+            self._pendentes[:0] = registros
+            excedentes = len(self._pendentes) - self.max_pendentes
+            if excedentes > 0:
+                del self._pendentes[:excedentes]
+                self.perdidos += excedentes
+        sys.stderr.write(f"Falha ao gravar {len(registros)} registros de {self.modelo}: {erro}\n")
+
+    def _gravar_um_a_um(self, lote):
+        gravados = 0
+        rejeitados = []
+        for indice, registro in enumerate(lote):
+            try:
+                registro.save(force_insert=True)
+                gravados += 1
+            except IntegrityError as e:
+                rejeitados.append(e)
+            except Exception as e:
+                self._devolver(lote[indice:], e)
+                break
+        self.gravados += gravados
+        self.rejeitados += len(rejeitados)
+        if rejeitados:
+            sys.stderr.write(f"Descartados {len(rejeitados)} registros de {self.modelo} que o banco recusou: {rejeitados[0]}\n")
+        return gravados
+
+    def encerrar(self, timeout=30):
+        # Para a thread de fundo após a última gravação; registrar() depois disso a recria
+        with self._cond:
+            thread = self._thread
+            self._encerrado = True
+            self._cond.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.descarregar()
+
+
+_registradores = {}
+_registradores_lock = threading.Lock()
+
+
+def registrador_para(modelo):
+    # Um registrador por modelo no processo, descarregado no atexit
+    with _registradores_lock:
+        registrador = _registradores.get(modelo)
+        if registrador is None:
+            registrador = _registradores[modelo] = RegistradorLogs(modelo)
+            atexit.register(registrador.encerrar)
+        return registrador
+
+
+def encerrar_registradores():
+    with _registradores_lock:
+        registradores = list(_registradores.values())
+    for registrador in registradores:
+        registrador.encerrar()
+
+
+def descarregar_registradores():
+    with _registradores_lock:
+        registradores = list(_registradores.values())
+    for registrador in registradores:
+        registrador.descarregar()
+
+
+@contextmanager
+def suspenso():
+    # Descarta o que for registrado dentro do bloco (e nas threads que herdam o contexto). Para os
+    # benchmarks, que desfazem a transação no final: os registros apontariam para a configuração
+    # criada dentro dela, e a gravação em segundo plano entraria nos tempos medidos.
+    token = _suspenso.set(True)
+    try:
+        yield
+    finally:
+        _suspenso.reset(token)
+
+
+def registrador_logs():
+    return registrador_para('api.ExtracaoLog')
+
+
+def registrar_log(**campos):
+    return registrador_logs().registrar(**campos)
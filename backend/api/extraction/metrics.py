@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# Métricas Prometheus do pipeline de extração.
+# Ficam em um registro próprio (REGISTRO): o fetch_ipu_data grava esse registro em um arquivo
+# texto no formato do textfile collector ao final de cada execução e o endpoint /metrics do
+# Django serve o arquivo junto com as métricas do próprio processo web. Sem prometheus_client
+# instalado todas as chamadas daqui viram no-op.
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, PlatformCollector, ProcessCollector, generate_latest
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:
+    CollectorRegistry = None
+
+ROTULOS = ['configuracao', 'tipo_exportacao', 'meter']
+BUCKETS_SEGUNDOS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def prometheus_disponivel():
+    return CollectorRegistry is not None
+
+
+class _MetricaNula:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, valor=1):
+        pass
+
+    def observe(self, valor):
+        pass
+
+    def set(self, valor):
+        pass
+
+    def set_to_current_time(self):
+        pass
+
+
+class ColetorPoolConexoes:
+    # Expõe as estatísticas dos pools de core.db.pool no momento da coleta
+    def __init__(self, prefixo):
+        self.prefixo = prefixo
+
+    def collect(self):
+        from core.db.pool import pools_ativos
+        p = self.prefixo
+        familias = {
+            'tamanho_maximo': GaugeMetricFamily(f'{p}_tamanho_maximo', 'Tamanho máximo do pool de conexões.', labels=['banco']),
+            'abertas': GaugeMetricFamily(f'{p}_conexoes_abertas', 'Conexões abertas pelo pool.', labels=['banco']),
+            'em_uso': GaugeMetricFamily(f'{p}_conexoes_em_uso', 'Conexões retiradas do pool.', labels=['banco']),
+            'retiradas': CounterMetricFamily(f'{p}_retiradas', 'Conexões entregues pelo pool.', labels=['banco']),
+            'esperas': CounterMetricFamily(f'{p}_esperas', 'Retiradas que esperaram por uma conexão livre.', labels=['banco']),
+            'espera_total_segundos': CounterMetricFamily(f'{p}_espera_segundos', 'Tempo total de espera por conexão.', labels=['banco']),
+            'timeouts': CounterMetricFamily(f'{p}_timeouts', 'Retiradas que desistiram por timeout.', labels=['banco']),
+            'falhas_verificacao': CounterMetricFamily(f'{p}_falhas_verificacao', 'Conexões descartadas na verificação de saúde.', labels=['banco']),
+        }
+        for alias, pool in pools_ativos().items():
+            stats = pool.estatisticas()
+            for campo, familia in familias.items():
+                familia.add_metric([alias], stats[campo])
+        return list(familias.values())
+
+
+if prometheus_disponivel():
+    REGISTRO = CollectorRegistry()
+    ETAPA_SEGUNDOS = Histogram(
+        'iics_etapa_duracao_segundos', 'Duração de cada etapa da extração.',
+        ROTULOS + ['etapa'], buckets=BUCKETS_SEGUNDOS, registry=REGISTRO,
+    )
+    ETAPAS = Counter('iics_etapa_execucoes', 'Execuções de cada etapa da extração, por status.', ROTULOS + ['etapa', 'status'], registry=REGISTRO)
+    DOWNLOAD_BYTES = Counter('iics_download_bytes', 'Bytes baixados dos arquivos de exportação.', ROTULOS, registry=REGISTRO)
+    LINHAS = Counter('iics_linhas', 'Linhas processadas pelos loaders (lidas, gravadas, inseridas, atualizadas, ignoradas, inalteradas, removidas).', ROTULOS + ['resultado'], registry=REGISTRO)
+    ESCRITA_SEGUNDOS = Counter('iics_escrita_banco_segundos', 'Tempo gasto nos comandos de gravação dos loaders.', ROTULOS, registry=REGISTRO)
+    CACHE_EXPORTACOES = Counter('iics_cache_exportacoes', 'Exportações reaproveitadas do cache (artefato: ZIP completo; job: job já criado).', ROTULOS + ['resultado'], registry=REGISTRO)
+    CONFIGURACAO_SEGUNDOS = Gauge('iics_configuracao_duracao_segundos', 'Duração da última extração de cada configuração.', ['configuracao'], registry=REGISTRO)
+    ULTIMA_EXECUCAO = Gauge('iics_ultima_execucao_timestamp_segundos', 'Horário (epoch) do fim da última execução do fetch_ipu_data.', registry=REGISTRO)
+    REGISTRO.register(ColetorPoolConexoes('iics_db_pool'))
+else:
+    REGISTRO = None
+    ETAPA_SEGUNDOS = ETAPAS = DOWNLOAD_BYTES = LINHAS = ESCRITA_SEGUNDOS = CACHE_EXPORTACOES = CONFIGURACAO_SEGUNDOS = ULTIMA_EXECUCAO = _MetricaNula()
+
+
+def rotulos(config, tipo_exportacao=None, meter_id=None):
+    return {
+        'configuracao': config.apelido_configuracao if config is not None else '',
+        'tipo_exportacao': tipo_exportacao or '',
+        'meter': meter_id or '',
+    }
+
+
+@contextmanager
+def medir_etapa(etapa, config=None, tipo_exportacao=None, meter_id=None):
+    # Exceções contam como FAILED e seguem adiante; o bloco pode trocar o status por medicao['status']
+    valores = rotulos(config, tipo_exportacao, meter_id)
+    medicao = {'status': 'SUCCESS'}
+    inicio = time.perf_counter()
+    try:
+        yield medicao
+    except BaseException:
+        medicao['status'] = 'FAILED'
+        raise
+    finally:
+        ETAPA_SEGUNDOS.labels(etapa=etapa, **valores).observe(time.perf_counter() - inicio)
+        ETAPAS.labels(etapa=etapa, status=medicao['status'], **valores).inc()
+
+
+def observar_etapa(etapa, segundos, status, config=None, tipo_exportacao=None, meter_id=None):
+    # Para etapas medidas fora de um bloco with (ex.: espera do job no poller)
+    valores = rotulos(config, tipo_exportacao, meter_id)
+    ETAPA_SEGUNDOS.labels(etapa=etapa, **valores).observe(segundos)
+    ETAPAS.labels(etapa=etapa, status=status, **valores).inc()
+
+
+def registrar_download(config, tipo_exportacao, meter_id, total_bytes):
+    DOWNLOAD_BYTES.labels(**rotulos(config, tipo_exportacao, meter_id)).inc(total_bytes)
+
+
+def registrar_carga(config, tipo_exportacao, meter_id, totais, segundos_escrita, diferencas=None):
+    # diferencas: contagens da carga incremental (linhas inalteradas não são gravadas)
+    valores = rotulos(config, tipo_exportacao, meter_id)
+    gravados, ignorados = totais.gravados or 0, totais.ignorados or 0
+    contagens = {'lidas': gravados + ignorados, 'gravadas': gravados, 'ignoradas': ignorados}
+    if totais.inseridos is not None:
+        contagens.update(inseridas=totais.inseridos, atualizadas=totais.atualizados)
+    if diferencas:
+        contagens['lidas'] += diferencas['inalteradas']
+        contagens.update(inalteradas=diferencas['inalteradas'], removidas=diferencas['removidas'])
+    for resultado, quantidade in contagens.items():
+        LINHAS.labels(resultado=resultado, **valores).inc(quantidade)
+    ESCRITA_SEGUNDOS.labels(**valores).inc(segundos_escrita)
+
+
+def registrar_cache(config, tipo_exportacao, meter_id, resultado):
+    CACHE_EXPORTACOES.labels(resultado=resultado, **rotulos(config, tipo_exportacao, meter_id)).inc()
+
+
+def registrar_configuracao(config, segundos):
+    CONFIGURACAO_SEGUNDOS.labels(configuracao=config.apelido_configuracao).set(segundos)
+
+
+def exposicao():
+    return generate_latest(REGISTRO) if REGISTRO is not None else b''
+
+
+_registro_web = None
+
+
+def exposicao_web(caminho_textfile=None):
+    # Métricas do processo web (processo Python e pool de conexões) seguidas das métricas da
+    # última execução do fetch_ipu_data, lidas do textfile
+    global _registro_web
+    if not prometheus_disponivel():
+        return b''
+    if _registro_web is None:
+        registro = CollectorRegistry()
+        ProcessCollector(registry=registro)
+        PlatformCollector(registry=registro)
+        registro.register(ColetorPoolConexoes('iics_web_db_pool'))
+        _registro_web = registro
+    corpo = generate_latest(_registro_web)
+    if caminho_textfile and os.path.exists(caminho_textfile):
+        with open(caminho_textfile, 'rb') as arquivo:
+            corpo += arquivo.read()
+    return corpo
+
+
+def escrever_textfile(caminho):
+    # Escrita atômica (arquivo temporário + rename), como o textfile collector espera
+    if REGISTRO is None:
+        return False
+    ULTIMA_EXECUCAO.set_to_current_time()
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    os.makedirs(diretorio, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=diretorio, prefix='.metrics_', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as arquivo:
+            arquivo.write(exposicao())
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, caminho)
+    except BaseException:
+        os.remove(temporario)
+        raise
+    return True
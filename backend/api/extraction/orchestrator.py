@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# Orquestração assíncrona dos jobs de exportação de uma janela de extração.
+# SUMMARY, PROJECT_FOLDER e ASSET são criados de uma vez e, assim que o ASSET é carregado, um
+# job por meter CDI/CAI. O status de todos é acompanhado pelo poller compartilhado
+# (api.extraction.poller) e cada job segue para download + carga no momento em que termina.
+# HTTP e banco rodam em threads (asyncio.to_thread); o event loop só coordena.
+import asyncio
+import threading
+from collections import deque
+
+from django.db import connection
+
+from api.ingestion.schemas import EXPORT_SPECS
+
+from . import tracing
+
+MAX_JOBS_POR_POD_PADRAO = 4
+
+
+class SemaforoPod:
+    # Limite de jobs em andamento em um pod, compartilhado pelas threads de configuração (cada
+    # uma com o seu event loop). Quem espera por uma vaga não prende nenhuma thread.
+    def __init__(self, limite):
+        self.limite = max(1, int(limite))
+        self.em_uso = 0
+        self._lock = threading.Lock()
+        self._fila = deque()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.em_uso < self.limite and not self._fila:
+                self.em_uso += 1
+                return
+            futuro = loop.create_future()
+            self._fila.append((loop, futuro))
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            with self._lock:
+                na_fila = (loop, futuro) in self._fila
+                if na_fila:
+                    self._fila.remove((loop, futuro))
+            if not na_fila and futuro.done() and not futuro.cancelled():
+                # A vaga chegou junto com o cancelamento: repassa adiante
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._fila:
+                self.em_uso -= 1
+                return
+            # A vaga passa direto para o próximo da fila, sem voltar ao contador
+            loop, futuro = self._fila.popleft()
+        loop.call_soon_threadsafe(self._entregar, futuro)
+
+    def _entregar(self, futuro):
+        if futuro.cancelled():
+            self.release()
+        else:
+            futuro.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+_semaforos = {}
+_semaforos_lock = threading.Lock()
+
+
+def chave_pod(pod_url):
+    return (pod_url or '').rstrip('/').lower()
+
+
+def semaforo_do_pod(pod_url, limite=MAX_JOBS_POR_POD_PADRAO):
+    chave = chave_pod(pod_url)
+    with _semaforos_lock:
+        semaforo = _semaforos.get(chave)
+        if semaforo is None:
+            semaforo = _semaforos[chave] = SemaforoPod(limite)
+        return semaforo
+
+
+class OrquestradorJanela:
+    def __init__(self, command, api_client, config, file_paths, semaforo, log_prefix=""):
+        self.command = command
+        self.api_client = api_client
+        self.config = config
+        self.file_paths = file_paths
+        self.semaforo = semaforo
+        self.log_prefix = log_prefix
+        self._locks_tabela = {}
+
+    def executar(self, start_date_str, end_date_str, start_date_obj, end_date_obj):
+        asyncio.run(self._executar(start_date_str, end_date_str, start_date_obj, end_date_obj))
+
+    async def _executar(self, start_date_str, end_date_str, start_date_obj, end_date_obj):
+        self._janela = (start_date_str, end_date_str, start_date_obj, end_date_obj)
+        resultados = await asyncio.gather(
+            self._exportar(EXPORT_SPECS['SUMMARY'], job_type="SUMMARY"),
+            self._exportar(EXPORT_SPECS['PROJECT_FOLDER'], job_type="PROJECT_FOLDER"),
+            self._fluxo_asset(),
+            return_exceptions=True,
+        )
+        # Os demais jobs terminam antes; a primeira exceção marca a janela como falha
+        for resultado in resultados:
+            if isinstance(resultado, BaseException):
+                raise resultado
+
+    async def _fluxo_asset(self):
+        meters = await self._exportar(EXPORT_SPECS['ASSET'], job_type="ASSET")
+        start_date_obj, end_date_obj = self._janela[2], self._janela[3]
+        # Agrupa os CSVs dos meters pela janela de extração do ASSET correspondente
+        asset_prefix = f"{start_date_obj:%Y%m%d}_{end_date_obj:%Y%m%d}_"
+        meters_exportar = await self._em_thread(self.command.meters_para_exportar, meters, self.config, self.log_prefix)
+        resultados = await asyncio.gather(
+            *(self._exportar(spec, meter_id=meter_id, file_prefix=asset_prefix) for meter_id, spec in meters_exportar),
+            return_exceptions=True,
+        )
+        for resultado in resultados:
+            if isinstance(resultado, BaseException):
+                raise resultado
+
+    async def _exportar(self, spec, job_type=None, meter_id=None, file_prefix=""):
+        start_date_str, end_date_str, start_date_obj, end_date_obj = self._janela
+        export_name = job_type or f"meterId_{meter_id}"
+        log_prefix = self.log_prefix
+        # Cada _exportar roda na sua própria task, então o span não vaza para as irmãs
+        with tracing.span("exportacao", self.config, spec.nome, meter_id) as exportacao:
+            entrada_cache = self.command.entrada_cache(self.config, job_type, meter_id, start_date_obj, end_date_obj)
+            if entrada_cache is not None and entrada_cache.artefato():
+                # Exportação da janela já baixada: não ocupa vaga no semáforo do pod
+                async with self._lock_tabela(spec.model):
+                    _, resultado = await self._em_thread(self.command.carregar_do_cache, entrada_cache, self.config, start_date_obj, end_date_obj, spec, job_type=job_type, meter_id=meter_id, log_prefix=log_prefix)
+                return resultado
+            async with self.semaforo:
+                self.command.stdout.write(f"\n{log_prefix} --- Iniciando fluxo de exportação para: {export_name} ---")
+                job_id = await self._em_thread(self.command.criar_job_exportacao, self.api_client, start_date_str, end_date_str, self.config, job_type=job_type, meter_id=meter_id, log_prefix=log_prefix, entrada_cache=entrada_cache)
+                if not job_id:
+                    exportacao.status = "FAILED"
+                    return None
+                final_status = await self._aguardar_job(job_id, export_name, spec, meter_id)
+            await self._em_thread(self.command.registrar_status_job, self.config, export_name, job_id, final_status)
+            if final_status != "SUCCESS":
+                exportacao.status = "FAILED"
+                return None
+            # Meters diferentes podem cair na mesma tabela (ex.: os dois meters CAI): as cargas
+            # de uma mesma tabela seguem em fila para não disputarem as mesmas chaves
+            async with self._lock_tabela(spec.model):
+                return await self._em_thread(self.command.baixar_e_carregar, self.api_client, job_id, self.config, self.file_paths, start_date_obj, end_date_obj, spec, job_type=job_type, meter_id=meter_id, file_prefix=file_prefix, log_prefix=log_prefix, entrada_cache=entrada_cache)
+
+    async def _aguardar_job(self, job_id, export_name, spec, meter_id=None):
+        # O acompanhamento em si fica com o poller compartilhado; aqui só se espera o resultado
+        with tracing.span("aguardar_job", self.config, spec.nome, meter_id, job_id=job_id) as espera:
+            futuro = await self._em_thread(self.api_client.acompanhar_job, job_id, export_name, self.config.pk)
+            final_status = await asyncio.wrap_future(futuro)
+            espera.status = final_status
+        self.api_client.reportar_status_final(final_status, export_name)
+        return final_status
+
+    def _lock_tabela(self, model):
+        if model not in self._locks_tabela:
+            self._locks_tabela[model] = asyncio.Lock()
+        return self._locks_tabela[model]
+
+    async def _em_thread(self, func, *args, **kwargs):
+        def chamar():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                # Cada thread do executor abre a sua própria conexão do Django
+                connection.close()
+        return await asyncio.to_thread(chamar)
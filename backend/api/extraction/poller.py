@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Poller compartilhado de status dos jobs de exportação da IICS.
+# Uma única thread acompanha todos os jobs em andamento no processo. A primeira consulta de
+# cada job só acontece perto da duração esperada para aquele tipo de exportação (aprendida
+# das execuções anteriores em DuracaoExportacao); depois disso os intervalos crescem
+# exponencialmente, com jitter. Erros transitórios de rede não encerram o acompanhamento.
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from django.db import connection
+
+PRIMEIRA_CONSULTA_SEGUNDOS = 3.0
+INTERVALO_INICIAL_SEGUNDOS = 2.0
+INTERVALO_MAXIMO_SEGUNDOS = 30.0
+FATOR_BACKOFF = 1.6
+JITTER = 0.2
+TIMEOUT_PADRAO_SEGUNDOS = 600
+MAX_ERROS_CONSECUTIVOS = 5
+PESO_EWMA = 0.3
+CONSULTAS_SIMULTANEAS = 8
+
+STATUS_FINAIS = ("SUCCESS", "FAILED", "CANCELLED")
+
+
+def _com_jitter(segundos):
+    return segundos * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+class EstatisticasDuracao:
+    # Cache em memória das durações por (configuração, tipo de exportação), persistido no banco
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _carregar(self, chave):
+        from api.models import DuracaoExportacao
+        configuracao_id, tipo = chave
+        registro = DuracaoExportacao.objects.filter(configuracao_id=configuracao_id, tipo_exportacao=tipo).first()
+        if registro is None:
+            return None
+        return registro.duracao_media_segundos, registro.desvio_medio_segundos, registro.amostras
+
+    def esperado(self, chave):
+        # Retorna (duração média, desvio médio) ou None se ainda não há histórico
+        if chave[0] is None:
+            return None
+        with self._lock:
+            if chave in self._cache:
+                valor = self._cache[chave]
+                return valor[:2] if valor else None
+        valor = self._carregar(chave)
+        with self._lock:
+            self._cache.setdefault(chave, valor)
+        return valor[:2] if valor else None
+
+    def registrar(self, chave, duracao):
+        from api.models import DuracaoExportacao
+        if chave[0] is None:
+            return
+        # Garante o histórico no cache; a atualização em si é feita sob o lock, para que dois
+        # jobs da mesma chave terminando juntos não percam uma amostra
+        self.esperado(chave)
+        with self._lock:
+            atual = self._cache.get(chave)
+            if atual is None:
+                media, desvio, amostras = duracao, duracao / 4, 1
+            else:
+                media_anterior, desvio_anterior, amostras_anteriores = atual
+                media = (1 - PESO_EWMA) * media_anterior + PESO_EWMA * duracao
+                desvio = (1 - PESO_EWMA) * desvio_anterior + PESO_EWMA * abs(duracao - media_anterior)
+                amostras = amostras_anteriores + 1
+            self._cache[chave] = (media, desvio, amostras)
+        configuracao_id, tipo = chave
+        DuracaoExportacao.objects.update_or_create(
+            configuracao_id=configuracao_id, tipo_exportacao=tipo,
+            defaults={'duracao_media_segundos': media, 'desvio_medio_segundos': desvio, 'amostras': amostras},
+        )
+
+
+class _Job:
+    def __init__(self, api_client, job_id, chave, timeout, ao_consultar):
+        self.api_client = api_client
+        self.job_id = job_id
+        self.chave = chave
+        self.ao_consultar = ao_consultar
+        self.inicio = time.monotonic()
+        self.prazo = self.inicio + timeout
+        self.ultima_consulta_pendente = None
+        self.intervalo = INTERVALO_INICIAL_SEGUNDOS
+        self.erros = 0
+        self.consultas = 0
+        self.future = Future()
+
+
+class PollerJobs:
+    def __init__(self, estatisticas=None, consultas_simultaneas=CONSULTAS_SIMULTANEAS):
+        self.estatisticas = estatisticas or EstatisticasDuracao()
+        self._fila = []
+        self._sequencia = itertools.count()
+        self._condicao = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=consultas_simultaneas, thread_name_prefix="poller_status")
+        self._thread = None
+        self.consultas_realizadas = 0
+
+    def acompanhar(self, api_client, job_id, tipo_exportacao=None, configuracao_id=None, timeout=TIMEOUT_PADRAO_SEGUNDOS, ao_consultar=None):
+        # Retorna um concurrent.futures.Future com o status final: SUCCESS, FAILED, CANCELLED ou TIMEOUT.
+        # ao_consultar(status, erro) é chamado a cada consulta, na thread do poller.
+        chave = (configuracao_id, tipo_exportacao)
+        esperado = self.estatisticas.esperado(chave)
+        if esperado:
+            media, desvio = esperado
+            # Jobs acima do histórico não estouram o timeout padrão
+            timeout = max(timeout, 3 * media)
+        job = _Job(api_client, job_id, chave, timeout, ao_consultar)
+        self._agendar(job, self._primeira_espera(esperado))
+        return job.future
+
+    def _primeira_espera(self, esperado):
+        if not esperado:
+            return PRIMEIRA_CONSULTA_SEGUNDOS
+        media, desvio = esperado
+        return max(PRIMEIRA_CONSULTA_SEGUNDOS, media - desvio)
+
+    def _agendar(self, job, espera):
+        quando = min(time.monotonic() + espera, job.prazo)
+        with self._condicao:
+            heapq.heappush(self._fila, (quando, next(self._sequencia), job))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name="poller_jobs", daemon=True)
+                self._thread.start()
+            self._condicao.notify()
+
+    def pendentes(self):
+        with self._condicao:
+            return len(self._fila)
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while not self._fila:
+                    self._condicao.wait()
+                quando = self._fila[0][0]
+                agora = time.monotonic()
+                if quando > agora:
+                    self._condicao.wait(quando - agora)
+                    continue
+                # Todas as consultas vencidas saem juntas na mesma rodada
+                vencidos = []
+                while self._fila and self._fila[0][0] <= agora:
+                    vencidos.append(heapq.heappop(self._fila)[2])
+            for job in vencidos:
+                self._executor.submit(self._consultar, job)
+
+    def _consultar(self, job):
+        try:
+            self._consultar_job(job)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            connection.close()
+
+    def _consultar_job(self, job):
+        job.consultas += 1
+        with self._condicao:
+            self.consultas_realizadas += 1
+        try:
+            status = job.api_client.consultar_status_job(job.job_id)
+        except requests.exceptions.RequestException as e:
+            job.erros += 1
+            if job.ao_consultar:
+                job.ao_consultar(None, e)
+            if job.erros >= MAX_ERROS_CONSECUTIVOS:
+                job.future.set_result("FAILED")
+            elif time.monotonic() >= job.prazo:
+                job.future.set_result("TIMEOUT")
+            else:
+                self._agendar(job, _com_jitter(min(INTERVALO_MAXIMO_SEGUNDOS, INTERVALO_INICIAL_SEGUNDOS * FATOR_BACKOFF ** job.erros)))
+            return
+        agora = time.monotonic()
+        job.erros = 0
+        if job.ao_consultar:
+            job.ao_consultar(status, None)
+        if status in STATUS_FINAIS:
+            if status == "SUCCESS":
+                # O job terminou entre a última consulta pendente e esta: usa o ponto médio
+                anterior = job.ultima_consulta_pendente or job.inicio
+                try:
+                    self.estatisticas.registrar(job.chave, (anterior + agora) / 2 - job.inicio)
+                except Exception:
+                    pass  # O histórico é só uma otimização; não derruba o job
+            job.future.set_result(status)
+            return
+        if agora >= job.prazo:
+            job.future.set_result("TIMEOUT")
+            return
+        job.ultima_consulta_pendente = agora
+        espera = _com_jitter(job.intervalo)
+        job.intervalo = min(INTERVALO_MAXIMO_SEGUNDOS, job.intervalo * FATOR_BACKOFF)
+        self._agendar(job, espera)
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def poller_compartilhado():
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = PollerJobs()
+        return _poller
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# Agendador global das configurações processadas pelo fetch_ipu_data.
+# Um único orçamento de workers vale para a execução inteira. A fila é ordenada pela
+# configuração mais atrasada (ultima_extracao_enddate mais antigo, ou nunca extraída) e, no
+# empate, pela mais demorada na execução anterior, para que os tenants longos não fiquem
+# para o final. Cada pod tem um limite de configurações simultâneas; quando o pod da
+# próxima da fila está cheio, passa na frente a primeira configuração de outro pod.
+import contextvars
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .orchestrator import chave_pod
+
+MAX_WORKERS_PADRAO = 5
+MAX_CONFIGS_POR_POD_PADRAO = 2
+
+ExecucaoAgendada = namedtuple('ExecucaoAgendada', ['config', 'pod', 'espera_segundos', 'duracao_segundos', 'erro'])
+
+
+def chave_ordenacao(config):
+    # Nunca extraída = mais atrasada; sem histórico de duração = tratada como a mais longa
+    marcador = config.ultima_extracao_enddate
+    atraso = marcador.timestamp() if marcador else float('-inf')
+    duracao = config.ultima_duracao_segundos
+    return (atraso, -(duracao if duracao is not None else float('inf')), config.pk)
+
+
+class AgendadorConfiguracoes:
+    def __init__(self, executar, max_workers=MAX_WORKERS_PADRAO, max_por_pod=MAX_CONFIGS_POR_POD_PADRAO, ao_despachar=None):
+        self.executar = executar
+        self.max_workers = max(1, int(max_workers))
+        self.max_por_pod = max(1, int(max_por_pod))
+        self.ao_despachar = ao_despachar
+        self._cond = threading.Condition()
+        self._em_uso = 0
+        self._pendentes = 0
+        self._ativos_por_pod = defaultdict(int)
+        self.execucoes = []
+
+    def ordenar(self, configs):
+        return sorted(configs, key=chave_ordenacao)
+
+    def _proxima(self, fila):
+        for config in fila:
+            if self._ativos_por_pod[chave_pod(config.iics_pod_url)] < self.max_por_pod:
+                return config
+        return None
+
+    def executar_todas(self, configs):
+        fila = self.ordenar(configs)
+        inicio = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agendador") as executor:
+            with self._cond:
+                self._pendentes = len(fila)
+                while fila:
+                    config = self._proxima(fila) if self._em_uso < self.max_workers else None
+                    if config is None:
+                        self._cond.wait()
+                        continue
+                    fila.remove(config)
+                    self._pendentes = len(fila)
+                    self._em_uso += 1
+                    pod = chave_pod(config.iics_pod_url)
+                    self._ativos_por_pod[pod] += 1
+                    espera = time.monotonic() - inicio
+                    # Cada configuração roda com uma cópia do contexto (span corrente do tracing)
+                    executor.submit(contextvars.copy_context().run, self._rodar, config, pod, espera)
+        return self.execucoes
+
+    def _rodar(self, config, pod, espera):
+        inicio, erro = time.monotonic(), None
+        try:
+            if self.ao_despachar:
+                self.ao_despachar(config, espera)
+            self.executar(config)
+        except Exception as e:
+            erro = e
+        finally:
+            duracao = time.monotonic() - inicio
+            with self._cond:
+                self.execucoes.append(ExecucaoAgendada(config, pod, espera, duracao, erro))
+                self._ativos_por_pod[pod] -= 1
+                self._em_uso -= 1
+                self._cond.notify_all()
+
+    def emprestar_workers(self, maximo):
+        # Workers ociosos do orçamento podem ser usados por uma configuração já em execução
+        # (lotes de backfill em paralelo), mas só quando não há mais ninguém na fila
+        with self._cond:
+            if self._pendentes:
+                return 0
+            concedidos = max(0, min(maximo, self.max_workers - self._em_uso))
+            self._em_uso += concedidos
+            return concedidos
+
+    def devolver_workers(self, quantidade):
+        if not quantidade:
+            return
+        with self._cond:
+            self._em_uso -= quantidade
+            self._cond.notify_all()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Cache das sessões da API da IICS por configuração.
+# O login devolve um INFA-SESSION-ID e o baseApiUrl do pod; a sessão expira depois de um tempo
+# sem uso. Aqui a sessão fica em memória (compartilhada pelas janelas da configuração) e na
+# tabela SessaoIICS (para a próxima execução agendada), com o horário do último uso. O
+# InformaticaAPIClient consulta o cache no login e o invalida quando a API responde 401/403.
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from api.models import SessaoIICS
+
+
+class Sessao:
+    def __init__(self, session_id, base_url, ultimo_uso, persistido_em=None, pod_url=None, username=None):
+        self.session_id = session_id
+        self.base_url = base_url
+        # Pod/usuário do login: a configuração pode ser editada com o processo no ar
+        self.pod_url = pod_url
+        self.username = username
+        self.ultimo_uso = ultimo_uso
+        self.persistido_em = persistido_em or ultimo_uso
+
+
+class CacheSessoes:
+    def __init__(self, ociosidade_segundos):
+        self.ociosidade = timedelta(seconds=ociosidade_segundos)
+        self._sessoes = {}
+        self._lock = threading.Lock()
+
+    def _vigente(self, sessao, config):
+        if (sessao.pod_url, sessao.username) != (config.iics_pod_url, config.iics_username):
+            return False
+        return timezone.now() - sessao.ultimo_uso < self.ociosidade
+
+    def obter(self, config):
+        # Sessão ainda válida para o pod/usuário atuais da configuração, ou None
+        with self._lock:
+            sessao = self._sessoes.get(config.pk)
+        if sessao is None:
+            registro = SessaoIICS.objects.filter(configuracao_id=config.pk, iics_pod_url=config.iics_pod_url, iics_username=config.iics_username).first()
+            if registro is None:
+                return None
+            sessao = Sessao(registro.session_id, registro.base_api_url, registro.ultimo_uso, pod_url=registro.iics_pod_url, username=registro.iics_username)
+            with self._lock:
+                self._sessoes.setdefault(config.pk, sessao)
+        return sessao if self._vigente(sessao, config) else None
+
+    def guardar(self, config, session_id, base_url):
+        agora = timezone.now()
+        with self._lock:
+            self._sessoes[config.pk] = Sessao(session_id, base_url, agora, pod_url=config.iics_pod_url, username=config.iics_username)
+        SessaoIICS.objects.update_or_create(configuracao_id=config.pk, defaults={
+            'iics_pod_url': config.iics_pod_url, 'iics_username': config.iics_username,
+            'session_id': session_id, 'base_api_url': base_url, 'criada_em': agora, 'ultimo_uso': agora,
+        })
+
+    def tocar(self, config, session_id):
+        # Marca o uso da sessão só em memória (chamado a cada requisição, inclusive pelo poller)
+        with self._lock:
+            sessao = self._sessoes.get(config.pk)
+            if sessao is not None and sessao.session_id == session_id:
+                sessao.ultimo_uso = timezone.now()
+
+    def liberar(self, config):
+        # Fim do processamento da configuração: grava o último uso para a próxima execução
+        with self._lock:
+            sessao = self._sessoes.get(config.pk)
+            if sessao is None or sessao.persistido_em >= sessao.ultimo_uso:
+                return
+            sessao.persistido_em = sessao.ultimo_uso
+        SessaoIICS.objects.filter(configuracao_id=config.pk, session_id=sessao.session_id).update(ultimo_uso=sessao.persistido_em)
+
+    def invalidar(self, config, session_id):
+        # Só descarta se ainda for a mesma sessão (outra thread pode já ter feito o novo login)
+        with self._lock:
+            sessao = self._sessoes.get(config.pk)
+            if sessao is not None and sessao.session_id == session_id:
+                del self._sessoes[config.pk]
+        SessaoIICS.objects.filter(configuracao_id=config.pk, session_id=session_id).delete()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_sessoes():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheSessoes(settings.IICS_SESSION_IDLE_SECONDS)
+        return _cache
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Spans aninhados do fetch_ipu_data: execução > configuração > janela > exportação > etapa
+# (criar_job, aguardar_job, download, unzip, carga...). Cada span guarda início, duração,
+# linhas e bytes e é gravado em lote na tabela SpanExtracao quando termina.
+# O span corrente fica em um ContextVar: asyncio.to_thread e as tasks do asyncio herdam o
+# contexto sozinhos; para ThreadPoolExecutor use em_contexto() ao submeter.
+import contextvars
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import metrics
+from .logs import registrador_para
+
+_span_atual = contextvars.ContextVar('span_extracao_atual', default=None)
+
+# Tolerância entre o fim de um span e o início do seguinte no caminho crítico: o início vem do
+# relógio do sistema e a duração do perf_counter
+FOLGA_CAMINHO_CRITICO = timedelta(milliseconds=5)
+
+
+class Span:
+    def __init__(self, nome, pai=None, config=None, tipo_exportacao=None, meter_id=None, **atributos):
+        self.nome = nome
+        self.span_id = uuid.uuid4().hex
+        self.parent_id = pai.span_id if pai else None
+        self.execucao_id = pai.execucao_id if pai else self.span_id
+        # Sem configuração explícita herda a do pai
+        self.config = config if config is not None else (pai.config if pai else None)
+        self.tipo_exportacao = tipo_exportacao
+        self.meter_id = meter_id
+        self.atributos = atributos
+        self.status = 'SUCCESS'
+        self.linhas = None
+        self.bytes = None
+        self.inicio = timezone.now()
+        self._relogio = time.perf_counter()
+        self.duracao = None
+
+    def anotar(self, linhas=None, bytes=None, **atributos):
+        if linhas is not None:
+            self.linhas = (self.linhas or 0) + linhas
+        if bytes is not None:
+            self.bytes = (self.bytes or 0) + bytes
+        self.atributos.update(atributos)
+
+    def terminar(self):
+        self.duracao = time.perf_counter() - self._relogio
+        registrador_para('api.SpanExtracao').registrar(
+            execucao_id=self.execucao_id,
+            span_id=self.span_id,
+            parent_id=self.parent_id,
+            configuracao=self.config,
+            nome=self.nome,
+            tipo_exportacao=self.tipo_exportacao,
+            meter_id=self.meter_id,
+            inicio=self.inicio,
+            duracao_segundos=self.duracao,
+            status=self.status,
+            linhas=self.linhas,
+            bytes=self.bytes,
+            atributos=self.atributos,
+        )
+
+
+def span_atual():
+    return _span_atual.get()
+
+
+@contextmanager
+def span(nome, config=None, tipo_exportacao=None, meter_id=None, **atributos):
+    atual = Span(nome, _span_atual.get(), config, tipo_exportacao, meter_id, **atributos)
+    token = _span_atual.set(atual)
+    try:
+        yield atual
+    except BaseException:
+        atual.status = 'FAILED'
+        raise
+    finally:
+        _span_atual.reset(token)
+        atual.terminar()
+
+
+@contextmanager
+def etapa(nome, config=None, tipo_exportacao=None, meter_id=None, **atributos):
+    # Span + métricas Prometheus da etapa (api.extraction.metrics) com o mesmo status
+    with metrics.medir_etapa(nome, config, tipo_exportacao, meter_id) as medicao:
+        with span(nome, config, tipo_exportacao, meter_id, **atributos) as atual:
+            yield atual
+        medicao['status'] = atual.status
+
+
+def anotar(**campos):
+    # Anota o span corrente, se houver
+    atual = _span_atual.get()
+    if atual is not None:
+        atual.anotar(**campos)
+
+
+def em_contexto(func):
+    # Para executor.submit(em_contexto(func), ...): a thread do executor enxerga o span corrente
+    contexto = contextvars.copy_context()
+
+    def chamar(*args, **kwargs):
+        return contexto.run(func, *args, **kwargs)
+    return chamar
+
+
+def _passos_criticos(pai, filhos):
+    # Cadeia de filhos que segura o fim do pai, em ordem cronológica: parte do que termina por
+    # último e volta, a cada passo, para o irmão que termina mais tarde antes do início do atual
+    candidatos = filhos.get(pai.span_id)
+    if not candidatos:
+        return []
+    atual = max(candidatos, key=lambda s: s.fim)
+    passos = [atual]
+    restantes = [s for s in candidatos if s is not atual]
+    while True:
+        anteriores = [s for s in restantes if s.inicio <= atual.inicio and s.fim <= atual.inicio + FOLGA_CAMINHO_CRITICO]
+        if not anteriores:
+            break
+        atual = max(anteriores, key=lambda s: s.fim)
+        passos.append(atual)
+        restantes = [s for s in restantes if s is not atual]
+    passos.reverse()
+    return passos
+
+
+def caminho_critico(spans):
+    # Recebe os spans de uma execução e devolve o caminho crítico a partir da raiz como uma
+    # lista de (nível, span): em cada span, a cadeia de filhos em sequência que termina por último
+    # (_passos_criticos), com o caminho crítico de cada passo logo abaixo dele
+    filhos = {}
+    raiz = None
+    for s in spans:
+        if s.parent_id is None:
+            raiz = s
+        else:
+            filhos.setdefault(s.parent_id, []).append(s)
+    caminho = []
+
+    def visitar(span, nivel):
+        caminho.append((nivel, span))
+        for passo in _passos_criticos(span, filhos):
+            visitar(passo, nivel + 1)
+
+    if raiz is not None:
+        visitar(raiz, 0)
+    return caminho
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Camada de gravação em lote para os loaders do fetch_ipu_data.
+# Substitui o update_or_create linha a linha por INSERT ... ON CONFLICT DO UPDATE
+# em lotes, usando as colunas do unique_together do modelo como alvo do conflito.
+# Nas tabelas de consumo o alvo inclui o hash_chave, calculado aqui (api.ingestion.chaves).
+import time
+from collections import namedtuple
+
+from django.db import connections, models, router
+from django.utils import timezone
+
+from . import chaves
+from .particoes import particionada
+
+BATCH_SIZE_PADRAO = 5000
+
+# inseridos/atualizados ficam como None quando o banco não permite distinguir os dois casos
+ResultadoLote = namedtuple('ResultadoLote', ['numero', 'gravados', 'inseridos', 'atualizados', 'ignorados'])
+
+
+class BulkUpserter:
+    def __init__(self, model, batch_size=BATCH_SIZE_PADRAO, using=None, on_batch=None):
+        self.model = model
+        self.batch_size = max(1, int(batch_size or BATCH_SIZE_PADRAO))
+        self.using = using or router.db_for_write(model)
+        self.on_batch = on_batch
+        opts = model._meta
+        self.table = opts.db_table
+        self.fields = [f for f in opts.concrete_fields if not f.primary_key]
+        unique_names = set(opts.unique_together[0])
+        self.unique_fields = [f for f in self.fields if f.name in unique_names]
+        self.update_fields = [f for f in self.fields if f.name not in unique_names and not getattr(f, 'auto_now_add', False)]
+        self.auto_now_fields = [f for f in self.fields if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+        self._key_idx = [i for i, f in enumerate(self.fields) if f.name in unique_names]
+        self._agora = timezone.now()
+        self.field_names = [f.name for f in self.fields]
+        self._preps = [self._preparador(f) for f in self.fields]
+        self._preencher_hash = chaves.preenchedor(model, self.field_names)
+        self._pendentes = {}
+        self._ignorados_lote = 0
+        # xmax não pode ser lido em tabelas particionadas (api.ingestion.particoes)
+        self.distingue_inseridos = self.connection.vendor == 'postgresql' and not particionada(self.table, self.using)
+        self.lotes = []
+        # Tempo gasto nos comandos de gravação (sem leitura/conversão do CSV)
+        self.segundos_escrita = 0.0
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def _preparador(self, field):
+        connection = self.connection
+
+        def prep(value):
+            if isinstance(value, models.Model):
+                value = value.pk
+            return field.get_db_prep_save(value, connection=connection)
+        return prep
+
+    def constantes_automaticas(self):
+        # Valores dos campos auto_now/auto_now_add, que o ORM preencheria no save()
+        return {field.name: self._agora for field in self.auto_now_fields}
+
+    def add(self, row):
+        for field in self.auto_now_fields:
+            row.setdefault(field.name, self._agora)
+        self.add_valores(tuple(row.get(name) for name in self.field_names))
+
+    def com_hash_chave(self, valores):
+        return self._preencher_hash(valores) if self._preencher_hash else valores
+
+    def add_valores(self, valores):
+        # valores: tupla na ordem de self.field_names
+        valores = tuple(prep(value) for prep, value in zip(self._preps, self.com_hash_chave(valores)))
+        chave = tuple(valores[i] for i in self._key_idx)
+        # Linhas repetidas dentro do mesmo lote: a última vence, como no update_or_create.
+        # O Postgres recusa um ON CONFLICT que afete a mesma linha duas vezes no mesmo comando.
+        if chave in self._pendentes:
+            self._ignorados_lote += 1
+        self._pendentes[chave] = valores
+        if len(self._pendentes) >= self.batch_size:
+            self.flush()
+
+    def skip(self, quantidade=1):
+        self._ignorados_lote += quantidade
+
+    def _build_sql(self, n_rows):
+        qn = self.connection.ops.quote_name
+        colunas = ', '.join(qn(f.column) for f in self.fields)
+        placeholder = '(' + ', '.join(['%s'] * len(self.fields)) + ')'
+        alvo = ', '.join(qn(f.column) for f in self.unique_fields)
+        updates = ', '.join(f'{qn(f.column)} = EXCLUDED.{qn(f.column)}' for f in self.update_fields)
+        sql = (
+            f'INSERT INTO {qn(self.table)} ({colunas}) VALUES {", ".join([placeholder] * n_rows)} '
+            f'ON CONFLICT ({alvo}) DO UPDATE SET {updates}'
+        )
+        if self.distingue_inseridos:
+            # xmax = 0 só é verdadeiro para tuplas recém-inseridas
+            sql += ' RETURNING (xmax = 0)'
+        return sql
+
+    def flush(self):
+        if not self._pendentes and not self._ignorados_lote:
+            return None
+        linhas = list(self._pendentes.values())
+        self._pendentes = {}
+        ignorados, self._ignorados_lote = self._ignorados_lote, 0
+        gravados, inseridos = 0, 0
+        distingue = self.distingue_inseridos
+        max_linhas = max(1, self.connection.ops.bulk_batch_size(self.fields, linhas) or len(linhas))
+        inicio = time.perf_counter()
+        with self.connection.cursor() as cursor:
+            for i in range(0, len(linhas), max_linhas):
+                parte = linhas[i:i + max_linhas]
+                params = [valor for linha in parte for valor in linha]
+                cursor.execute(self._build_sql(len(parte)), params)
+                gravados += len(parte)
+                if distingue:
+                    inseridos += sum(1 for (novo,) in cursor.fetchall() if novo)
+        self.segundos_escrita += time.perf_counter() - inicio
+        resultado = ResultadoLote(
+            numero=len(self.lotes) + 1,
+            gravados=gravados,
+            inseridos=inseridos if distingue else None,
+            atualizados=gravados - inseridos if distingue else None,
+            ignorados=ignorados,
+        )
+        self.lotes.append(resultado)
+        if self.on_batch:
+            self.on_batch(resultado)
+        return resultado
+
+    def finish(self):
+        self.flush()
+        return self.totais()
+
+    def totais(self):
+        def soma(campo):
+            valores = [getattr(lote, campo) for lote in self.lotes]
+            return None if any(v is None for v in valores) else sum(valores)
+        return ResultadoLote(
+            numero=len(self.lotes),
+            gravados=soma('gravados'),
+            inseridos=soma('inseridos'),
+            atualizados=soma('atualizados'),
+            ignorados=soma('ignorados'),
+        )
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Hash da chave natural das tabelas de consumo (coluna hash_chave).
+# A chave natural de cada modelo (CHAVE_NATURAL, sem a configuração) tem até 10 colunas, várias
+# TextField; em vez de um UNIQUE sobre todas elas, as tabelas guardam o md5 dessas colunas como
+# uuid (16 bytes) e o UNIQUE fica em (configuracao, <data>, hash_chave). O hash é calculado em
+# Python pelos loaders e em SQL pela staging do COPY e pela migration 0022; os dois lados usam a
+# mesma forma em texto de cada valor:
+#   data/hora -> UTC 'YYYY-MM-DDTHH:MM:SS.ffffff'
+#   decimal   -> com as casas decimais do campo (empate arredondado para longe do zero, como o
+#                round do Postgres), sem notação científica
+#   demais    -> str(valor)
+# Cada valor entra como 'v' + texto (ou 'n' se nulo), separados por \x1f.
+import hashlib
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models
+from django.utils import timezone
+
+CAMPO = 'hash_chave'
+SEPARADOR = '\x1f'
+
+
+def chave_natural(model):
+    return getattr(model, 'CHAVE_NATURAL', None)
+
+
+def _texto(field):
+    if isinstance(field, models.DateTimeField):
+        def data_hora(valor):
+            if not isinstance(valor, datetime):
+                valor = field.to_python(valor)
+            if valor.tzinfo is None:
+                # Como o Django faz ao gravar com USE_TZ
+                valor = timezone.make_aware(valor, timezone.get_default_timezone())
+            return valor.astimezone(dt_timezone.utc).replace(tzinfo=None).isoformat(timespec='microseconds')
+        return data_hora
+    if isinstance(field, models.DecimalField):
+        quantum = Decimal(1).scaleb(-field.decimal_places)
+
+        def decimal(valor):
+            if not isinstance(valor, Decimal):
+                valor = field.to_python(valor)
+            valor = valor.quantize(quantum, rounding=ROUND_HALF_UP)
+            # O numeric do Postgres não tem zero negativo
+            return format(abs(valor) if valor == 0 else valor, 'f')
+        return decimal
+    if isinstance(field, models.IntegerField):
+        return lambda valor: str(field.to_python(valor))
+    return str
+
+
+def calcular(textos):
+    partes = ['n' if texto is None else 'v' + texto for texto in textos]
+    return uuid.UUID(bytes=hashlib.md5(SEPARADOR.join(partes).encode('utf-8')).digest())
+
+
+def preenchedor(model, field_names, campos=None):
+    # Função que recebe a tupla de valores na ordem de field_names e devolve a tupla com o
+    # hash_chave preenchido (se ainda estiver nulo). None se o modelo não tem chave com hash.
+    campos = campos or chave_natural(model)
+    if not campos or CAMPO not in field_names:
+        return None
+    opts = model._meta
+    indices = [(field_names.index(nome), _texto(opts.get_field(nome))) for nome in campos]
+    idx_hash = field_names.index(CAMPO)
+
+    def preencher(valores):
+        if valores[idx_hash] is not None:
+            return valores
+        textos = [None if valores[i] is None else texto(valores[i]) for i, texto in indices]
+        valores = list(valores)
+        valores[idx_hash] = calcular(textos)
+        return tuple(valores)
+    return preencher
+
+
+def _texto_sql(field, coluna):
+    if isinstance(field, models.DateTimeField):
+        return f"to_char({coluna} AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US')"
+    if isinstance(field, models.DecimalField):
+        # round fixa as casas mesmo se a coluna não tiver a escala (ex.: staging)
+        return f"round({coluna}, {int(field.decimal_places)})::text"
+    return f"{coluna}::text"
+
+
+def expressao_sql(model, connection, campos=None, tabela=None):
+    # Expressão SQL (PostgreSQL) que calcula o hash_chave a partir das colunas da linha
+    qn = connection.ops.quote_name
+    opts = model._meta
+    partes = []
+    for nome in campos or chave_natural(model):
+        field = opts.get_field(nome)
+        coluna = f"{qn(tabela)}.{qn(field.column)}" if tabela else qn(field.column)
+        partes.append(f"coalesce('v' || {_texto_sql(field, coluna)}, 'n')")
+    return f"md5(concat_ws(chr(31), {', '.join(partes)}))::uuid"
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Conversão tipada das células dos CSVs da IICS.
+# Cada coluna recebe o seu próprio conversor: o formato de data/hora é detectado no primeiro
+# valor não nulo e as linhas seguintes usam o caminho rápido daquele formato. Valores fora
+# do padrão caem no dateutil, como no Command._safe_cast original.
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from dateutil import parser as date_parser
+
+UTC = dt_timezone.utc
+_AUSENTE = object()
+
+# Formatos tentados na detecção, em ordem. 'iso' usa datetime.fromisoformat, o mais rápido.
+FORMATOS_DATETIME = (
+    'iso',
+    'iso_z',
+    '%Y-%m-%dT%H:%M:%S.%f%z',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y',
+)
+
+
+def limpar_valor(value):
+    if value is None or value.lower() == 'null' or value.strip() == '':
+        return None
+    return value
+
+
+def _parse_iso_z(value):
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+
+def _parser_para_formato(formato):
+    if formato == 'iso':
+        return datetime.fromisoformat
+    if formato == 'iso_z':
+        return _parse_iso_z
+    return lambda value: datetime.strptime(value, formato)
+
+
+class ConversorDataHora:
+    def __init__(self, tz, max_cache=4096):
+        self.tz = tz
+        self.max_cache = max_cache
+        self.formato = None
+        self.com_fuso = False
+        self._parse = None
+        self._cache = {}
+        self.fallbacks = 0
+
+    def _detectar(self, value):
+        for formato in FORMATOS_DATETIME:
+            parse = _parser_para_formato(formato)
+            try:
+                dt_obj = parse(value)
+            except ValueError:
+                continue
+            self.formato, self._parse = formato, parse
+            self.com_fuso = dt_obj.tzinfo is not None
+            return
+
+    def _converter(self, value):
+        if limpar_valor(value) is None:
+            return None
+        if self._parse is None:
+            self._detectar(value)
+        dt_obj = None
+        if self._parse is not None:
+            try:
+                dt_obj = self._parse(value)
+            except ValueError:
+                dt_obj = None
+        if dt_obj is None:
+            self.fallbacks += 1
+            try:
+                dt_obj = date_parser.parse(value)
+            except (ValueError, OverflowError, date_parser.ParserError):
+                return None
+        if dt_obj.tzinfo is None:
+            dt_obj = dt_obj.replace(tzinfo=self.tz)
+        return dt_obj.astimezone(UTC)  # Sempre armazena em UTC no banco
+
+    def __call__(self, value):
+        # Colunas como 'Date' do SUMMARY/ASSET repetem poucos valores distintos
+        resultado = self._cache.get(value, _AUSENTE)
+        if resultado is _AUSENTE:
+            resultado = self._converter(value)
+            if len(self._cache) < self.max_cache:
+                self._cache[value] = resultado
+        return resultado
+
+
+class ConversorDecimal:
+    def __call__(self, value):
+        if limpar_valor(value) is None:
+            return None
+        try:
+            return Decimal(value)
+        except (InvalidOperation, ValueError, TypeError):
+            return None
+
+
+class ConversorInteiro:
+    def __call__(self, value):
+        if limpar_valor(value) is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            return int(float(value))
+        except (ValueError, TypeError, OverflowError):
+            return None
+
+
+def criar_conversor(tipo, tz):
+    if tipo is datetime:
+        return ConversorDataHora(tz)
+    if tipo is Decimal:
+        return ConversorDecimal()
+    if tipo is int:
+        return ConversorInteiro()
+    return limpar_valor
+
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# Motor colunar de ingestão para exportações grandes (ex.: ExportServiceJobLevelMeteringData).
+# Lê o CSV em blocos (pyarrow quando disponível, senão o leitor C do pandas), faz a limpeza de
+# nulos, as conversões de Decimal/data e o filtro de chaves nulas como operações de coluna e
+# entrega as linhas já prontas ao writer (BulkUpserter ou CopyStagingWriter).
+import csv
+from datetime import datetime
+from decimal import Decimal
+
+from .converters import criar_conversor
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    np = pd = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+CHUNK_ROWS_PADRAO = 50000
+ARROW_BLOCK_BYTES = 16 * 1024 * 1024
+_REGEX_FUSO = r'(?:Z|[+-]\d{2}:?\d{2})$'
+
+
+def pandas_disponivel():
+    return pd is not None
+
+
+def _tipo_texto(tipo_arrow):
+    # Mantém as colunas como strings do Arrow: as operações .str ficam vetorizadas em C++
+    if tipo_arrow == pa.string():
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+def _ler_lotes_arrow(binario):
+    # O cabeçalho é lido à parte para forçar todas as colunas como texto: a inferência de tipos
+    # do Arrow converteria '1.50' em double e perderia a precisão que o Decimal preserva.
+    header = next(csv.reader([binario.readline().decode('utf-8')]), None)
+    if not header:
+        return
+    reader = pa_csv.open_csv(
+        binario,
+        read_options=pa_csv.ReadOptions(column_names=header, block_size=ARROW_BLOCK_BYTES),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={nome: pa.string() for nome in header},
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas(types_mapper=_tipo_texto)
+
+
+def ler_lotes(infile, chunk_rows=CHUNK_ROWS_PADRAO):
+    binario = getattr(infile, 'buffer', None)
+    if pa_csv is not None and binario is not None:
+        lotes = _ler_lotes_arrow(binario)
+    else:
+        dtype = 'string[pyarrow]' if pa is not None else str
+        lotes = pd.read_csv(infile, dtype=dtype, keep_default_na=False, na_filter=False, chunksize=chunk_rows)
+    for df in lotes:
+        df.columns = [str(nome).strip() for nome in df.columns]
+        yield df
+
+
+def _limpar(serie):
+    if serie.dtype == object:
+        serie = serie.astype('string[pyarrow]' if pa is not None else 'string')
+    nulos = serie.isna() | serie.str.strip().eq('') | serie.str.lower().eq('null')
+    return serie.mask(nulos.fillna(True))
+
+
+def _como_objetos(serie):
+    return serie.to_numpy(dtype=object, na_value=None)
+
+
+def _texto_timestamp(valores):
+    # valores: datetime64 em UTC; mesmo formato que o Postgres aceita para timestamptz
+    return np.char.add(np.datetime_as_string(valores, unit='us'), '+00:00').astype(object)
+
+
+def _converter_datetime(serie, conversor, tz, texto=False):
+    validos = serie.notna()
+    resultado = np.full(len(serie), None, dtype=object)
+    if not validos.any():
+        return resultado
+    amostra = serie[validos].iloc[0]
+    conversor(amostra)  # detecta o formato da coluna
+    if conversor.formato is None:
+        return _converter_linha_a_linha(serie, conversor, texto)
+    formato = 'ISO8601' if conversor.formato in ('iso', 'iso_z') else conversor.formato
+    # Só entram no caminho vetorizado os valores com a mesma presença de fuso da amostra;
+    # datas sem fuso no meio de uma coluna com fuso seguem o conversor (horário de São Paulo)
+    com_fuso = serie.str.contains(_REGEX_FUSO).fillna(False).astype(bool)
+    candidatos = validos & (com_fuso if conversor.com_fuso else ~com_fuso)
+    ok = np.zeros(len(serie), dtype=bool)
+    if candidatos.any():
+        try:
+            convertida = pd.to_datetime(serie[candidatos], format=formato, errors='coerce', utc=conversor.com_fuso)
+            if not conversor.com_fuso:
+                convertida = convertida.dt.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+            convertida = convertida.dt.tz_convert('UTC')
+        except (ValueError, TypeError, AttributeError):
+            return _converter_linha_a_linha(serie, conversor, texto)
+        parciais = convertida.notna().to_numpy()
+        posicoes = np.flatnonzero(candidatos.to_numpy())[parciais]
+        if texto:
+            resultado[posicoes] = _texto_timestamp(convertida[parciais].dt.tz_convert(None).to_numpy())
+        else:
+            resultado[posicoes] = convertida[parciais].array.to_pydatetime()
+        ok[posicoes] = True
+    # Valores fora do formato detectado seguem pelo conversor (e pelo dateutil, se preciso)
+    falhas = validos.to_numpy() & ~ok
+    if falhas.any():
+        resultado[falhas] = _converter_linha_a_linha(serie[falhas], conversor, texto)
+    return resultado
+
+
+def _converter_linha_a_linha(serie, conversor, texto=False):
+    resultado = [None if v is None else conversor(v) for v in _como_objetos(serie)]
+    if texto:
+        resultado = [None if v is None else v.isoformat() for v in resultado]
+    return np.array(resultado, dtype=object)
+
+
+def _converter_decimal(serie, texto=False):
+    resultado = np.full(len(serie), None, dtype=object)
+    numeros = pd.to_numeric(serie, errors='coerce')
+    ok = np.isfinite(numeros.to_numpy(dtype='float64', na_value=np.nan))
+    if ok.any():
+        if texto:
+            # O próprio Postgres converte o texto para numeric, sem passar por Decimal
+            resultado[ok] = serie[ok].str.strip().to_numpy(dtype=object)
+        else:
+            resultado[ok] = [Decimal(v) for v in serie[ok]]
+    # 'NaN', 'Infinity' e textos inválidos seguem pelo ConversorDecimal, como no motor python
+    falhas = serie.notna().to_numpy() & ~ok
+    if falhas.any():
+        conversor = criar_conversor(Decimal, None)
+        valores = [conversor(v) for v in _como_objetos(serie[falhas])]
+        if texto:
+            valores = [None if v is None else str(v) for v in valores]
+        resultado[falhas] = valores
+    return resultado
+
+
+def _converter_inteiro(serie, texto=False):
+    resultado = np.full(len(serie), None, dtype=object)
+    numeros = pd.to_numeric(serie, errors='coerce')
+    ok = numeros.notna().to_numpy()
+    if ok.any():
+        # '12.7' vira 12, como o int(float(value)) do conversor linha a linha
+        inteiros = numeros[ok].to_numpy()
+        if inteiros.dtype.kind == 'f':
+            inteiros = np.trunc(inteiros)
+        resultado[ok] = [str(int(v)) if texto else int(v) for v in inteiros]
+    return resultado
+
+
+def converter_coluna(serie, tipo, conversor, tz, texto=False):
+    # texto=True devolve os valores já como literais para o COPY (sem objetos Decimal/datetime)
+    serie = _limpar(serie)
+    if tipo is datetime:
+        return _converter_datetime(serie, conversor, tz, texto)
+    if tipo is Decimal:
+        return _converter_decimal(serie, texto)
+    if tipo is int:
+        return _converter_inteiro(serie, texto)
+    return _como_objetos(serie)
+
+
+def _constante_texto(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return str(getattr(valor, 'pk', valor))
+
+
+def carregar_com_pandas(spec, infile, writer, constantes, tz, observador=None, chunk_rows=CHUNK_ROWS_PADRAO):
+    # Retorna (colunas ausentes, linhas lidas, linhas descartadas por chave nula).
+    # Writers com copiar_colunas (CopyStagingWriter) recebem cada lote inteiro como DataFrame de
+    # texto; os demais recebem tuplas de valores, como no caminho linha a linha.
+    if pd is None:
+        raise RuntimeError("O motor 'pandas' exige a biblioteca pandas instalada.")
+    campos = writer.field_names
+    colunar = hasattr(writer, 'copiar_colunas')
+    if colunar:
+        constantes = {campo: _constante_texto(valor) for campo, valor in constantes.items()}
+    conversores = {}
+    ausentes, lidas, descartadas = [], 0, 0
+    presentes = None
+    for df in ler_lotes(infile, chunk_rows):
+        if presentes is None:
+            presentes, ausentes = spec.resolver_colunas(list(df.columns))
+            conversores = {coluna.field: criar_conversor(coluna.tipo, tz) for coluna, _ in presentes}
+        if observador:
+            observador.observar_lote(df)
+        n = len(df)
+        lidas += n
+        colunas = [np.full(n, constantes.get(campo), dtype=object) for campo in campos]
+        mascara = np.ones(n, dtype=bool)
+        for coluna, indice in presentes:
+            valores = converter_coluna(df.iloc[:, indice], coluna.tipo, conversores[coluna.field], tz, texto=colunar)
+            colunas[campos.index(coluna.field)] = valores
+            if coluna.obrigatoria:
+                mascara &= pd.notna(valores)
+        rejeitadas = int((~mascara).sum())
+        if rejeitadas:
+            descartadas += rejeitadas
+            writer.skip(rejeitadas)
+            colunas = [valores[mascara] for valores in colunas]
+        if colunar:
+            writer.copiar_colunas(pd.DataFrame(dict(zip(campos, colunas)), columns=campos))
+            continue
+        for valores in zip(*colunas):
+            writer.add_valores(valores)
+    return ausentes, lidas, descartadas
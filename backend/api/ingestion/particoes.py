@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+# Particionamento das tabelas de consumo que crescem sem limite (PostgreSQL).
+# Cada tabela vira uma tabela particionada por RANGE (configuracao_id, <data>) com uma partição
+# por configuração e mês (no fuso de settings.TIME_ZONE), mais uma partição DEFAULT para o que
+# não tiver partição própria (datas nulas, meses ainda não criados). Assim:
+#   - as consultas do dashboard (sempre por configuração e período) só leem as partições do período;
+#   - a carga de uma janela que cobre um mês inteiro esvazia a partição com TRUNCATE em vez de
+#     apagar linha a linha, sem deixar tuplas mortas para o vacuum;
+#   - o vacuum e as estatísticas trabalham partição a partição.
+# O Postgres exige que as restrições UNIQUE incluam as colunas da partição: a chave primária (id)
+# vira UNIQUE (id, configuracao_id, <data>) e o id continua vindo de uma sequence.
+# Em outros bancos (SQLite de desenvolvimento) nada aqui tem efeito.
+import re
+import threading
+from datetime import datetime, timedelta
+from functools import partial
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import connections, transaction
+
+# Tabela -> coluna de data usada nas partições (a mesma que delimita a janela apagada na carga)
+TABELAS_PARTICIONADAS = {
+    'api_consumosummary': 'consumption_date',
+    'api_consumoasset': 'consumption_date',
+    'api_consumocdijobexecucao': 'start_time',
+}
+MESES_A_FRENTE_PADRAO = 3
+
+_lock = threading.Lock()
+# {(alias, tabela): bool} e {(alias, tabela): {nomes das partições}} já consultados neste processo
+_particionadas = {}
+_conhecidas = {}
+
+
+def _qn(nome):
+    return '"%s"' % nome.replace('"', '""')
+
+
+def _fuso():
+    return ZoneInfo(settings.TIME_ZONE)
+
+
+def inicio_do_mes(momento):
+    local = momento.astimezone(_fuso()) if momento.tzinfo else momento.replace(tzinfo=_fuso())
+    return datetime(local.year, local.month, 1, tzinfo=_fuso())
+
+
+def proximo_mes(mes):
+    return datetime(mes.year + mes.month // 12, mes.month % 12 + 1, 1, tzinfo=_fuso())
+
+
+def meses_entre(inicio, fim):
+    mes, ultimo = inicio_do_mes(inicio), inicio_do_mes(fim)
+    while mes <= ultimo:
+        yield mes
+        mes = proximo_mes(mes)
+
+
+def nome_particao(tabela, configuracao_id, mes):
+    return f"{tabela}_c{configuracao_id}_{mes:%Y_%m}"
+
+
+def nome_padrao(tabela):
+    return f"{tabela}_padrao"
+
+
+def particionada(tabela, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'postgresql' or tabela not in TABELAS_PARTICIONADAS:
+        return False
+    chave = (using, tabela)
+    if chave not in _particionadas:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [tabela])
+            linha = cursor.fetchone()
+        with _lock:
+            _particionadas[chave] = bool(linha) and linha[0] == 'p'
+    return _particionadas[chave]
+
+
+def esquecer_cache():
+    # Depois de converter ou reverter uma tabela neste processo
+    with _lock:
+        _particionadas.clear()
+        _conhecidas.clear()
+
+
+def particoes(cursor, tabela):
+    # [(nome, limites)] das partições diretas da tabela
+    cursor.execute(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+        [tabela],
+    )
+    return cursor.fetchall()
+
+
+def resumo(tabela, using='default'):
+    # [(nome, limites, linhas estimadas, bytes)] para o manage_partitions --list
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), greatest(c.reltuples, 0)::bigint, pg_total_relation_size(c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+            [tabela],
+        )
+        return cursor.fetchall()
+
+
+def _nomes_conhecidos(cursor, using, tabela):
+    chave = (using, tabela)
+    with _lock:
+        nomes = _conhecidas.get(chave)
+    if nomes is None:
+        nomes = {nome for nome, _ in particoes(cursor, tabela)}
+        with _lock:
+            _conhecidas[chave] = nomes
+    return nomes
+
+
+def _criar_particao(cursor, tabela, coluna, configuracao_id, mes):
+    # Cria a partição fora da tabela, traz para ela as linhas que já estavam na DEFAULT e só então
+    # a anexa: um CREATE ... PARTITION OF falharia se a DEFAULT tivesse linhas do novo intervalo.
+    # Retorna as linhas trazidas da DEFAULT, ou None se outra execução já criou a partição.
+    nome = nome_particao(tabela, configuracao_id, mes)
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [tabela])
+    cursor.execute("SELECT to_regclass(%s)", [nome])
+    if cursor.fetchone()[0] is not None:
+        return None
+    fim = proximo_mes(mes)
+    cursor.execute(f"CREATE TABLE {_qn(nome)} (LIKE {_qn(tabela)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)")
+    cursor.execute(
+        f"WITH movidas AS (DELETE FROM {_qn(nome_padrao(tabela))} WHERE configuracao_id = %s AND {_qn(coluna)} >= %s AND {_qn(coluna)} < %s RETURNING *) "
+        f"INSERT INTO {_qn(nome)} SELECT * FROM movidas",
+        [configuracao_id, mes, fim],
+    )
+    movidas = cursor.rowcount
+    cursor.execute(
+        f"ALTER TABLE {_qn(tabela)} ATTACH PARTITION {_qn(nome)} FOR VALUES FROM (%s, %s) TO (%s, %s)",
+        [configuracao_id, mes, configuracao_id, fim],
+    )
+    return movidas
+
+
+def _lembrar(conhecidas, nome):
+    with _lock:
+        conhecidas.add(nome)
+
+
+def garantir_particoes(tabela, configuracao_ids, inicio, fim, using='default'):
+    # Cria as partições que faltam para as configurações nos meses de inicio a fim.
+    # Retorna [(nome da partição, linhas trazidas da DEFAULT)].
+    # Chamar fora de transação (antes da carga): cada partição é criada e confirmada na sua própria
+    # transação, e o ATTACH bloqueia a DEFAULT inteira até o commit.
+    if not particionada(tabela, using):
+        return []
+    coluna = TABELAS_PARTICIONADAS[tabela]
+    criadas = []
+    with connections[using].cursor() as cursor:
+        conhecidas = _nomes_conhecidos(cursor, using, tabela)
+        for configuracao_id in configuracao_ids:
+            for mes in meses_entre(inicio, fim):
+                nome = nome_particao(tabela, configuracao_id, mes)
+                if nome in conhecidas:
+                    continue
+                with transaction.atomic(using=using):
+                    movidas = _criar_particao(cursor, tabela, coluna, configuracao_id, mes)
+                    # Só entra no cache depois do commit: se a transação for desfeita, a partição não existe
+                    transaction.on_commit(partial(_lembrar, conhecidas, nome), using=using)
+                if movidas is not None:
+                    criadas.append((nome, movidas))
+    return criadas
+
+
+def criar_particoes_a_frente(configuracao_ids, meses=MESES_A_FRENTE_PADRAO, agora=None, using='default'):
+    # Partições do mês atual e dos próximos meses para cada tabela particionada
+    inicio = inicio_do_mes(agora or datetime.now(_fuso()))
+    fim = inicio
+    for _ in range(meses):
+        fim = proximo_mes(fim)
+    criadas = {}
+    for tabela in TABELAS_PARTICIONADAS:
+        criadas[tabela] = garantir_particoes(tabela, configuracao_ids, inicio, fim, using)
+    return criadas
+
+
+def realocar_padrao(using='default'):
+    # Cria as partições para as linhas que caíram na DEFAULT (ex.: configuração nova ou mês antigo
+    # carregado antes de a partição existir). Linhas com data nula ficam na DEFAULT.
+    realocadas = {}
+    for tabela, coluna in TABELAS_PARTICIONADAS.items():
+        if not particionada(tabela, using):
+            continue
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT configuracao_id, date_trunc('month', {_qn(coluna)} AT TIME ZONE %s) "
+                f"FROM {_qn(nome_padrao(tabela))} WHERE {_qn(coluna)} IS NOT NULL",
+                [settings.TIME_ZONE],
+            )
+            pares = cursor.fetchall()
+        realocadas[tabela] = []
+        for configuracao_id, mes in pares:
+            mes = mes.replace(tzinfo=_fuso())
+            realocadas[tabela] += garantir_particoes(tabela, [configuracao_id], mes, mes, using)
+    return realocadas
+
+
+def esvaziar_meses_completos(tabela, configuracao_id, inicio, fim, using='default'):
+    # TRUNCATE das partições da configuração cujo mês inteiro está dentro de [inicio, fim].
+    # Retorna (partições esvaziadas, linhas removidas); o restante da janela segue no DELETE.
+    if not particionada(tabela, using):
+        return [], 0
+    esvaziadas, linhas = [], 0
+    with connections[using].cursor() as cursor:
+        for mes in meses_entre(inicio, fim):
+            if mes < inicio or proximo_mes(mes) - timedelta(microseconds=1) > fim:
+                continue
+            # Confere no banco, não no cache: a partição pode ter sido removida por outro processo
+            nome = nome_particao(tabela, configuracao_id, mes)
+            cursor.execute("SELECT to_regclass(%s)", [nome])
+            if cursor.fetchone()[0] is None:
+                continue
+            cursor.execute(f"SELECT count(*) FROM {_qn(nome)}")
+            linhas += cursor.fetchone()[0]
+            cursor.execute(f"TRUNCATE {_qn(nome)}")
+            esvaziadas.append(nome)
+    return esvaziadas, linhas
+
+
+def _recriar_restricoes(cursor, origem, destino, chave_particao=None):
+    # Move restrições e índices de origem para destino (mesmos nomes). Com chave_particao, a chave
+    # primária vira UNIQUE incluindo as colunas da partição; sem ela, a UNIQUE (id, ...) volta a
+    # ser a chave primária.
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'f', 'c') ORDER BY contype DESC",
+        [origem],
+    )
+    restricoes = cursor.fetchall()
+    cursor.execute(
+        "SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "WHERE i.indrelid = to_regclass(%s) AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)",
+        [origem],
+    )
+    indices = cursor.fetchall()
+    for nome, _, _ in restricoes:
+        cursor.execute(f"ALTER TABLE {_qn(origem)} DROP CONSTRAINT {_qn(nome)}")
+    for nome, _ in indices:
+        cursor.execute(f"DROP INDEX {nome}")
+    chave_id = f"{destino}_id_uniq"
+    for nome, tipo, definicao in restricoes:
+        if tipo == 'p':
+            cursor.execute(f"ALTER TABLE {_qn(destino)} ADD CONSTRAINT {_qn(chave_id)} UNIQUE (id, {', '.join(chave_particao)})")
+        elif nome == chave_id and chave_particao is None:
+            cursor.execute(f"ALTER TABLE {_qn(destino)} ADD CONSTRAINT {_qn(destino + '_pkey')} PRIMARY KEY (id)")
+        else:
+            cursor.execute(f"ALTER TABLE {_qn(destino)} ADD CONSTRAINT {_qn(nome)} {definicao}")
+    for _, definicao in indices:
+        # pg_get_indexdef devolve "CREATE INDEX nome ON [ONLY] schema.origem USING ..."
+        definicao = re.sub(r' ON (ONLY )?(\S+\.)?%s ' % re.escape(origem), f' ON {_qn(destino)} ', definicao, count=1)
+        cursor.execute(definicao)
+
+
+def _liberar_sequence(cursor, origem):
+    # Tira da origem a identity/sequence do id (antes do CREATE TABLE ... LIKE, para o default
+    # não ser copiado apontando para ela) e retorna o próximo id a usar
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [origem])
+    sequence = cursor.fetchone()[0]
+    cursor.execute(f"SELECT coalesce(max(id), 0) + 1 FROM {_qn(origem)}")
+    proximo = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(f"SELECT last_value + 1 FROM {sequence}")
+        proximo = max(proximo, cursor.fetchone()[0])
+    cursor.execute(f"ALTER TABLE {_qn(origem)} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+    cursor.execute(f"ALTER TABLE {_qn(origem)} ALTER COLUMN id DROP DEFAULT")
+    if sequence:
+        cursor.execute(f"DROP SEQUENCE IF EXISTS {sequence}")
+    return proximo
+
+
+def _criar_sequence(cursor, destino, proximo):
+    # Uma sequence comum (OWNED BY) em vez de identity: o Postgres < 17 não aceita identity em
+    # tabela particionada, e o pg_get_serial_sequence usado pelo Django continua funcionando
+    nova = f"{destino}_id_seq"
+    cursor.execute(f"CREATE SEQUENCE {_qn(nova)} START WITH {int(proximo)} OWNED BY {_qn(destino)}.id")
+    cursor.execute(f"ALTER TABLE {_qn(destino)} ALTER COLUMN id SET DEFAULT nextval('{nova}')")
+
+
+def converter_tabela(connection, tabela):
+    # Converte uma tabela comum em particionada, copiando os dados. Deve rodar em uma transação
+    # (a migration 0021 faz isso); a tabela fica bloqueada durante a cópia.
+    coluna = TABELAS_PARTICIONADAS[tabela]
+    legado = f"{tabela}_legado"
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [tabela])
+        if cursor.fetchone()[0] == 'p':
+            return False
+        cursor.execute(f"LOCK TABLE {_qn(tabela)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"ALTER TABLE {_qn(tabela)} RENAME TO {_qn(legado)}")
+        proximo = _liberar_sequence(cursor, legado)
+        cursor.execute(
+            f"CREATE TABLE {_qn(tabela)} (LIKE {_qn(legado)} INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS) "
+            f"PARTITION BY RANGE (configuracao_id, {_qn(coluna)})"
+        )
+        _criar_sequence(cursor, tabela, proximo)
+        _recriar_restricoes(cursor, legado, tabela, chave_particao=('configuracao_id', _qn(coluna)))
+        cursor.execute(f"CREATE TABLE {_qn(nome_padrao(tabela))} PARTITION OF {_qn(tabela)} DEFAULT")
+        cursor.execute(
+            f"SELECT DISTINCT configuracao_id, date_trunc('month', {_qn(coluna)} AT TIME ZONE %s) FROM {_qn(legado)} WHERE {_qn(coluna)} IS NOT NULL",
+            [settings.TIME_ZONE],
+        )
+        for configuracao_id, mes in cursor.fetchall():
+            _criar_particao(cursor, tabela, coluna, configuracao_id, mes.replace(tzinfo=_fuso()))
+        cursor.execute(f"INSERT INTO {_qn(tabela)} SELECT * FROM {_qn(legado)}")
+        cursor.execute(f"DROP TABLE {_qn(legado)}")
+        cursor.execute(f"ANALYZE {_qn(tabela)}")
+    esquecer_cache()
+    return True
+
+
+def reverter_tabela(connection, tabela):
+    # Volta a tabela particionada para uma tabela comum, com a chave primária em id
+    legado = f"{tabela}_particionada"
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [tabela])
+        if cursor.fetchone()[0] != 'p':
+            return False
+        cursor.execute(f"LOCK TABLE {_qn(tabela)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"ALTER TABLE {_qn(tabela)} RENAME TO {_qn(legado)}")
+        proximo = _liberar_sequence(cursor, legado)
+        cursor.execute(f"CREATE TABLE {_qn(tabela)} (LIKE {_qn(legado)} INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS)")
+        _criar_sequence(cursor, tabela, proximo)
+        _recriar_restricoes(cursor, legado, tabela)
+        cursor.execute(f"INSERT INTO {_qn(tabela)} SELECT * FROM {_qn(legado)}")
+        cursor.execute(f"DROP TABLE {_qn(legado)} CASCADE")
+        cursor.execute(f"ANALYZE {_qn(tabela)}")
+    esquecer_cache()
+    return True
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Modo de carga via COPY para PostgreSQL.
+# As linhas limpas são enviadas com COPY FROM STDIN para uma tabela temporária de staging
+# e, no final, mescladas na tabela de destino com um único INSERT ... SELECT ... ON CONFLICT.
+import csv
+import io
+import time
+import uuid
+from datetime import date, datetime
+
+from . import chaves
+from .bulk import BulkUpserter, ResultadoLote, BATCH_SIZE_PADRAO
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+NULL_COPY = '\\N'
+
+
+def _formatar_valor(valor):
+    if valor is None:
+        return NULL_COPY
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def serializar_linhas(linhas, ordem_inicial):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for ordem, linha in enumerate(linhas, start=ordem_inicial + 1):
+        writer.writerow([_formatar_valor(v) for v in linha] + [ordem])
+    buffer.seek(0)
+    return buffer
+
+
+def serializar_colunas(df, ordem_inicial):
+    # df: DataFrame já em texto no formato aceito pelo COPY, nulos como NA, colunas na ordem do modelo.
+    # Retorna (buffer, marcador de nulo usado no arquivo).
+    df = df.assign(_ordem=range(ordem_inicial + 1, ordem_inicial + 1 + len(df)))
+    if pa_csv is not None:
+        # Todos os valores vão entre aspas e os nulos ficam vazios sem aspas, que é o NULL
+        # padrão do COPY em CSV: "" continua sendo texto vazio
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        buffer = io.BytesIO()
+        pa_csv.write_csv(tabela, buffer, pa_csv.WriteOptions(include_header=False, quoting_style='all_valid'))
+        buffer.seek(0)
+        return buffer, ''
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False, na_rep=NULL_COPY, lineterminator='\n')
+    buffer.seek(0)
+    return buffer, NULL_COPY
+
+
+class CopyStagingWriter(BulkUpserter):
+    def __init__(self, model, batch_size=BATCH_SIZE_PADRAO, using=None, on_batch=None):
+        super().__init__(model, batch_size=batch_size, using=using, on_batch=on_batch)
+        if self.connection.vendor != 'postgresql':
+            raise ValueError("O modo COPY só está disponível para PostgreSQL.")
+        self.staging_table = f"stg_{self.table}_{uuid.uuid4().hex[:12]}"
+        self._staging_criada = False
+        self._ordem = 0
+        self._ignorados_total = 0
+        self.copiados = 0
+
+    def _colunas(self):
+        qn = self.connection.ops.quote_name
+        return ', '.join(qn(f.column) for f in self.fields)
+
+    def _criar_staging(self, cursor):
+        qn = self.connection.ops.quote_name
+        # Tabela temporária: sem WAL e visível apenas para esta sessão
+        cursor.execute(f'CREATE TEMPORARY TABLE {qn(self.staging_table)} AS SELECT {self._colunas()} FROM {qn(self.table)} WITH NO DATA')
+        cursor.execute(f'ALTER TABLE {qn(self.staging_table)} ADD COLUMN "_ordem" bigint')
+        self._staging_criada = True
+
+    def _copy(self, cursor, buffer, nulo=NULL_COPY):
+        qn = self.connection.ops.quote_name
+        sql = f'COPY {qn(self.staging_table)} ({self._colunas()}, "_ordem") FROM STDIN WITH (FORMAT csv, NULL \'{nulo}\')'
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):
+            raw_cursor.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+    def flush(self):
+        if not self._pendentes and not self._ignorados_lote:
+            return None
+        linhas = list(self._pendentes.values())
+        self._pendentes = {}
+        self._ignorados_total += self._ignorados_lote
+        self._ignorados_lote = 0
+        if not linhas:
+            return None
+        self._enviar(serializar_linhas(linhas, self._ordem), len(linhas))
+        return None
+
+    def copiar_colunas(self, df):
+        # Caminho colunar do motor pandas: o lote vai direto para o COPY, sem passar por
+        # objetos Python célula a célula. Chaves repetidas são resolvidas no merge (DISTINCT ON).
+        self.flush()
+        if len(df):
+            buffer, nulo = serializar_colunas(df, self._ordem)
+            self._enviar(buffer, len(df), nulo)
+
+    def _enviar(self, buffer, quantidade, nulo=NULL_COPY):
+        inicio = time.perf_counter()
+        with self.connection.cursor() as cursor:
+            if not self._staging_criada:
+                self._criar_staging(cursor)
+            self._copy(cursor, buffer, nulo)
+        self.segundos_escrita += time.perf_counter() - inicio
+        self._ordem += quantidade
+        self.copiados += quantidade
+
+    def _merge(self, cursor):
+        qn = self.connection.ops.quote_name
+        colunas = self._colunas()
+        chave = ', '.join(qn(f.column) for f in self.unique_fields)
+        updates = ', '.join(f'{qn(f.column)} = EXCLUDED.{qn(f.column)}' for f in self.update_fields)
+        # DISTINCT ON remove chaves repetidas entre lotes; a linha mais recente do arquivo vence
+        inserido = '(xmax = 0)' if self.distingue_inseridos else 'NULL::boolean'
+        if self._preencher_hash:
+            # Linhas do caminho colunar chegam sem o hash_chave; o Postgres calcula na staging
+            cursor.execute(
+                f'UPDATE {qn(self.staging_table)} SET {qn(chaves.CAMPO)} = {chaves.expressao_sql(self.model, self.connection)} '
+                f'WHERE {qn(chaves.CAMPO)} IS NULL'
+            )
+        cursor.execute(
+            f'WITH merge AS ('
+            f'INSERT INTO {qn(self.table)} ({colunas}) '
+            f'SELECT DISTINCT ON ({chave}) {colunas} FROM {qn(self.staging_table)} ORDER BY {chave}, "_ordem" DESC '
+            f'ON CONFLICT ({chave}) DO UPDATE SET {updates} '
+            f'RETURNING {inserido} AS inserido'
+            f') SELECT COUNT(*) FILTER (WHERE inserido), COUNT(*) FROM merge'
+        )
+        return cursor.fetchone()
+
+    def finish(self):
+        self.flush()
+        inseridos, gravados = 0, 0
+        if self._staging_criada:
+            qn = self.connection.ops.quote_name
+            # Em caso de erro a transação do loader é revertida e leva a staging junto
+            inicio = time.perf_counter()
+            with self.connection.cursor() as cursor:
+                inseridos, gravados = self._merge(cursor)
+                cursor.execute(f'DROP TABLE IF EXISTS {qn(self.staging_table)}')
+            self.segundos_escrita += time.perf_counter() - inicio
+            self._staging_criada = False
+        distingue = self.distingue_inseridos
+        resultado = ResultadoLote(
+            numero=len(self.lotes) + 1,
+            gravados=gravados,
+            inseridos=inseridos if distingue else None,
+            atualizados=gravados - inseridos if distingue else None,
+            # duplicadas entre lotes também são descartadas pelo DISTINCT ON
+            ignorados=self._ignorados_total + (self.copiados - gravados),
+        )
+        self.lotes.append(resultado)
+        if self.on_batch:
+            self.on_batch(resultado)
+        return self.totais()
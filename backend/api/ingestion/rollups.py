@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# Rollups das tabelas de consumo (ConsumoDiarioMeter, ConsumoDiarioProjeto, ConsumoCiclo).
+# Só os períodos do rollup tocados pelo que acabou de ser gravado são recalculados: os dias
+# inteiros (no fuso de settings.TIME_ZONE) entre o início e o fim da janela, ou os ciclos de
+# faturamento com linhas no período. As linhas do rollup nesses períodos são apagadas e
+# regravadas a partir da tabela de origem, então um dia da borda continua completo.
+#   - diários: pelo loader do fetch_ipu_data, na mesma transação da carga da janela;
+#   - por ciclo: uma vez por configuração, no fim da execução (um ciclo atravessa várias janelas).
+# No PostgreSQL, advisory locks por dia (ou por configuração, no ciclo) fazem uma carga esperar o
+# commit de outra que recalcula o mesmo período; janelas paralelas sem dias em comum não esperam.
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.db import connections, models, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.models import ConsumoAsset, ConsumoCiclo, ConsumoDiarioMeter, ConsumoDiarioProjeto, ConsumoSummary
+
+from .bulk import BulkUpserter
+
+# Prefixo das anotações da agregação (não podem ter o nome de um campo da origem)
+_PREFIXO = 'r_'
+
+
+def dia_local(momento):
+    return timezone.localtime(momento).date() if timezone.is_aware(momento) else momento.date()
+
+
+def inicio_do_dia(dia):
+    return datetime.combine(dia, dt_time.min, tzinfo=timezone.get_default_timezone())
+
+
+class Rollup:
+    # Agrega a origem por configuração, dia de campo_data e grupos. somas/maximos: campo do
+    # rollup -> campo da origem.
+    def __init__(self, nome, model, origem, campo_data, grupos, somas, maximos=None):
+        self.nome = nome
+        self.model = model
+        self.origem = origem
+        self.campo_data = campo_data
+        self.grupos = tuple(grupos)
+        self.somas = dict(somas)
+        self.maximos = dict(maximos or {})
+
+    def _periodo(self):
+        # Campos do rollup que identificam o período -> expressão sobre a origem
+        return {'dia': TruncDate(self.campo_data, tzinfo=timezone.get_default_timezone())}
+
+    def _campos_chave(self):
+        return ('configuracao_id', *self._periodo(), *self.grupos)
+
+    def _agregar(self, filtro, using):
+        periodo = self._periodo()
+        agregados = {'linhas': Count('pk')}
+        agregados.update({campo: Sum(origem) for campo, origem in self.somas.items()})
+        agregados.update({campo: Max(origem) for campo, origem in self.maximos.items()})
+        consulta = (
+            self.origem._base_manager.using(using).filter(filtro)
+            .annotate(**{_PREFIXO + campo: expressao for campo, expressao in periodo.items()})
+            .exclude(**{f'{_PREFIXO}{campo}__isnull': True for campo in periodo})
+            .values('configuracao_id', *(_PREFIXO + campo for campo in periodo), *self.grupos)
+            .annotate(**{_PREFIXO + campo: agregado for campo, agregado in agregados.items()})
+            .order_by()
+        )
+        for linha in consulta.iterator():
+            yield {nome[len(_PREFIXO):] if nome.startswith(_PREFIXO) else nome: valor for nome, valor in linha.items()}
+
+    def _chaves_bloqueio(self, config, inicio, fim):
+        dia, ultimo = dia_local(inicio), dia_local(fim)
+        while dia <= ultimo:
+            yield f"{self.model._meta.db_table}:{config.pk}:{dia:%Y-%m-%d}"
+            dia += timedelta(days=1)
+
+    def _bloquear(self, chaves, using):
+        # Sempre na mesma ordem, para duas cargas não travarem uma à outra
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for chave in sorted(chaves):
+                    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [chave])
+
+    def _regravar(self, filtro_origem, filtro_rollup, using):
+        # Retorna (linhas do rollup apagadas, linhas gravadas)
+        apagadas, _ = self.model._base_manager.using(using).filter(filtro_rollup).delete()
+        upserter = BulkUpserter(self.model, using=using)
+        for linha in self._agregar(filtro_origem, using):
+            linha['configuracao'] = linha.pop('configuracao_id')
+            upserter.add(linha)
+        return apagadas, upserter.finish().gravados
+
+    def _filtros_janela(self, config, inicio, fim, using):
+        primeiro, ultimo = dia_local(inicio), dia_local(fim)
+        filtro_origem = Q(configuracao=config, **{
+            f'{self.campo_data}__gte': inicio_do_dia(primeiro),
+            f'{self.campo_data}__lt': inicio_do_dia(ultimo + timedelta(days=1)),
+        })
+        return filtro_origem, Q(configuracao=config, dia__gte=primeiro, dia__lte=ultimo)
+
+    def atualizar(self, config, inicio, fim, using='default'):
+        # Recalcula os períodos tocados pela janela [inicio, fim]; deve rodar dentro da transação da carga
+        with transaction.atomic(using=using):
+            self._bloquear(self._chaves_bloqueio(config, inicio, fim), using)
+            return self._regravar(*self._filtros_janela(config, inicio, fim, using), using)
+
+    def reconstruir(self, config, using='default'):
+        with transaction.atomic(using=using):
+            connection = connections[using]
+            if connection.vendor == 'postgresql':
+                # Espera as cargas em andamento (e as bloqueia até o fim) em vez de um lock por dia
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LOCK TABLE {connection.ops.quote_name(self.model._meta.db_table)} IN SHARE ROW EXCLUSIVE MODE")
+            return self._regravar(Q(configuracao=config), Q(configuracao=config), using)
+
+    def _normalizador(self, campo):
+        field = self.model._meta.get_field(campo)
+        if isinstance(field, models.DecimalField):
+            quantum = Decimal(1).scaleb(-field.decimal_places)
+            return lambda valor: None if valor is None else Decimal(valor).quantize(quantum)
+        return lambda valor: valor
+
+    def verificar(self, config, using='default'):
+        # Compara o rollup gravado com a agregação da origem.
+        # Retorna {'faltando': n, 'sobrando': n, 'divergentes': n, 'exemplos': [...]}.
+        chave = self._campos_chave()
+        valores = ['linhas', *self.somas, *self.maximos]
+        normalizadores = {campo: self._normalizador(campo) for campo in valores}
+
+        def indexar(linhas):
+            return {
+                tuple(linha[campo] for campo in chave): {campo: normalizadores[campo](linha[campo]) for campo in valores}
+                for linha in linhas
+            }
+        esperado = indexar(self._agregar(Q(configuracao=config), using))
+        gravado = indexar(self.model._base_manager.using(using).filter(configuracao=config).values(*chave, *valores).iterator())
+        resultado = {'faltando': 0, 'sobrando': 0, 'divergentes': 0, 'exemplos': []}
+        for linha_chave in esperado.keys() | gravado.keys():
+            if linha_chave not in gravado:
+                tipo = 'faltando'
+            elif linha_chave not in esperado:
+                tipo = 'sobrando'
+            elif esperado[linha_chave] != gravado[linha_chave]:
+                tipo = 'divergentes'
+            else:
+                continue
+            resultado[tipo] += 1
+            if len(resultado['exemplos']) < 5:
+                resultado['exemplos'].append((tipo, linha_chave, esperado.get(linha_chave), gravado.get(linha_chave)))
+        return resultado
+
+
+class RollupCiclo(Rollup):
+    # O período é o ciclo de faturamento da linha (billing_period_start_date/end_date)
+    def __init__(self, nome, model, origem, campo_data, somas):
+        super().__init__(nome, model, origem, campo_data, (), somas)
+
+    def _chaves_bloqueio(self, config, inicio, fim):
+        return [f"{self.model._meta.db_table}:{config.pk}"]
+
+    def _periodo(self):
+        fuso = timezone.get_default_timezone()
+        return {campo: TruncDate(campo, tzinfo=fuso) for campo in ('billing_period_start_date', 'billing_period_end_date')}
+
+    def _filtros_janela(self, config, inicio, fim, using):
+        # Ciclos com linhas na janela e ciclos do rollup que a cruzam (as linhas da janela podem
+        # ter mudado de ciclo na nova carga)
+        filtro_dias, _ = super()._filtros_janela(config, inicio, fim, using)
+        periodo = self._periodo()
+        ciclos = set(
+            self.origem._base_manager.using(using).filter(filtro_dias)
+            .annotate(**{_PREFIXO + campo: expressao for campo, expressao in periodo.items()})
+            .exclude(**{f'{_PREFIXO}{campo}__isnull': True for campo in periodo})
+            .values_list(*(_PREFIXO + campo for campo in periodo)).distinct().order_by()
+        )
+        ciclos |= set(
+            self.model._base_manager.using(using)
+            .filter(configuracao=config, billing_period_start_date__lte=dia_local(fim), billing_period_end_date__gte=dia_local(inicio))
+            .values_list('billing_period_start_date', 'billing_period_end_date')
+        )
+        filtro_origem, filtro_rollup = Q(pk__in=[]), Q(pk__in=[])
+        for inicio_ciclo, fim_ciclo in ciclos:
+            filtro_origem |= Q(
+                billing_period_start_date__gte=inicio_do_dia(inicio_ciclo), billing_period_start_date__lt=inicio_do_dia(inicio_ciclo + timedelta(days=1)),
+                billing_period_end_date__gte=inicio_do_dia(fim_ciclo), billing_period_end_date__lt=inicio_do_dia(fim_ciclo + timedelta(days=1)),
+            )
+            filtro_rollup |= Q(billing_period_start_date=inicio_ciclo, billing_period_end_date=fim_ciclo)
+        return Q(configuracao=config) & filtro_origem, Q(configuracao=config) & filtro_rollup
+
+
+DIARIO_METER = Rollup(
+    'DIARIO_METER', ConsumoDiarioMeter, ConsumoSummary, 'consumption_date', grupos=('meter_id',),
+    somas={'meter_usage': 'meter_usage', 'consumption_ipu': 'consumption_ipu'}, maximos={'meter_name': 'meter_name'},
+)
+DIARIO_PROJETO = Rollup(
+    'DIARIO_PROJETO', ConsumoDiarioProjeto, ConsumoAsset, 'consumption_date', grupos=('project_name', 'folder_name'),
+    somas={'usage': 'usage', 'consumption_ipu': 'consumption_ipu'},
+)
+CICLO = RollupCiclo('CICLO', ConsumoCiclo, ConsumoSummary, 'consumption_date', somas={'consumption_ipu': 'consumption_ipu'})
+
+ROLLUPS = {rollup.nome: rollup for rollup in (DIARIO_METER, DIARIO_PROJETO, CICLO)}
+# Exportação carregada -> rollups recalculados na transação da carga da janela
+ROLLUPS_POR_EXPORTACAO = {
+    'SUMMARY': (DIARIO_METER,),
+    'ASSET': (DIARIO_PROJETO,),
+}
+# Recalculados uma vez por configuração, para o período das janelas carregadas na execução
+ROLLUPS_POR_CONFIGURACAO = (CICLO,)
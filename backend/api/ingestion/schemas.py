@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# Registro declarativo dos tipos de exportação da IICS.
+# Cada ExportSpec descreve, para um CSV, qual cabeçalho alimenta qual campo do modelo, com que
+# tipo e se a coluna faz parte da chave. No momento da carga a spec é compilada contra o
+# cabeçalho real do arquivo em um mapeador por índice de coluna (csv.reader), validando o
+# cabeçalho uma única vez. Um novo tipo de exportação só precisa de uma nova spec aqui.
+from datetime import datetime
+from decimal import Decimal
+
+from api.models import (
+    ConsumoSummary,
+    ConsumoProjectFolder,
+    ConsumoAsset,
+    ConsumoCdiJobExecucao,
+    ConsumoCaiAssetSumario,
+)
+from .converters import criar_conversor
+
+
+class Coluna:
+    def __init__(self, header, field, tipo=str, chave=False, obrigatoria=False):
+        self.header = header
+        self.field = field
+        self.tipo = tipo
+        self.chave = chave
+        # Linhas com valor nulo em uma coluna obrigatória são descartadas
+        self.obrigatoria = obrigatoria
+
+
+class CabecalhoInvalido(ValueError):
+    pass
+
+
+class MapeadorLinhas:
+    def __init__(self, campos, extratores, obrigatorias, template, largura, ausentes, campos_chave):
+        self.campos = campos
+        self.campos_chave = campos_chave
+        self._extratores = extratores
+        self._obrigatorias = obrigatorias
+        self._template = template
+        self._largura = largura
+        self.colunas_ausentes = ausentes
+
+    def __call__(self, linha):
+        # Retorna a tupla de valores na ordem de self.campos, ou None se a chave tiver nulos
+        if len(linha) < self._largura:
+            linha = linha + [None] * (self._largura - len(linha))
+        valores = list(self._template)
+        for posicao, indice, conversor in self._extratores:
+            valores[posicao] = conversor(linha[indice])
+        for posicao in self._obrigatorias:
+            if valores[posicao] is None:
+                return None
+        return tuple(valores)
+
+    def chave(self, linha):
+        # Usado apenas nas mensagens de linhas descartadas
+        valores = {}
+        for posicao, indice, conversor in self._extratores:
+            campo = self.campos[posicao]
+            if campo in self.campos_chave:
+                valores[campo] = conversor(linha[indice]) if indice < len(linha) else None
+        return valores
+
+
+class ExportSpec:
+    def __init__(self, nome, model, colunas, rotulo, campo_inicio, campo_fim=None, campos_meter=()):
+        self.nome = nome
+        self.model = model
+        self.colunas = colunas
+        self.rotulo = rotulo
+        # A janela apagada antes da carga: campo_inicio >= início e campo_fim <= fim
+        self.campo_inicio = campo_inicio
+        self.campo_fim = campo_fim or campo_inicio
+        # Campos preenchidos com o meterId da exportação; também restringem a deleção
+        self.campos_meter = campos_meter
+        self.campos_chave = {c.field for c in colunas if c.chave}
+
+    @property
+    def por_meter(self):
+        return bool(self.campos_meter)
+
+    def filtro_delecao(self, config, start_date_obj, end_date_obj, meter_id=None):
+        filtro = {'configuracao': config, f'{self.campo_inicio}__gte': start_date_obj, f'{self.campo_fim}__lte': end_date_obj}
+        if self.por_meter:
+            filtro['meter_id'] = meter_id
+        return filtro
+
+    def delete_query_log(self, config, start_date_obj, end_date_obj, meter_id=None):
+        opts = self.model._meta
+        coluna_inicio = opts.get_field(self.campo_inicio).column
+        coluna_fim = opts.get_field(self.campo_fim).column
+        query = (
+            f'DELETE FROM "public"."{opts.db_table}" WHERE "configuracao_id" = {config.id} '
+            f'AND "{coluna_inicio}" >= \'{start_date_obj.isoformat()}\' AND "{coluna_fim}" <= \'{end_date_obj.isoformat()}\''
+        )
+        if self.por_meter:
+            query += f' AND "meter_id" = \'{meter_id}\''
+        return query + ';'
+
+    def constantes(self, config, execution_timestamp, meter_id=None):
+        valores = {'configuracao': config.pk, 'data_extracao': execution_timestamp}
+        for campo in self.campos_meter:
+            valores[campo] = meter_id
+        return valores
+
+    def resolver_colunas(self, header):
+        # Valida o cabeçalho e retorna [(coluna, índice no arquivo)] e a lista de colunas ausentes
+        indices = {nome.strip(): i for i, nome in enumerate(header)}
+        presentes, ausentes = [], []
+        for coluna in self.colunas:
+            indice = indices.get(coluna.header)
+            if indice is None:
+                if coluna.obrigatoria:
+                    raise CabecalhoInvalido(f"Coluna obrigatória '{coluna.header}' ausente no cabeçalho do arquivo {self.nome}.")
+                ausentes.append(coluna.header)
+                continue
+            presentes.append((coluna, indice))
+        return presentes, ausentes
+
+    def compilar(self, header, campos, constantes, tz):
+        posicoes = {campo: i for i, campo in enumerate(campos)}
+        template = [constantes.get(campo) for campo in campos]
+        extratores, obrigatorias = [], []
+        presentes, ausentes = self.resolver_colunas(header)
+        for coluna, indice in presentes:
+            posicao = posicoes[coluna.field]
+            extratores.append((posicao, indice, criar_conversor(coluna.tipo, tz)))
+            if coluna.obrigatoria:
+                obrigatorias.append(posicao)
+        return MapeadorLinhas(campos, extratores, obrigatorias, template, len(header), ausentes, self.campos_chave)
+
+
+class ColetorMeters:
+    # Descobre os meters CDI/CAI na mesma leitura do arquivo de ASSET
+    ALLOWED_METER_NAMES = {"Application Integration", "Application Integration with Advanced Serverless", "Data Integration", "Data Integration with Advanced Serverless"}
+
+    def __init__(self):
+        self.meters = {}
+        self._indice_nome = self._indice_id = None
+
+    def iniciar(self, header):
+        indices = {nome.strip(): i for i, nome in enumerate(header)}
+        self._indice_nome = indices.get('Meter Name')
+        self._indice_id = indices.get('Meter ID')
+
+    def observar_lote(self, df):
+        # Equivalente vetorizado de __call__ para o motor pandas
+        if 'Meter Name' not in df.columns or 'Meter ID' not in df.columns:
+            return
+        pares = df[['Meter Name', 'Meter ID']].drop_duplicates()
+        for meter_name, meter_id in pares.itertuples(index=False):
+            if meter_name in self.ALLOWED_METER_NAMES and meter_id:
+                self.meters[meter_id] = meter_name
+
+    def __call__(self, linha):
+        if self._indice_nome is None or self._indice_id is None or max(self._indice_nome, self._indice_id) >= len(linha):
+            return
+        meter_name, meter_id = linha[self._indice_nome], linha[self._indice_id]
+        if meter_name in self.ALLOWED_METER_NAMES and meter_id:
+            self.meters[meter_id] = meter_name
+
+
+SUMMARY = ExportSpec('SUMMARY', ConsumoSummary, rotulo='SUMMARY', campo_inicio='consumption_date', colunas=[
+    Coluna('OrgId', 'org_id', chave=True, obrigatoria=True),
+    Coluna('MeterId', 'meter_id', chave=True, obrigatoria=True),
+    Coluna('Date', 'consumption_date', datetime, chave=True, obrigatoria=True),
+    Coluna('MeterName', 'meter_name'),
+    Coluna('BillingPeriodStartDate', 'billing_period_start_date', datetime),
+    Coluna('BillingPeriodEndDate', 'billing_period_end_date', datetime),
+    Coluna('MeterUsage', 'meter_usage', Decimal),
+    Coluna('IPU', 'consumption_ipu', Decimal),
+    Coluna('Scalar', 'scalar'),
+    Coluna('MetricCategory', 'metric_category'),
+    Coluna('OrgName', 'org_name'),
+    Coluna('OrgType', 'org_type'),
+    Coluna('IPURate', 'ipu_rate', Decimal),
+])
+
+PROJECT_FOLDER = ExportSpec('PROJECT_FOLDER', ConsumoProjectFolder, rotulo='PROJECT_FOLDER', campo_inicio='consumption_date', colunas=[
+    Coluna('Date', 'consumption_date', datetime, chave=True, obrigatoria=True),
+    Coluna('Project', 'project_name', chave=True),
+    Coluna('Folder', 'folder_path', chave=True),
+    Coluna('Org ID', 'org_id', chave=True, obrigatoria=True),
+    Coluna('Org Type', 'org_type'),
+    Coluna('Consumption (IPUs)', 'total_consumption_ipu', Decimal),
+])
+
+ASSET = ExportSpec('ASSET', ConsumoAsset, rotulo='ASSET', campo_inicio='consumption_date', colunas=[
+    Coluna('Meter ID', 'meter_id', chave=True, obrigatoria=True),
+    Coluna('Date', 'consumption_date', datetime, chave=True, obrigatoria=True),
+    Coluna('Asset Name', 'asset_name', chave=True),
+    Coluna('Asset Type', 'asset_type', chave=True),
+    Coluna('Project', 'project_name', chave=True),
+    Coluna('Folder', 'folder_name', chave=True),
+    Coluna('Org ID', 'org_id', chave=True, obrigatoria=True),
+    Coluna('Environment Name', 'runtime_environment', chave=True),
+    Coluna('Tier', 'tier', chave=True),
+    Coluna('IPU Per Unit', 'ipu_per_unit', Decimal, chave=True),
+    Coluna('Meter Name', 'meter_name'),
+    Coluna('Org Type', 'org_type'),
+    Coluna('Environment Type', 'environment_type'),
+    Coluna('Usage', 'usage', Decimal),
+    Coluna('Consumption (IPUs)', 'consumption_ipu', Decimal),
+])
+
+CDI_JOB = ExportSpec('CDI_JOB', ConsumoCdiJobExecucao, rotulo='JOB (CDI)', campo_inicio='start_time', campo_fim='end_time', campos_meter=('meter_id', 'meter_id_ref'), colunas=[
+    Coluna('Task ID', 'task_id', chave=True, obrigatoria=True),
+    Coluna('Task Run ID', 'task_run_id', chave=True, obrigatoria=True),
+    Coluna('Org ID', 'org_id', chave=True, obrigatoria=True),
+    Coluna('Environment ID', 'environment_id', chave=True, obrigatoria=True),
+    Coluna('Start Time', 'start_time', datetime, chave=True, obrigatoria=True),
+    Coluna('End Time', 'end_time', datetime, chave=True, obrigatoria=True),
+    Coluna('Task Name', 'task_name'),
+    Coluna('Task Object Name', 'task_object_name'),
+    Coluna('Task Type', 'task_type'),
+    Coluna('Project Name', 'project_name'),
+    Coluna('Folder Name', 'folder_name'),
+    Coluna('Environment', 'environment_name'),
+    Coluna('Cores Used', 'cores_used', Decimal),
+    Coluna('Status', 'status'),
+    Coluna('Metered Value', 'metered_value_ipu', Decimal),
+    Coluna('Audit Time', 'audit_time', datetime),
+    Coluna('OBM Task Time(s)', 'obm_task_time_seconds', int),
+])
+
+CAI_SUMMARY = ExportSpec('CAI_SUMMARY', ConsumoCaiAssetSumario, rotulo='JOB (CAI)', campo_inicio='execution_date', campos_meter=('meter_id',), colunas=[
+    Coluna('Org ID', 'org_id', chave=True, obrigatoria=True),
+    Coluna('Executed asset', 'executed_asset', chave=True, obrigatoria=True),
+    Coluna('Date (in UTC)', 'execution_date', datetime, chave=True, obrigatoria=True),
+    Coluna('Execution env', 'execution_env', chave=True, obrigatoria=True),
+    Coluna('status', 'status', chave=True, obrigatoria=True),
+    Coluna('Invoked by', 'invoked_by', chave=True, obrigatoria=True),
+    Coluna('Execution type', 'execution_type'),
+    Coluna('Execution count', 'execution_count', int),
+    Coluna('Total Execution time (in hours)', 'total_execution_time_hours', Decimal),
+    Coluna('Average Execution time (in seconds)', 'avg_execution_time_seconds', Decimal),
+])
+
+EXPORT_SPECS = {spec.nome: spec for spec in (SUMMARY, PROJECT_FOLDER, ASSET, CDI_JOB, CAI_SUMMARY)}
+
+# Exportações por meterId (ExportServiceJobLevelMeteringData) e a spec que carrega cada uma
+METER_SPECS = {
+    "a2nB20h1o0lc7k3P9xtWS8": CDI_JOB,
+    "bN6mes5n4GGciiMkuoDlCz": CAI_SUMMARY,
+    "3uIRkIV5Rt9lBbAPzeR5Kj": CAI_SUMMARY,
+}
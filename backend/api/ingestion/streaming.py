@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Leitura dos CSVs de exportação direto do ZIP baixado, sem extrair arquivos em disco.
+import io
+import os
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+# Acima deste tamanho o buffer do download passa da memória para um arquivo temporário anônimo
+SPOOL_MAX_BYTES = 64 * 1024 * 1024
+
+
+def criar_buffer_download(max_bytes=SPOOL_MAX_BYTES):
+    # O diretório central do ZIP fica no final do arquivo, então o conteúdo precisa
+    # ser pesquisável (seek) antes de abrir o CSV; o spool mantém a memória limitada.
+    return tempfile.SpooledTemporaryFile(max_size=max_bytes)
+
+
+@contextmanager
+def abrir_csv(origem):
+    # Aceita o caminho de um CSV extraído ou um stream de texto já aberto
+    if isinstance(origem, (str, os.PathLike)):
+        with open(origem, mode='r', encoding='utf-8', newline='') as infile:
+            yield infile
+    else:
+        yield origem
+
+
+@contextmanager
+def abrir_csv_do_zip(arquivo_zip):
+    with zipfile.ZipFile(arquivo_zip, 'r') as zip_ref:
+        csv_name = next((name for name in zip_ref.namelist() if name.lower().endswith('.csv')), None)
+        if csv_name is None:
+            raise ValueError("Nenhum arquivo CSV encontrado no zip.")
+        with zip_ref.open(csv_name) as membro:
+            texto = io.TextIOWrapper(membro, encoding='utf-8', newline='')
+            try:
+                yield texto
+            finally:
+                texto.detach()
+
+
+def nome_origem(origem):
+    return getattr(origem, 'name', origem)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from api.ingestion.converters import criar_conversor
+from api.management.commands.fetch_ipu_data import Command as FetchCommand
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark da conversão de células: Command._safe_cast x api.ingestion.converters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Quantidade de valores por cenário.')
+
+    def _cenarios(self, rows):
+        base = datetime(2025, 8, 1, 8, 0, 0)
+        datas = [(base + timedelta(days=i % 30)).strftime('%Y-%m-%d') for i in range(rows)]
+        return [
+            ("Date (SUMMARY/ASSET, poucos valores)", datetime, datas),
+            ("Start Time (CDI, ISO com Z)", datetime, [(base + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%S.000Z') for i in range(rows)]),
+            ("Audit Time (CDI, sem fuso)", datetime, [(base + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S') for i in range(rows)]),
+            ("Decimal (IPU)", Decimal, [f"{i % 997}.{i % 1000:03d}" for i in range(rows)]),
+            ("Inteiro (OBM Task Time)", int, [str(i % 5000) for i in range(rows)]),
+            ("Nulos", Decimal, ['null' if i % 2 else '' for i in range(rows)]),
+        ]
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        fetch_command = FetchCommand()
+        tz = FetchCommand.SAO_PAULO_TZ
+        self.stdout.write(f"{'Cenário':<40} {'_safe_cast (µs)':>16} {'conversor (µs)':>16} {'ganho':>8}")
+        for nome, tipo, valores in self._cenarios(rows):
+            inicio = time.perf_counter()
+            esperado = [fetch_command._safe_cast(v, tipo) for v in valores]
+            tempo_antigo = time.perf_counter() - inicio
+
+            conversor = criar_conversor(tipo, tz)
+            inicio = time.perf_counter()
+            obtido = [conversor(v) for v in valores]
+            tempo_novo = time.perf_counter() - inicio
+
+            if obtido != esperado:
+                divergentes = sum(1 for a, b in zip(esperado, obtido) if a != b)
+                self.stderr.write(self.style.ERROR(f"{nome}: {divergentes} valores divergentes entre as implementações."))
+            ganho = tempo_antigo / tempo_novo if tempo_novo else float('inf')
+            self.stdout.write(f"{nome:<40} {tempo_antigo / rows * 1e6:>16.2f} {tempo_novo / rows * 1e6:>16.2f} {ganho:>7.1f}x")
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from api.benchmarks.fake_iics import ConfiguracaoFake, ServidorFakeIICS
+from api.extraction.poller import poller_compartilhado
+from api.extraction.scheduler import MAX_CONFIGS_POR_POD_PADRAO, MAX_WORKERS_PADRAO
+from api.management.commands.fetch_ipu_data import Command as FetchCommand
+from api.models import Clientes, ConfiguracaoIDMC, ExtracaoLog, SpanExtracao
+
+EMAIL_CLIENTE = 'benchmark-e2e@example.com'
+
+
+class Command(BaseCommand):
+    help = 'Roda o fetch_ipu_data completo contra servidores IICS fake para N tenants e mede tempo total, espera por status e chamadas à API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', type=int, default=4, help='Quantidade de configurações fake.')
+        parser.add_argument('--pods', type=int, default=2, help='Servidores fake (pods) entre os quais os tenants são distribuídos.')
+        parser.add_argument('--days', type=int, default=7, help='Dias de extração pendentes em cada tenant (mais de 30 gera vários lotes).')
+        parser.add_argument('--rows', type=int, default=2000, help='Linhas de cada CSV exportado pelos servidores fake.')
+        parser.add_argument('--job-latency', type=float, nargs=2, default=(2.0, 6.0), metavar=('MIN', 'MAX'))
+        parser.add_argument('--job-failure-rate', type=float, default=0.0)
+        parser.add_argument('--status-error-rate', type=float, default=0.0)
+        parser.add_argument('--http-latency', type=float, default=0.0)
+        parser.add_argument('--download-cut-rate', type=float, default=0.0)
+        parser.add_argument('--session-ttl', type=float, help='Segundos até a sessão fake expirar (força o novo login no meio da extração).')
+        parser.add_argument('--no-export-cache', action='store_true', help='Repassa --no-export-cache ao fetch_ipu_data (cada execução cria todos os jobs de novo).')
+        parser.add_argument('--orchestrator', choices=FetchCommand.ORCHESTRATORS, default='async')
+        parser.add_argument('--max-workers', type=int, default=MAX_WORKERS_PADRAO)
+        parser.add_argument('--max-configs-per-pod', type=int, default=MAX_CONFIGS_POR_POD_PADRAO)
+        parser.add_argument('--max-jobs-per-pod', type=int, default=FetchCommand.max_jobs_per_pod)
+        parser.add_argument('--sem-streaming', action='store_true', help='Usa downloads em disco em vez de --stream-exports.')
+        parser.add_argument('--cleanup', action='store_true', help='Apaga o cliente e os tenants fake no final (por padrão ficam, com o histórico de durações).')
+        parser.add_argument('--output', help='Salva o relatório em JSON.')
+
+    def _tenants(self, quantidade, servidores, dias):
+        cliente, _ = Clientes.objects.get_or_create(
+            email_contato=EMAIL_CLIENTE,
+            defaults={'nome_cliente': 'Benchmark E2E', 'qnt_ipus_contratadas': 0, 'preco_por_ipu': 0},
+        )
+        marcador = timezone.now() - timedelta(days=dias)
+        tenants = []
+        for i in range(quantidade):
+            servidor = servidores[i % len(servidores)]
+            config, _ = ConfiguracaoIDMC.objects.update_or_create(
+                cliente=cliente, apelido_configuracao=f"fake-tenant-{i:03d}",
+                defaults={'iics_pod_url': servidor.url, 'iics_username': f'usuario{i}', 'iics_password': 'senha', 'ativo': True, 'ultima_extracao_enddate': marcador},
+            )
+            tenants.append(config)
+        return cliente, tenants
+
+    def _validar(self, options):
+        for opcao in ('tenants', 'pods', 'days', 'rows', 'max_workers', 'max_configs_per_pod', 'max_jobs_per_pod'):
+            if options[opcao] < 1:
+                raise CommandError(f"--{opcao.replace('_', '-')} deve ser maior ou igual a 1.")
+
+    def handle(self, *args, **options):
+        self._validar(options)
+        config_fake = ConfiguracaoFake(
+            latencia_job=tuple(options['job_latency']),
+            taxa_falha_job=options['job_failure_rate'],
+            taxa_erro_status=options['status_error_rate'],
+            latencia_http=options['http_latency'],
+            taxa_corte_download=options['download_cut_rate'],
+            duracao_sessao=options['session_ttl'],
+            linhas_padrao=options['rows'],
+        )
+        servidores = [ServidorFakeIICS(config_fake).iniciar() for _ in range(options['pods'])]
+        try:
+            cliente, tenants = self._tenants(options['tenants'], servidores, options['days'])
+            ids = [config.pk for config in tenants]
+            poller = poller_compartilhado()
+            consultas_antes = poller.consultas_realizadas
+            saida = io.StringIO()
+            self.stdout.write(f"Executando fetch_ipu_data para {len(ids)} tenants em {len(servidores)} pods fake ({options['orchestrator']})...")
+            inicio_execucao = timezone.now()
+            inicio = time.perf_counter()
+            call_command(
+                'fetch_ipu_data', config_id=ids, orchestrator=options['orchestrator'], max_workers=options['max_workers'],
+                max_configs_per_pod=options['max_configs_per_pod'], max_jobs_per_pod=options['max_jobs_per_pod'],
+                stream_exports=not options['sem_streaming'], no_export_cache=options['no_export_cache'], metrics_textfile='', stdout=saida, stderr=saida,
+            )
+            total = time.perf_counter() - inicio
+            relatorio = self._relatorio(ids, inicio_execucao, total, servidores, poller.consultas_realizadas - consultas_antes, options)
+        finally:
+            for servidor in servidores:
+                servidor.parar()
+        self._imprimir(relatorio)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(relatorio, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Relatório salvo em {options['output']}"))
+        if options['cleanup']:
+            SpanExtracao.objects.filter(execucao_id__in=relatorio['execucoes']).delete()
+            cliente.delete()
+
+    def _relatorio(self, ids, inicio_execucao, total, servidores, consultas_poller, options):
+        spans = SpanExtracao.objects.filter(configuracao_id__in=ids, inicio__gte=inicio_execucao)
+        espera = spans.filter(nome='aguardar_job').aggregate(total=Sum('duracao_segundos'), maxima=Max('duracao_segundos'), jobs=Count('id'))
+        por_etapa = {
+            linha['nome']: {'spans': linha['quantidade'], 'segundos': linha['segundos']}
+            for linha in spans.values('nome').annotate(quantidade=Count('id'), segundos=Sum('duracao_segundos'))
+        }
+        chamadas = Counter()
+        for servidor in servidores:
+            chamadas.update(servidor.chamadas)
+        # Linhas lidas pelos loaders nesta execução (os tenants fake são reaproveitados entre execuções)
+        linhas = {
+            linha['tipo_exportacao']: linha['linhas'] or 0
+            for linha in spans.filter(nome='carga').values('tipo_exportacao').annotate(linhas=Sum('linhas')).order_by('tipo_exportacao')
+        }
+        falhas = ExtracaoLog.objects.filter(configuracao_id__in=ids, timestamp__gte=inicio_execucao, status='FAILED').count()
+        return {
+            'parametros': {chave: options[chave] for chave in ('tenants', 'pods', 'days', 'rows', 'job_latency', 'job_failure_rate', 'status_error_rate', 'http_latency', 'download_cut_rate', 'no_export_cache', 'orchestrator', 'max_workers', 'max_configs_per_pod', 'max_jobs_per_pod')},
+            'segundos_total': total,
+            'jobs': espera['jobs'] or 0,
+            'espera_status_segundos_total': espera['total'] or 0,
+            'espera_status_segundos_maxima': espera['maxima'] or 0,
+            'consultas_status_poller': consultas_poller,
+            'chamadas_api': dict(chamadas),
+            'etapas': por_etapa,
+            'linhas_processadas': linhas,
+            'logs_com_falha': falhas,
+            'execucoes': list(SpanExtracao.objects.filter(configuracao_id__in=ids, inicio__gte=inicio_execucao).values_list('execucao_id', flat=True).distinct()),
+        }
+
+    def _imprimir(self, relatorio):
+        self.stdout.write(self.style.SUCCESS(f"\nTempo total (parede): {relatorio['segundos_total']:.1f}s"))
+        jobs = relatorio['jobs']
+        media = relatorio['espera_status_segundos_total'] / jobs if jobs else 0
+        self.stdout.write(f"Jobs acompanhados: {jobs}; espera por status somada {relatorio['espera_status_segundos_total']:.1f}s (média {media:.1f}s, máxima {relatorio['espera_status_segundos_maxima']:.1f}s)")
+        self.stdout.write(f"Consultas de status feitas pelo poller: {relatorio['consultas_status_poller']}")
+        self.stdout.write(f"Chamadas à API fake: {', '.join(f'{rota}={n}' for rota, n in sorted(relatorio['chamadas_api'].items()))}")
+        self.stdout.write("Tempo somado por etapa:")
+        for nome, dados in sorted(relatorio['etapas'].items(), key=lambda item: -(item[1]['segundos'] or 0)):
+            self.stdout.write(f"  {nome:<20} {dados['spans']:>6} spans {dados['segundos'] or 0:>10.1f}s")
+        self.stdout.write(f"Linhas processadas: {', '.join(f'{tipo}={n}' for tipo, n in relatorio['linhas_processadas'].items())}")
+        if relatorio['logs_com_falha']:
+            self.stdout.write(self.style.WARNING(f"Logs de extração com falha: {relatorio['logs_com_falha']}"))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.benchmarks.synthetic import escrever_csv
+from api.extraction import logs
+from api.ingestion.pandas_engine import pandas_disponivel
+from api.ingestion.pg_copy import serializar_colunas, serializar_linhas
+from api.ingestion.schemas import EXPORT_SPECS
+from api.ingestion.streaming import abrir_csv
+from api.management.commands.fetch_ipu_data import Command as FetchCommand
+from api.models import Clientes, ConfiguracaoIDMC
+
+
+class ContadorLinhas:
+    # Writer que apenas conta as linhas; isola o custo de leitura/conversão do custo do banco
+    def __init__(self, model):
+        self.field_names = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+        self.gravadas = 0
+        self.ignoradas = 0
+
+    def constantes_automaticas(self):
+        return {}
+
+    def add_valores(self, valores):
+        self.gravadas += 1
+
+    def skip(self, quantidade=1):
+        self.ignoradas += quantidade
+
+    def finish(self):
+        pass
+
+
+class ContadorCopy(ContadorLinhas):
+    # Além de contar, gera o CSV que seria enviado ao COPY (modo copy sem banco)
+    def __init__(self, model, batch_size):
+        super().__init__(model)
+        self.batch_size = batch_size
+        self._linhas = []
+        self.bytes = 0
+
+    def add_valores(self, valores):
+        self._linhas.append(valores)
+        if len(self._linhas) >= self.batch_size:
+            self.finish()
+
+    def copiar_colunas(self, df):
+        self.gravadas += len(df)
+        buffer, _ = serializar_colunas(df, self.gravadas)
+        self.bytes += len(buffer.getvalue())
+
+    def finish(self):
+        if self._linhas:
+            self.bytes += len(serializar_linhas(self._linhas, self.gravadas).getvalue())
+            self.gravadas += len(self._linhas)
+            self._linhas = []
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de linhas/s da ingestão: caminho linha a linha (python) x motor colunar (pandas).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Linhas do CSV sintético.')
+        parser.add_argument('--export-type', default='CDI_JOB', choices=sorted(EXPORT_SPECS), help='Tipo de exportação simulado.')
+        parser.add_argument('--engines', nargs='+', default=list(FetchCommand.PARSER_ENGINES), choices=FetchCommand.PARSER_ENGINES)
+        parser.add_argument('--loader-mode', default='orm', choices=FetchCommand.LOADER_MODES)
+        parser.add_argument('--batch-size', type=int, default=FetchCommand.batch_size)
+        parser.add_argument('--null-rate', type=float, default=0.05, help='Fração de células opcionais nulas.')
+        parser.add_argument('--sem-banco', action='store_true', help='Mede apenas leitura e conversão, sem gravar no banco.')
+
+    def _comando_fetch(self, engine, options):
+        fetch = FetchCommand(stdout=io.StringIO(), stderr=io.StringIO())
+        fetch.batch_size = options['batch_size']
+        fetch.loader_modes = {options['export_type']: options['loader_mode']}
+        fetch.parser_engines = {options['export_type']: engine}
+        return fetch
+
+    def _medir_sem_banco(self, fetch, spec, caminho, loader_mode):
+        if loader_mode == 'copy':
+            writer = ContadorCopy(spec.model, fetch.batch_size)
+        else:
+            writer = ContadorLinhas(spec.model)
+        with abrir_csv(caminho) as infile:
+            if fetch.parser_engines[spec.nome] == 'pandas':
+                fetch._carregar_com_pandas(spec, infile, writer, {}, None, "")
+            else:
+                fetch._carregar_linhas(spec, infile, writer, {}, None, "")
+        writer.finish()
+        return writer.gravadas
+
+    def _medir_com_banco(self, fetch, spec, caminho):
+        # Tudo roda dentro de uma transação desfeita no final: o benchmark não deixa dados
+        inicio_janela = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+        fim_janela = datetime(2100, 1, 1, tzinfo=dt_timezone.utc)
+        with logs.suspenso(), transaction.atomic():
+            cliente = Clientes.objects.create(nome_cliente='benchmark', email_contato=f'benchmark-{time.time_ns()}@example.com', qnt_ipus_contratadas=0, preco_por_ipu=0)
+            config = ConfiguracaoIDMC.objects.create(cliente=cliente, apelido_configuracao='benchmark', iics_pod_url='', iics_username='', iics_password='')
+            meter_id = 'benchmark' if spec.por_meter else None
+            fetch.load_export_csv(spec, caminho, config, datetime.now(dt_timezone.utc), inicio_janela, fim_janela, meter_id=meter_id)
+            gravadas = spec.model.objects.filter(configuracao=config).count()
+            transaction.set_rollback(True)
+        return gravadas
+
+    def handle(self, *args, **options):
+        if 'pandas' in options['engines'] and not pandas_disponivel():
+            raise CommandError("O motor 'pandas' exige a biblioteca pandas instalada.")
+        spec = EXPORT_SPECS[options['export_type']]
+        rows = options['rows']
+        fd, caminho = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            escrever_csv(spec, caminho, rows, taxa_nulos=options['null_rate'])
+            self.stdout.write(f"CSV sintético de {spec.nome}: {rows} linhas, {os.path.getsize(caminho) / 1024 / 1024:.1f} MB")
+            self.stdout.write(f"{'Motor':<10} {'linhas':>10} {'segundos':>10} {'linhas/s':>12}")
+            resultados = {}
+            for engine in options['engines']:
+                fetch = self._comando_fetch(engine, options)
+                inicio = time.perf_counter()
+                if options['sem_banco']:
+                    gravadas = self._medir_sem_banco(fetch, spec, caminho, options['loader_mode'])
+                else:
+                    gravadas = self._medir_com_banco(fetch, spec, caminho)
+                duracao = time.perf_counter() - inicio
+                resultados[engine] = rows / duracao if duracao else float('inf')
+                self.stdout.write(f"{engine:<10} {gravadas:>10} {duracao:>10.2f} {resultados[engine]:>12.0f}")
+            if 'python' in resultados and 'pandas' in resultados:
+                self.stdout.write(self.style.SUCCESS(f"Ganho do motor pandas: {resultados['pandas'] / resultados['python']:.2f}x"))
+        finally:
+            os.remove(caminho)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.benchmarks.synthetic import CARDINALIDADES_PADRAO, INICIO_PADRAO, METERS_CONHECIDOS, escrever_exportacao
+from api.extraction import logs
+from api.ingestion import particoes
+from api.ingestion.schemas import EXPORT_SPECS
+from api.management.commands.fetch_ipu_data import Command as FetchCommand
+from api.models import Clientes, ConfiguracaoIDMC
+
+# Loader do fetch_ipu_data usado para cada tipo de exportação
+LOADERS = {
+    'SUMMARY': 'load_summary_csv',
+    'PROJECT_FOLDER': 'load_project_folder_csv',
+    'ASSET': 'load_asset_csv',
+    'CDI_JOB': 'load_cdi_job_csv',
+    'CAI_SUMMARY': 'load_cai_asset_summary_csv',
+}
+METER_BENCHMARK = {'CDI_JOB': METERS_CONHECIDOS[0][0], 'CAI_SUMMARY': METERS_CONHECIDOS[1][0]}
+# Cobre as datas dos CSVs sintéticos (que começam em INICIO_PADRAO) sem criar um século de partições
+INICIO_JANELA = INICIO_PADRAO.replace(tzinfo=dt_timezone.utc) - timedelta(days=1)
+FIM_JANELA = INICIO_JANELA + timedelta(days=5 * 366)
+
+
+class ContadorConsultas:
+    # execute_wrapper: conta os comandos sem guardar o SQL (CaptureQueriesContext formataria
+    # cada INSERT em lote, o que distorceria o tempo e a memória medidos)
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+def tamanho_indices(tabela, configuracao_id):
+    # Bytes que os índices da tabela ocupam para as linhas da configuração: as linhas são copiadas
+    # para uma tabela temporária onde os mesmos índices são recriados. Medir a própria tabela
+    # contaria o inchaço deixado pelas repetições desfeitas. None fora do PostgreSQL.
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE "_medida_indices" AS SELECT * FROM "{tabela}" WHERE configuracao_id = %s', [configuracao_id])
+        cursor.execute("SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass", [tabela])
+        for (definicao,) in cursor.fetchall():
+            definicao = re.sub(r'^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+ ', r'CREATE \1INDEX ON "_medida_indices" ', definicao)
+            cursor.execute(definicao)
+        cursor.execute('SELECT pg_indexes_size(\'"_medida_indices"\'::regclass)')
+        tamanho = int(cursor.fetchone()[0])
+        cursor.execute('DROP TABLE "_medida_indices"')
+        return tamanho
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark dos loaders load_*_csv com CSVs sintéticos: linhas/s, pico de memória e quantidade de consultas, salvos em JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Linhas de cada CSV sintético.')
+        parser.add_argument('--types', nargs='+', default=list(LOADERS), choices=list(LOADERS), help='Tipos de exportação medidos.')
+        parser.add_argument(
+            '--cardinality', action='append', default=[], metavar='DIMENSAO=N',
+            help=f"Valores distintos por dimensão ({', '.join(CARDINALIDADES_PADRAO)}). Ex: --cardinality orgs=10 --cardinality assets=5000."
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Repetições por tipo; vale a mediana.')
+        parser.add_argument('--null-rate', type=float, default=0.02, help='Fração de células opcionais nulas.')
+        parser.add_argument('--loader-mode', default='orm', choices=FetchCommand.LOADER_MODES)
+        parser.add_argument('--parser-engine', default='python', choices=FetchCommand.PARSER_ENGINES)
+        parser.add_argument('--batch-size', type=int, default=FetchCommand.batch_size)
+        parser.add_argument('--sem-memoria', action='store_true', help='Não faz a rodada extra com tracemalloc para o pico de memória.')
+        parser.add_argument('--output', help='Arquivo JSON do resultado. Padrão: benchmarks/loaders_<data>_<commit>.json')
+        parser.add_argument('--compare', help='JSON de uma execução anterior para comparar linhas/s.')
+
+    def _cardinalidades(self, valores):
+        cardinalidades = {}
+        for valor in valores:
+            nome, _, numero = valor.partition('=')
+            if nome not in CARDINALIDADES_PADRAO or not numero.isdigit() or int(numero) < 1:
+                raise CommandError(f"Valor inválido para --cardinality: '{valor}'. Use DIMENSAO=N com DIMENSAO em {list(CARDINALIDADES_PADRAO)}.")
+            cardinalidades[nome] = int(numero)
+        return cardinalidades
+
+    def _comando_fetch(self, tipo, options):
+        fetch = FetchCommand(stdout=io.StringIO(), stderr=io.StringIO())
+        fetch.batch_size = options['batch_size']
+        fetch.loader_modes = {tipo: options['loader_mode']}
+        fetch.parser_engines = {tipo: options['parser_engine']}
+        return fetch
+
+    def _carregar(self, tipo, caminho, options):
+        # Roda o loader dentro de uma transação desfeita no final: o benchmark não deixa dados
+        fetch = self._comando_fetch(tipo, options)
+        loader = getattr(fetch, LOADERS[tipo])
+        contador = ContadorConsultas()
+        with logs.suspenso(), transaction.atomic():
+            cliente = Clientes.objects.create(nome_cliente='benchmark', email_contato=f'benchmark-{time.time_ns()}@example.com', qnt_ipus_contratadas=0, preco_por_ipu=0)
+            config = ConfiguracaoIDMC.objects.create(cliente=cliente, apelido_configuracao='benchmark', iics_pod_url='', iics_username='', iics_password='')
+            argumentos = [caminho, config]
+            if tipo in METER_BENCHMARK:
+                argumentos.append(METER_BENCHMARK[tipo])
+            argumentos += [datetime.now(dt_timezone.utc), INICIO_JANELA, FIM_JANELA]
+            tabela = EXPORT_SPECS[tipo].model._meta.db_table
+            # Partições criadas fora da medição, como o fetch_ipu_data faz antes das cargas
+            particoes.garantir_particoes(tabela, [config.pk], INICIO_JANELA, FIM_JANELA)
+            with connection.execute_wrapper(contador):
+                inicio = time.perf_counter()
+                loader(*argumentos)
+                duracao = time.perf_counter() - inicio
+            indices = tamanho_indices(tabela, config.pk)
+            gravadas = EXPORT_SPECS[tipo].model.objects.filter(configuracao=config).count()
+            transaction.set_rollback(True)
+        return duracao, contador.consultas, gravadas, indices
+
+    def _pico_memoria(self, tipo, caminho, options):
+        tracemalloc.start()
+        try:
+            self._carregar(tipo, caminho, options)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def _medir(self, tipo, options, cardinalidades, diretorio):
+        spec = EXPORT_SPECS[tipo]
+        caminho = os.path.join(diretorio, f"{tipo.lower()}.csv")
+        escrever_exportacao(spec, caminho, options['rows'], cardinalidades, taxa_nulos=options['null_rate'])
+        duracoes, consultas, gravadas, indices = [], 0, 0, None
+        for _ in range(max(1, options['repeat'])):
+            duracao, consultas, gravadas, indices = self._carregar(tipo, caminho, options)
+            duracoes.append(duracao)
+        duracoes.sort()
+        mediana = duracoes[len(duracoes) // 2]
+        pico = None if options['sem_memoria'] else self._pico_memoria(tipo, caminho, options)
+        return {
+            'tipo': tipo,
+            'loader': LOADERS[tipo],
+            'linhas': options['rows'],
+            'gravadas': gravadas,
+            'bytes_csv': os.path.getsize(caminho),
+            'segundos': duracoes,
+            'segundos_mediana': mediana,
+            'linhas_por_segundo': options['rows'] / mediana if mediana else None,
+            'consultas': consultas,
+            # Tamanho dos índices da tabela para as linhas carregadas
+            'bytes_indices': indices,
+            'pico_memoria_mb': pico / 1024 / 1024 if pico is not None else None,
+        }
+
+    def _comparar(self, resultados, caminho):
+        with open(caminho, encoding='utf-8') as f:
+            anterior = {r['tipo']: r for r in json.load(f)['resultados']}
+        self.stdout.write(f"\nComparação com {caminho}:")
+        for resultado in resultados:
+            base = anterior.get(resultado['tipo'])
+            if not base or not base.get('linhas_por_segundo') or not resultado['linhas_por_segundo']:
+                continue
+            razao = resultado['linhas_por_segundo'] / base['linhas_por_segundo']
+            estilo = self.style.SUCCESS if razao >= 1 else self.style.WARNING
+            linha = f"  {resultado['tipo']:<15} {base['linhas_por_segundo']:>10.0f} -> {resultado['linhas_por_segundo']:>10.0f} linhas/s ({razao:.2f}x)"
+            if base.get('bytes_indices') and resultado.get('bytes_indices') is not None:
+                linha += f"; índices {base['bytes_indices'] / 1024 / 1024:.1f} -> {resultado['bytes_indices'] / 1024 / 1024:.1f} MB"
+            self.stdout.write(estilo(linha))
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1:
+            raise CommandError("--rows deve ser maior ou igual a 1.")
+        cardinalidades = self._cardinalidades(options['cardinality'])
+        commit = commit_atual()
+        self.stdout.write(f"Banco: {connection.vendor}; {options['rows']} linhas por tipo; loader {options['loader_mode']}, motor {options['parser_engine']}.")
+        self.stdout.write(f"{'Tipo':<15} {'gravadas':>10} {'mediana (s)':>12} {'linhas/s':>10} {'consultas':>10} {'pico (MB)':>10} {'índices (MB)':>13}")
+        resultados = []
+        with tempfile.TemporaryDirectory() as diretorio:
+            for tipo in options['types']:
+                resultado = self._medir(tipo, options, cardinalidades, diretorio)
+                resultados.append(resultado)
+                pico = f"{resultado['pico_memoria_mb']:.1f}" if resultado['pico_memoria_mb'] is not None else '-'
+                indices = f"{resultado['bytes_indices'] / 1024 / 1024:.1f}" if resultado['bytes_indices'] is not None else '-'
+                self.stdout.write(f"{tipo:<15} {resultado['gravadas']:>10} {resultado['segundos_mediana']:>12.2f} {resultado['linhas_por_segundo']:>10.0f} {resultado['consultas']:>10} {pico:>10} {indices:>13}")
+
+        agora = datetime.now(dt_timezone.utc)
+        saida = options['output'] or os.path.join(settings.BASE_DIR, 'benchmarks', f"loaders_{agora:%Y%m%d_%H%M%S}_{commit or 'sem-commit'}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump({
+                'commit': commit,
+                'data': agora.isoformat(),
+                'banco': connection.vendor,
+                'python': platform.python_version(),
+                'parametros': {
+                    'rows': options['rows'], 'repeat': options['repeat'], 'null_rate': options['null_rate'],
+                    'loader_mode': options['loader_mode'], 'parser_engine': options['parser_engine'],
+                    'batch_size': options['batch_size'], 'cardinalidades': {**CARDINALIDADES_PADRAO, **cardinalidades},
+                },
+                'resultados': resultados,
+            }, f, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"\nResultados salvos em {saida}"))
+        if options['compare']:
+            self._comparar(resultados, options['compare'])
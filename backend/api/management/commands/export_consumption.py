@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import sys
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api import exportacao_consumo
+from api.ingestion.schemas import EXPORT_SPECS
+from api.serializers import colunas_consumo
+
+
+def _data(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Data inválida '{valor}': use AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = 'Exporta uma tabela de consumo em CSV, CSV gzip ou Parquet, em fluxo (memória constante, qualquer tamanho de resultado).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=list(EXPORT_SPECS), help='Tabela exportada, pelo tipo de exportação que a carrega.')
+        parser.add_argument('--config-id', type=int, help='Apenas as linhas desta configuração.')
+        parser.add_argument('--start-date', type=_data, help='Primeiro dia (AAAA-MM-DD, fuso de São Paulo) pela data da tabela.')
+        parser.add_argument('--end-date', type=_data, help='Último dia (AAAA-MM-DD, inclusive).')
+        parser.add_argument('--meter-id', help='Apenas este meter (tabelas com meter_id).')
+        parser.add_argument('--project-name', help='Apenas este projeto (tabelas com project_name).')
+        parser.add_argument('--fields', help='Colunas exportadas, separadas por vírgula. Padrão: todas.')
+        parser.add_argument('--format', choices=list(exportacao_consumo.FORMATOS), default='csv', help='Formato do arquivo (padrão: csv).')
+        parser.add_argument('--output', default='-', help="Arquivo de saída ('-' para a saída padrão).")
+        parser.add_argument('--chunk-size', type=int, default=exportacao_consumo.CHUNK_SIZE_PADRAO, help='Linhas por leitura do cursor no servidor.')
+
+    def handle(self, *args, **options):
+        spec = EXPORT_SPECS[options['tipo']]
+        if options['format'] == 'parquet' and not exportacao_consumo.pyarrow_disponivel():
+            raise CommandError("O formato 'parquet' foi solicitado, mas a biblioteca pyarrow não está instalada.")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size deve ser maior ou igual a 1.")
+        colunas_validas = colunas_consumo(spec.model)
+        colunas = colunas_validas
+        if options['fields']:
+            colunas = [campo.strip() for campo in options['fields'].split(',') if campo.strip()]
+            invalidas = sorted(set(colunas) - set(colunas_validas))
+            if invalidas:
+                raise CommandError(f"Colunas inexistentes em {spec.nome}: {', '.join(invalidas)}.")
+
+        filtros = {f'{spec.campo_inicio}__isnull': False}
+        if options['config_id'] is not None:
+            filtros['configuracao_id'] = options['config_id']
+        fuso = timezone.get_default_timezone()
+        if options['start_date']:
+            filtros[f'{spec.campo_inicio}__gte'] = datetime.combine(options['start_date'], datetime.min.time(), tzinfo=fuso)
+        if options['end_date']:
+            filtros[f'{spec.campo_inicio}__lt'] = datetime.combine(options['end_date'] + timedelta(days=1), datetime.min.time(), tzinfo=fuso)
+        for campo in ('meter_id', 'project_name'):
+            if options[campo] is None:
+                continue
+            if campo not in colunas_validas:
+                raise CommandError(f"{spec.nome} não tem a coluna {campo}.")
+            filtros[campo] = options[campo]
+
+        blocos = exportacao_consumo.gerar(options['format'], spec.model.objects.filter(**filtros), colunas, options['chunk_size'])
+        total = 0
+        saida = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for bloco in blocos:
+                saida.write(bloco)
+                total += len(bloco)
+        finally:
+            if saida is not sys.stdout.buffer:
+                saida.close()
+        if options['output'] != '-':
+            self.stdout.write(self.style.SUCCESS(f"{spec.nome}: {total / 1024 / 1024:.1f} MB gravados em {options['output']}."))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from api.benchmarks.fake_iics import ConfiguracaoFake, ServidorFakeIICS
+
+
+class Command(BaseCommand):
+    help = 'Sobe um servidor local que imita a API de metering da IICS (login, jobs de exportação, status e download).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--job-latency', type=float, nargs=2, default=(2.0, 6.0), metavar=('MIN', 'MAX'), help='Faixa de segundos até cada job ficar pronto.')
+        parser.add_argument('--job-failure-rate', type=float, default=0.0, help='Fração dos jobs que terminam em FAILED.')
+        parser.add_argument('--status-error-rate', type=float, default=0.0, help='Fração das consultas de status respondidas com 503.')
+        parser.add_argument('--create-error-rate', type=float, default=0.0, help='Fração das criações de job respondidas com 503.')
+        parser.add_argument('--download-cut-rate', type=float, default=0.0, help='Fração dos downloads encerrados na metade (para testar a retomada com Range).')
+        parser.add_argument('--session-ttl', type=float, help='Segundos após o login em que a sessão expira (401). Por padrão não expira.')
+        parser.add_argument('--http-latency', type=float, default=0.0, help='Atraso (s) aplicado a cada requisição.')
+        parser.add_argument('--rows', type=int, default=2000, help='Linhas de cada CSV exportado.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        config = ConfiguracaoFake(
+            latencia_job=tuple(options['job_latency']),
+            taxa_falha_job=options['job_failure_rate'],
+            taxa_erro_status=options['status_error_rate'],
+            taxa_erro_criacao=options['create_error_rate'],
+            latencia_http=options['http_latency'],
+            taxa_corte_download=options['download_cut_rate'],
+            duracao_sessao=options['session_ttl'],
+            linhas_padrao=options['rows'],
+            seed=options['seed'],
+        )
+        servidor = ServidorFakeIICS(config, options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(f"IICS fake em {servidor.url} (use como iics_pod_url). Ctrl+C para parar."))
+        try:
+            servidor.servir()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.parar()
+            self.stdout.write(f"Chamadas recebidas: {servidor.chamadas}")
@@ -5,10 +5,12 @@ import os
 import zipfile
 import csv
 import re
+import signal
+import threading
 from zoneinfo import ZoneInfo
 from datetime import datetime, timedelta
 from decimal import Decimal, InvalidOperation
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Import dateutil parser
 try:
@@ -17,37 +19,85 @@ except ImportError:
     # Provide a helpful error message if dateutil is not installed
     raise ImportError("A biblioteca 'python-dateutil' é necessária. Por favor, adicione-a ao seu requirements.txt e reconstrua a imagem.")
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.db import transaction, connection
-from django.db.models import Max
 from django.utils import timezone
 from django.utils.text import slugify
 
 # Importando os modelos Django que criamos, incluindo o de Log
+from api import agregacoes
 from api.models import (
     ConfiguracaoIDMC,
     ConsumoSummary,
-    ConsumoProjectFolder,
-    ConsumoAsset,
-    ConsumoCdiJobExecucao,
-    ConsumoCaiAssetSumario,
-    ExtracaoLog,
     CicloFaturamento
 )
+from api.ingestion.bulk import BulkUpserter, BATCH_SIZE_PADRAO
+from api.ingestion.converters import limpar_valor
+from api.ingestion.schemas import EXPORT_SPECS, METER_SPECS, ColetorMeters
+from api.ingestion.pg_copy import CopyStagingWriter
+from api.ingestion.incremental import CargaIncremental
+from api.ingestion import particoes, rollups
+from api.ingestion.pandas_engine import carregar_com_pandas, pandas_disponivel
+from api.ingestion.streaming import SPOOL_MAX_BYTES, abrir_csv, abrir_csv_do_zip, criar_buffer_download, nome_origem
+from api.extraction.orchestrator import MAX_JOBS_POR_POD_PADRAO, OrquestradorJanela, semaforo_do_pod
+from api.extraction import metrics
+from api.extraction import tracing
+from api.extraction.cache import CacheExportacoes
+from api.extraction.logs import descarregar_registradores, encerrar_registradores, registrar_log
+from api.extraction.poller import CONSULTAS_SIMULTANEAS, STATUS_FINAIS, poller_compartilhado
+from api.extraction.scheduler import MAX_CONFIGS_POR_POD_PADRAO, MAX_WORKERS_PADRAO, AgendadorConfiguracoes
+from api.extraction.sessions import cache_sessoes
+from core.db.pool import definir_tamanho_maximo, pools_ativos
+
+# A exportação é pedida até 23:59:59 UTC do dia final; a partir das 21h de São Paulo esse dia já é
+# o seguinte, e as linhas dele chegam no arquivo. Os rollups recalculam também esse dia.
+DIA_APOS_JANELA = timedelta(days=1)
+
+def _fechando_conexao(func):
+    # Para funções submetidas a um executor: cada thread abre a sua própria conexão do Django,
+    # que precisa ser fechada (devolvida ao pool) quando a thread termina o trabalho
+    def chamar(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connection.close()
+    return chamar
+
+def rotulos_exportacao(export_name, meter_id=None):
+    # (tipo_exportacao, meter) usados nas métricas; jobs de meter chegam como 'meterId_<id>'
+    if meter_id is None and export_name and export_name.startswith("meterId_"):
+        meter_id = export_name[len("meterId_"):]
+    if meter_id:
+        spec = METER_SPECS.get(meter_id)
+        return (spec.nome if spec else "METER"), meter_id
+    return export_name, None
+
 
 class InformaticaAPIClient:
-    def __init__(self, iics_pod, username, password, command_instance, log_prefix=""):
+    def __init__(self, iics_pod, username, password, command_instance, log_prefix="", configuracao=None, sessoes=None, max_conexoes=None):
         self.iics_pod = iics_pod
         self.username = username
         self.password = password
         self.session_id = None
         self.base_url = None
         self.session = requests.Session()
+        if max_conexoes:
+            # Uma conexão HTTP reaproveitável por exportação simultânea (o padrão do requests é 10)
+            adaptador = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=max_conexoes)
+            self.session.mount("https://", adaptador)
+            self.session.mount("http://", adaptador)
         self.command = command_instance
         self.log_prefix = log_prefix
+        # Usada nos rótulos das métricas e como chave do cache de sessões
+        self.configuracao = configuracao
+        # api.extraction.sessions.CacheSessoes; sem ele todo login vai à API
+        self.sessoes = sessoes if configuracao is not None else None
+        self._lock_login = threading.Lock()
 
-    def login(self):
+    def login(self, forcar=False):
+        if not forcar and self._usar_sessao_guardada():
+            return True
         login_url = f"{self.iics_pod}/saas/public/core/v3/login"
         headers = {"Content-Type": "application/json", "Accept": "application/json"}
         payload = {"username": self.username, "password": self.password}
@@ -56,39 +106,80 @@ class InformaticaAPIClient:
             response = self.session.post(login_url, headers=headers, json=payload, timeout=30)
             response.raise_for_status()
             data = response.json()
-            self.session_id = data.get("userInfo", {}).get("sessionId")
+            session_id = data.get("userInfo", {}).get("sessionId")
             products = data.get("products", [])
-            if products:
-                self.base_url = products[0].get("baseApiUrl")
-            if not self.session_id or not self.base_url:
+            base_url = products[0].get("baseApiUrl") if products else None
+            if not session_id or not base_url:
                 raise ValueError("SessionId ou BaseURL não encontrados na resposta do login.")
-            self.session.headers.update({
-                "INFA-SESSION-ID": self.session_id,
-                "Content-Type": "application/json",
-                "Accept": "application/json"
-            })
+            self._aplicar_sessao(session_id, base_url)
+            if self.sessoes is not None:
+                self.sessoes.guardar(self.configuracao, session_id, base_url)
             self.command.stdout.write(self.command.style.SUCCESS(f"{self.log_prefix} Login realizado com sucesso!"))
             return True
         except requests.exceptions.RequestException as e:
             raise e
 
+    def _aplicar_sessao(self, session_id, base_url):
+        self.session_id = session_id
+        self.base_url = base_url
+        self.session.headers.update({
+            "INFA-SESSION-ID": session_id,
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        })
+
+    def _usar_sessao_guardada(self):
+        sessao = self.sessoes.obter(self.configuracao) if self.sessoes is not None else None
+        if sessao is None:
+            return False
+        self._aplicar_sessao(sessao.session_id, sessao.base_url)
+        self.command.stdout.write(self.command.style.SUCCESS(f"{self.log_prefix} 1. Reaproveitando a sessão da API da Informatica (último uso em {timezone.localtime(sessao.ultimo_uso):%d/%m %H:%M:%S})."))
+        return True
+
+    def _requisitar(self, metodo, caminho, **kwargs):
+        # caminho é relativo ao baseApiUrl. Uma sessão expirada (401/403) leva a um novo login
+        # e a requisição é repetida uma única vez.
+        sessao_usada = self.session_id
+        response = self.session.request(metodo, f"{self.base_url}{caminho}", **kwargs)
+        if response.status_code in (401, 403):
+            response.close()
+            self._renovar_sessao(sessao_usada, response.status_code)
+            response = self.session.request(metodo, f"{self.base_url}{caminho}", **kwargs)
+        if response.ok and self.sessoes is not None:
+            self.sessoes.tocar(self.configuracao, self.session_id)
+        return response
+
+    def _renovar_sessao(self, sessao_usada, status_code):
+        with self._lock_login:
+            if self.session_id != sessao_usada:
+                # Outra thread já renovou a sessão enquanto esta esperava
+                return
+            self.command.stderr.write(f"{self.log_prefix} A API recusou a sessão atual (HTTP {status_code}). Realizando novo login...")
+            if self.sessoes is not None:
+                self.sessoes.invalidar(self.configuracao, sessao_usada)
+            self.login(forcar=True)
+
+    def liberar_sessao(self):
+        if self.sessoes is not None and self.session_id:
+            self.sessoes.liberar(self.configuracao)
+
     def export_metering_data(self, start_date, end_date, job_type=None, meter_id=None):
         if not self.base_url:
             raise ValueError("BaseURL não está definida.")
         payload = {"startDate": start_date, "endDate": end_date, "callbackUrl": "https://MyExportJobStatus.com"}
         if meter_id:
-            export_url = f"{self.base_url}/public/core/v3/license/metering/ExportServiceJobLevelMeteringData"
+            export_path = "/public/core/v3/license/metering/ExportServiceJobLevelMeteringData"
             payload["meterId"] = meter_id
             export_name = f"meterId_{meter_id}"
         elif job_type:
-            export_url = f"{self.base_url}/public/core/v3/license/metering/ExportMeteringData"
+            export_path = "/public/core/v3/license/metering/ExportMeteringData"
             payload["jobType"] = job_type
             export_name = f"tipo '{job_type}'"
         else:
             raise ValueError("É necessário fornecer um job_type ou um meter_id.")
 
         self.command.stdout.write(f"{self.log_prefix} 2. Criando job de exportação para {export_name}...")
-        response = self.session.post(export_url, json=payload, timeout=30)
+        response = self._requisitar("POST", export_path, json=payload, timeout=30)
         response.raise_for_status()
         data = response.json()
         job_id = data.get("jobId")
@@ -97,41 +188,51 @@ class InformaticaAPIClient:
         self.command.stdout.write(self.command.style.SUCCESS(f"{self.log_prefix} Job de exportação criado. JobId: {job_id}"))
         return job_id
 
-    def check_job_status(self, job_id):
+    def consultar_status_job(self, job_id):
+        # Uma única consulta de status; RequestException sobe para quem chamou
+        response = self._requisitar("GET", f"/public/core/v3/license/metering/ExportMeteringData/{job_id}", timeout=30)
+        response.raise_for_status()
+        return response.json().get("status")
+
+    def acompanhar_job(self, job_id, tipo_exportacao=None, configuracao_id=None):
+        # Registra o job no poller compartilhado e retorna um Future com o status final
+        rotulo = f" ({tipo_exportacao})" if tipo_exportacao else ""
+        self.command.stdout.write(f"{self.log_prefix} 3. Verificando status do JobId {job_id}{rotulo}...")
+
+        def ao_consultar(status, erro):
+            if erro is not None:
+                self.command.stderr.write(f"{self.log_prefix} Falha transitória ao verificar status do JobId {job_id}{rotulo}: {erro}")
+            else:
+                self.command.stdout.write(f"{self.log_prefix}    - Status atual{rotulo}: {status}")
+        futuro = poller_compartilhado().acompanhar(self, job_id, tipo_exportacao, configuracao_id, ao_consultar=ao_consultar)
+        inicio = time.perf_counter()
+
+        def ao_terminar(f):
+            status = "FAILED" if f.cancelled() or f.exception() else f.result()
+            tipo, meter_id = rotulos_exportacao(tipo_exportacao)
+            metrics.observar_etapa("aguardar_job", time.perf_counter() - inicio, status, self.configuracao, tipo, meter_id)
+        futuro.add_done_callback(ao_terminar)
+        return futuro
+
+    def reportar_status_final(self, final_status, tipo_exportacao=None):
+        rotulo = f" {tipo_exportacao}" if tipo_exportacao else ""
+        if final_status == "SUCCESS":
+            self.command.stdout.write(self.command.style.SUCCESS(f"{self.log_prefix} Job{rotulo} concluído com sucesso!"))
+        elif final_status == "TIMEOUT":
+            self.command.stderr.write(f"{self.log_prefix} Timeout: O job{rotulo} não foi concluído no tempo esperado.")
+        else:
+            self.command.stderr.write(f"{self.log_prefix} Job{rotulo} falhou ou foi cancelado. Status: {final_status}")
+
+    def check_job_status(self, job_id, tipo_exportacao=None, configuracao_id=None):
         if not self.base_url or not job_id: return "FAILED"
-        status_url = f"{self.base_url}/public/core/v3/license/metering/ExportMeteringData/{job_id}"
-        self.command.stdout.write(f"{self.log_prefix} 3. Verificando status do JobId {job_id}...")
-        timeout_seconds, start_time = 600, time.time()
-        final_status = "TIMEOUT"
-        while time.time() - start_time < timeout_seconds:
-            try:
-                response = self.session.get(status_url, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-                status = data.get("status")
-                self.command.stdout.write(f"{self.log_prefix}    - Status atual: {status}")
-                if status == "SUCCESS":
-                    self.command.stdout.write(self.command.style.SUCCESS(f"{self.log_prefix} Job concluído com sucesso!"))
-                    final_status = "SUCCESS"
-                    break
-                if status in ["FAILED", "CANCELLED"]:
-                    self.command.stderr.write(f"{self.log_prefix} Job falhou ou foi cancelado. Status: {status}")
-                    final_status = status
-                    break
-                time.sleep(15)
-            except requests.exceptions.RequestException as e:
-                self.command.stderr.write(f"{self.log_prefix} Falha ao verificar status do job: {e}")
-                final_status = "FAILED"
-                break
-        if final_status == "TIMEOUT":
-            self.command.stderr.write(f"{self.log_prefix} Timeout: O job não foi concluído no tempo esperado.")
+        final_status = self.acompanhar_job(job_id, tipo_exportacao, configuracao_id).result()
+        self.reportar_status_final(final_status, tipo_exportacao)
         return final_status
 
     def download_export_file(self, job_id, download_path):
         if not self.base_url or not job_id: return None
-        download_url = f"{self.base_url}/public/core/v3/license/metering/ExportMeteringData/{job_id}/download"
         self.command.stdout.write(f"{self.log_prefix} 4. Realizando download do arquivo para o JobId {job_id}...")
-        response = self.session.get(download_url, stream=True, timeout=300)
+        response = self._requisitar("GET", f"/public/core/v3/license/metering/ExportMeteringData/{job_id}/download", stream=True, timeout=300)
         response.raise_for_status()
         os.makedirs(os.path.dirname(download_path), exist_ok=True)
         with open(download_path, 'wb') as f:
@@ -140,15 +241,128 @@ class InformaticaAPIClient:
         self.command.stdout.write(self.command.style.SUCCESS(f"{self.log_prefix} Download concluído: {download_path}"))
         return download_path
 
+    def download_export_buffer(self, job_id, max_memory_bytes=SPOOL_MAX_BYTES):
+        if not self.base_url or not job_id: return None
+        download_path = f"/public/core/v3/license/metering/ExportMeteringData/{job_id}/download"
+        self.command.stdout.write(f"{self.log_prefix} 4. Realizando download em streaming do arquivo para o JobId {job_id}...")
+        response = self._requisitar("GET", download_path, stream=True, timeout=300)
+        response.raise_for_status()
+        buffer = criar_buffer_download(max_memory_bytes)
+        total_bytes = 0
+        try:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                buffer.write(chunk)
+                total_bytes += len(chunk)
+        except Exception:
+            buffer.close()
+            raise
+        buffer.seek(0)
+        self.command.stdout.write(self.command.style.SUCCESS(f"{self.log_prefix} Download concluído ({total_bytes} bytes em buffer)."))
+        return buffer
+
+    def download_export_retomavel(self, job_id, caminho_parcial, max_tentativas=3):
+        # Baixa para caminho_parcial continuando do que já existe nele (HTTP Range): um download
+        # interrompido, nesta ou em uma execução anterior, retoma do último byte gravado.
+        # Retorna o tamanho final do arquivo.
+        if not self.base_url or not job_id: return None
+        download_path = f"/public/core/v3/license/metering/ExportMeteringData/{job_id}/download"
+        self.command.stdout.write(f"{self.log_prefix} 4. Realizando download do arquivo para o JobId {job_id}...")
+        for tentativa in range(1, max_tentativas + 1):
+            inicio = os.path.getsize(caminho_parcial) if os.path.exists(caminho_parcial) else 0
+            headers = {"Accept-Encoding": "identity"}
+            if inicio:
+                headers["Range"] = f"bytes={inicio}-"
+                self.command.stdout.write(f"{self.log_prefix}    - Retomando download a partir do byte {inicio}.")
+            try:
+                with self._requisitar("GET", download_path, headers=headers, stream=True, timeout=300) as response:
+                    if inicio and response.status_code == 416:
+                        # Range além do fim: o parcial já tem o arquivo inteiro
+                        break
+                    response.raise_for_status()
+                    retomando = inicio and response.status_code == 206
+                    esperado = response.headers.get("Content-Length")
+                    recebidos = 0
+                    # Blocos menores que no download em buffer: o que já chegou fica no parcial se a conexão cair
+                    with open(caminho_parcial, 'ab' if retomando else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=64 * 1024):
+                            f.write(chunk)
+                            recebidos += len(chunk)
+                    if esperado is not None and recebidos < int(esperado):
+                        raise requests.exceptions.ChunkedEncodingError(f"conexão encerrada após {recebidos} de {esperado} bytes")
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.exceptions.Timeout) as e:
+                if tentativa == max_tentativas:
+                    raise
+                self.command.stderr.write(f"{self.log_prefix} Download do JobId {job_id} interrompido ({e}). Tentativa {tentativa + 1} de {max_tentativas}...")
+        total_bytes = os.path.getsize(caminho_parcial)
+        self.command.stdout.write(self.command.style.SUCCESS(f"{self.log_prefix} Download concluído ({total_bytes} bytes)."))
+        return total_bytes
+
 class Command(BaseCommand):
     help = 'Executa a rotina para buscar e popular dados de consumo de IPU da Informatica.'
     SAO_PAULO_TZ = ZoneInfo("America/Sao_Paulo")
+    batch_size = BATCH_SIZE_PADRAO
+    stream_exports = False
+    # Tipos de exportação aceitos em --loader-mode e os modos de carga disponíveis
+    EXPORT_TYPES = tuple(EXPORT_SPECS)
+    LOADER_MODES = ('orm', 'copy', 'incremental')
+    PARSER_ENGINES = ('python', 'pandas')
+    loader_modes = {}
+    parser_engines = {}
+    ORCHESTRATORS = ('async', 'threads')
+    orchestrator = 'async'
+    max_jobs_per_pod = MAX_JOBS_POR_POD_PADRAO
+    max_parallel_windows = 3
+    agendador = None
+    cache_exportacoes = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE_PADRAO, help='Quantidade de linhas por lote de INSERT ... ON CONFLICT nos loaders.')
+        parser.add_argument(
+            '--loader-mode', action='append', default=[], metavar='TIPO=MODO',
+            help=f"Modo de carga por tipo de exportação ({', '.join(self.EXPORT_TYPES)}). "
+                 f"Modos: {', '.join(self.LOADER_MODES)}. Ex: --loader-mode ASSET=copy --loader-mode CDI_JOB=copy. "
+                 "O modo 'copy' exige PostgreSQL; em outros bancos o modo 'orm' é usado. "
+                 "O modo 'incremental' não apaga a janela: compara o hash de conteúdo de cada linha com o já gravado "
+                 "e grava apenas linhas novas ou alteradas, removendo as que sumiram do arquivo."
+        )
+        parser.add_argument(
+            '--parser-engine', action='append', default=[], metavar='TIPO=MOTOR',
+            help=f"Motor de leitura/conversão do CSV por tipo de exportação. Motores: {', '.join(self.PARSER_ENGINES)}. "
+                 "Ex: --parser-engine CDI_JOB=pandas (leitura colunar em blocos com pandas/pyarrow)."
+        )
+        parser.add_argument(
+            '--orchestrator', choices=self.ORCHESTRATORS, default='async',
+            help="'async': todos os jobs da janela são criados de uma vez e acompanhados em um único event loop. "
+                 "'threads': fluxo anterior (SUMMARY -> ASSET -> meters em sequência, PROJECT_FOLDER em paralelo)."
+        )
+        parser.add_argument('--max-jobs-per-pod', type=int, default=MAX_JOBS_POR_POD_PADRAO, help='Máximo de jobs de exportação em andamento ao mesmo tempo em cada pod (modo async).')
+        parser.add_argument('--max-workers', type=int, default=MAX_WORKERS_PADRAO, help='Orçamento total de workers da execução (configurações simultâneas + lotes de backfill em paralelo).')
+        parser.add_argument('--max-configs-per-pod', type=int, default=MAX_CONFIGS_POR_POD_PADRAO, help='Máximo de configurações processadas ao mesmo tempo em um mesmo pod (iics_pod_url).')
+        parser.add_argument('--max-parallel-windows', type=int, default=3, help='Máximo de lotes de 30 dias de uma mesma configuração executados em paralelo.')
+        parser.add_argument('--config-id', type=int, action='append', default=[], help='Processa apenas as configurações ativas com estes IDs (pode repetir).')
+        parser.add_argument('--metrics-textfile', default=settings.METRICS_TEXTFILE, help="Arquivo onde as métricas Prometheus da execução são gravadas ao final (textfile collector). Vazio desativa.")
+        parser.add_argument('--stream-exports', action='store_true', help='Lê o CSV direto do ZIP baixado, sem gravar o ZIP em downloads/ nem extrair o CSV em arquivos/ (só vale com --no-export-cache).')
+        parser.add_argument(
+            '--no-export-cache', action='store_true',
+            help="Desativa o cache de exportações (EXPORT_CACHE_DIR): sem ele toda janela cria um job novo na IICS e o download não é retomado."
+        )
+
+    def _parse_por_tipo(self, valores, opcao, permitidos):
+        modos = {}
+        for valor in valores:
+            tipo, _, modo = valor.partition('=')
+            tipo, modo = tipo.strip().upper(), modo.strip().lower()
+            if tipo not in self.EXPORT_TYPES or modo not in permitidos:
+                raise CommandError(f"Valor inválido para {opcao}: '{valor}'. Use TIPO=VALOR com TIPO em {self.EXPORT_TYPES} e VALOR em {permitidos}.")
+            modos[tipo] = modo
+        return modos
 
     def _clean_value(self, value):
-        if value is None or value.lower() == 'null' or value.strip() == '':
-            return None
-        return value
+        return limpar_valor(value)
 
+    # Conversão célula a célula original; os loaders usam api.ingestion.converters,
+    # e este método fica como referência para o benchmark_converters.
     def _safe_cast(self, value, cast_type, default=None):
         cleaned_value = self._clean_value(value)
         if cleaned_value is None:
@@ -168,6 +382,35 @@ class Command(BaseCommand):
         except (ValueError, TypeError, InvalidOperation, date_parser.ParserError):
             return default
 
+    def _criar_upserter(self, model, export_type, log_prefix="", filtro_janela=None):
+        def reportar_lote(lote):
+            if lote.inseridos is None:
+                detalhe = f"{lote.gravados} gravados"
+            else:
+                detalhe = f"{lote.inseridos} inseridos, {lote.atualizados} atualizados"
+            self.stdout.write(f"{log_prefix}      Lote {lote.numero}: {detalhe}, {lote.ignorados} ignorados.")
+        modo = self.loader_modes.get(export_type, 'orm')
+        if modo == 'incremental':
+            return CargaIncremental(model, filtro_janela, batch_size=self.batch_size, on_batch=reportar_lote)
+        if modo == 'copy':
+            if connection.vendor == 'postgresql':
+                self.stdout.write(f"{log_prefix}    - Modo de carga COPY (staging temporária) para {export_type}.")
+                return CopyStagingWriter(model, batch_size=self.batch_size, on_batch=reportar_lote)
+            self.stdout.write(self.style.WARNING(f"{log_prefix}    - Modo COPY indisponível para o banco '{connection.vendor}'. Usando o modo ORM para {export_type}."))
+        return BulkUpserter(model, batch_size=self.batch_size, on_batch=reportar_lote)
+
+    def _reportar_totais(self, upserter, log_prefix=""):
+        totais = upserter.totais()
+        if isinstance(upserter, CargaIncremental):
+            d = upserter.diferencas()
+            self.stdout.write(f"{log_prefix}    - Total incremental: {d['inseridas']} inseridas, {d['alteradas']} alteradas, {d['inalteradas']} inalteradas, {d['removidas']} removidas, {totais.ignorados} ignoradas.")
+            return
+        if totais.inseridos is None:
+            detalhe = f"{totais.gravados} gravados"
+        else:
+            detalhe = f"{totais.inseridos} inseridos, {totais.atualizados} atualizados"
+        self.stdout.write(f"{log_prefix}    - Total: {detalhe}, {totais.ignorados} ignorados em {totais.numero} lote(s).")
+
     def _get_config_specific_paths(self, config):
         safe_client_name = slugify(config.cliente.nome_cliente)
         safe_config_name = slugify(config.apelido_configuracao)
@@ -215,284 +458,323 @@ class Command(BaseCommand):
             return None
 
     @transaction.atomic
-    def load_summary_csv(self, csv_path, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
-        self.stdout.write(f"{log_prefix}    - Populando tabela 'ConsumoSummary' com: {csv_path}")
-        deletion_filter = {'configuracao': config, 'consumption_date__gte': start_date_obj, 'consumption_date__lte': end_date_obj}
+    def load_export_csv(self, spec, csv_source, config, execution_timestamp, start_date_obj, end_date_obj, meter_id=None, log_prefix="", observador=None):
+        self.stdout.write(f"{log_prefix}    - Populando tabela '{spec.model.__name__}' com: {nome_origem(csv_source)}")
+        deletion_filter = spec.filtro_delecao(config, start_date_obj, end_date_obj, meter_id)
+        incremental = self.loader_modes.get(spec.nome) == 'incremental'
+        tabela = spec.model._meta.db_table
 
-        # Monta a query de deleção para fins de log
-        delete_query_log = f"""DELETE FROM "public"."api_consumosummary" WHERE "configuracao_id" = {config.id} AND "consumption_date" >= '{start_date_obj.isoformat()}' AND "consumption_date" <= '{end_date_obj.isoformat()}';"""
-        self.stdout.write(f"{log_prefix}    - Executando query de deleção: {delete_query_log}")
+        if incremental:
+            self.stdout.write(f"{log_prefix}    - Modo incremental: comparando o arquivo com os registros de {spec.rotulo} já gravados na janela.")
+        else:
+            # Monta a query de deleção para fins de log
+            delete_query_log = spec.delete_query_log(config, start_date_obj, end_date_obj, meter_id)
+            self.stdout.write(f"{log_prefix}    - Executando query de deleção: {delete_query_log}")
 
-        deleted_count, _ = ConsumoSummary.objects.filter(**deletion_filter).delete()
-        self.stdout.write(f"{log_prefix}    - {deleted_count} registros antigos de SUMMARY deletados.")
+            truncados = 0
+            if not spec.por_meter:
+                # Meses inteiros dentro da janela: TRUNCATE da partição em vez do DELETE linha a linha
+                esvaziadas, truncados = particoes.esvaziar_meses_completos(tabela, config.pk, start_date_obj, end_date_obj)
+                if esvaziadas:
+                    self.stdout.write(f"{log_prefix}    - Partições esvaziadas com TRUNCATE: {', '.join(esvaziadas)}.")
+            deleted_count, _ = spec.model.objects.filter(**deletion_filter).delete()
+            deleted_count += truncados
+            self.stdout.write(f"{log_prefix}    - {deleted_count} registros antigos de {spec.rotulo} deletados.")
         try:
-            with open(csv_path, mode='r', encoding='utf-8') as infile:
-                reader = csv.DictReader(infile)
-                for i, row in enumerate(reader):
-                    lookup_params = {
-                        'configuracao': config,
-                        'org_id': self._clean_value(row.get('OrgId')),
-                        'meter_id': self._clean_value(row.get('MeterId')),
-                        'consumption_date': self._safe_cast(row.get('Date'), datetime)
-                    }
-                    if not all(lookup_params.values()):
-                        self.stdout.write(self.style.WARNING(f"{log_prefix}      [Linha {i+1}] Pulando linha por conter valores nulos na chave: {lookup_params}"))
-                        continue
-                    defaults_params = {
-                        'data_extracao': execution_timestamp,
-                        'meter_name': self._clean_value(row.get('MeterName')),
-                        'billing_period_start_date': self._safe_cast(row.get('BillingPeriodStartDate'), datetime),
-                        'billing_period_end_date': self._safe_cast(row.get('BillingPeriodEndDate'), datetime),
-                        'meter_usage': self._safe_cast(row.get('MeterUsage'), Decimal),
-                        'consumption_ipu': self._safe_cast(row.get('IPU'), Decimal),
-                        'scalar': self._clean_value(row.get('Scalar')),
-                        'metric_category': self._clean_value(row.get('MetricCategory')),
-                        'org_name': self._clean_value(row.get('OrgName')),
-                        'org_type': self._clean_value(row.get('OrgType')),
-                        'ipu_rate': self._safe_cast(row.get('IPURate'), Decimal),
-                    }
-                    ConsumoSummary.objects.update_or_create(**lookup_params, defaults=defaults_params)
-            self.stdout.write(self.style.SUCCESS(f"{log_prefix}    - Processamento do arquivo SUMMARY concluído."))
+            upserter = self._criar_upserter(spec.model, spec.nome, log_prefix, filtro_janela=deletion_filter)
+            constantes = {**upserter.constantes_automaticas(), **spec.constantes(config, execution_timestamp, meter_id)}
+            with abrir_csv(csv_source) as infile:
+                if self.parser_engines.get(spec.nome) == 'pandas':
+                    self._carregar_com_pandas(spec, infile, upserter, constantes, observador, log_prefix)
+                else:
+                    self._carregar_linhas(spec, infile, upserter, constantes, observador, log_prefix)
+            upserter.finish()
+            self._reportar_totais(upserter, log_prefix)
+            totais = upserter.totais()
+            diferencas = upserter.diferencas() if incremental else None
+            metrics.registrar_carga(config, spec.nome, meter_id, totais, upserter.segundos_escrita, diferencas)
+            inalteradas = diferencas['inalteradas'] if diferencas else 0
+            tracing.anotar(
+                linhas=(totais.gravados or 0) + (totais.ignorados or 0) + inalteradas, gravadas=totais.gravados,
+                ignoradas=totais.ignorados, segundos_escrita=upserter.segundos_escrita, **(diferencas or {}),
+            )
+            self._atualizar_rollups(spec, config, start_date_obj, end_date_obj, log_prefix)
+            sufixo_meter = f" para o meter {meter_id}" if meter_id else ""
+            self.stdout.write(self.style.SUCCESS(f"{log_prefix}    - Dados de {spec.rotulo}{sufixo_meter} populados com sucesso."))
         except Exception as e:
-            self.stderr.write(self.style.ERROR(f"{log_prefix}    - Erro CRÍTICO ao processar o arquivo {csv_path}: {e}"))
+            self.stderr.write(self.style.ERROR(f"{log_prefix}    - Erro CRÍTICO ao processar o arquivo {nome_origem(csv_source)} ({spec.rotulo}): {e}"))
             raise
 
-    @transaction.atomic
-    def load_project_folder_csv(self, csv_path, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
-        self.stdout.write(f"{log_prefix}    - Populando tabela 'ConsumoProjectFolder' com: {csv_path}")
-        deletion_filter = {'configuracao': config, 'consumption_date__gte': start_date_obj, 'consumption_date__lte': end_date_obj}
+    def _atualizar_rollups(self, spec, config, start_date_obj, end_date_obj, log_prefix=""):
+        # Na mesma transação da carga: os rollups nunca mostram uma janela pela metade
+        for rollup in rollups.ROLLUPS_POR_EXPORTACAO.get(spec.nome, ()):
+            with tracing.span("rollup", config, spec.nome, rollup=rollup.nome):
+                apagadas, gravadas = rollup.atualizar(config, start_date_obj, end_date_obj + DIA_APOS_JANELA)
+                tracing.anotar(gravadas=gravadas, apagadas=apagadas)
+            self.stdout.write(f"{log_prefix}    - Rollup {rollup.nome} recalculado para a janela: {gravadas} linhas ({apagadas} substituídas).")
 
-        # Monta a query de deleção para fins de log
-        delete_query_log = f"""DELETE FROM "public"."api_consumoprojectfolder" WHERE "configuracao_id" = {config.id} AND "consumption_date" >= '{start_date_obj.isoformat()}' AND "consumption_date" <= '{end_date_obj.isoformat()}';"""
-        self.stdout.write(f"{log_prefix}    - Executando query de deleção: {delete_query_log}")
+    def _atualizar_rollups_configuracao(self, config, inicio, fim, log_prefix=""):
+        # Rollups que atravessam janelas (ciclo de faturamento): uma vez, depois de todas as cargas
+        for rollup in rollups.ROLLUPS_POR_CONFIGURACAO:
+            with tracing.etapa("rollup", config, rollup=rollup.nome) as etapa:
+                try:
+                    apagadas, gravadas = rollup.atualizar(config, inicio, fim)
+                    tracing.anotar(gravadas=gravadas, apagadas=apagadas)
+                    self.stdout.write(f"{log_prefix} Rollup {rollup.nome} recalculado de {inicio.date()} a {fim.date()}: {gravadas} linhas ({apagadas} substituídas).")
+                except Exception as e:
+                    etapa.status = "FAILED"
+                    self.stderr.write(self.style.ERROR(f"{log_prefix} Erro ao recalcular o rollup {rollup.nome} (corrija com rebuild_rollups): {e}"))
+                    registrar_log(configuracao=config, etapa="ROLLUP", status="FAILED", detalhes=f"Falha ao recalcular o rollup '{rollup.nome}'", mensagem_erro=str(e))
 
-        deleted_count, _ = ConsumoProjectFolder.objects.filter(**deletion_filter).delete()
-        self.stdout.write(f"{log_prefix}    - {deleted_count} registros antigos de PROJECT_FOLDER deletados.")
-        try:
-            with open(csv_path, mode='r', encoding='utf-8') as infile:
-                reader = csv.DictReader(infile)
-                for i, row in enumerate(reader):
-                    lookup_params = {
-                        'configuracao': config,
-                        'consumption_date': self._safe_cast(row.get('Date'), datetime),
-                        'project_name': self._clean_value(row.get('Project')),
-                        'folder_path': self._clean_value(row.get('Folder')),
-                        'org_id': self._clean_value(row.get('Org ID'))
-                    }
-                    if not lookup_params['consumption_date'] or not lookup_params['org_id']:
-                        self.stdout.write(self.style.WARNING(f"{log_prefix}      [Linha {i+1}] Pulando linha por conter valores nulos na chave: {lookup_params}"))
-                        continue
-                    defaults_params = {
-                        'data_extracao': execution_timestamp,
-                        'org_type': self._clean_value(row.get('Org Type')),
-                        'total_consumption_ipu': self._safe_cast(row.get('Consumption (IPUs)'), Decimal)
-                    }
-                    ConsumoProjectFolder.objects.update_or_create(**lookup_params, defaults=defaults_params)
-            self.stdout.write(self.style.SUCCESS(f"{log_prefix}    - Processamento do arquivo PROJECT_FOLDER concluído."))
-        except Exception as e:
-            self.stderr.write(self.style.ERROR(f"{log_prefix}    - Erro CRÍTICO ao processar o arquivo {csv_path}: {e}"))
-            raise
+    def _carregar_linhas(self, spec, infile, upserter, constantes, observador, log_prefix):
+        reader = csv.reader(infile)
+        header = next(reader, None)
+        if header is None:
+            self.stdout.write(self.style.WARNING(f"{log_prefix}    - Arquivo {spec.nome} vazio, sem cabeçalho."))
+            return
+        mapear = spec.compilar(header, upserter.field_names, constantes, self.SAO_PAULO_TZ)
+        if mapear.colunas_ausentes:
+            self.stdout.write(self.style.WARNING(f"{log_prefix}    - Colunas ausentes no arquivo {spec.nome} (gravadas como nulas): {', '.join(mapear.colunas_ausentes)}"))
+        if observador:
+            observador.iniciar(header)
+        for i, linha in enumerate(reader):
+            if observador:
+                observador(linha)
+            valores = mapear(linha)
+            if valores is None:
+                self.stdout.write(self.style.WARNING(f"{log_prefix}      [Linha {i+1}] Pulando linha por conter valores nulos na chave: {mapear.chave(linha)}"))
+                upserter.skip()
+                continue
+            upserter.add_valores(valores)
 
-    @transaction.atomic
-    def load_asset_csv(self, csv_path, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
-        self.stdout.write(f"{log_prefix}    - Populando tabela 'ConsumoAsset' com: {csv_path}")
-        deletion_filter = {'configuracao': config, 'consumption_date__gte': start_date_obj, 'consumption_date__lte': end_date_obj}
+    def _carregar_com_pandas(self, spec, infile, upserter, constantes, observador, log_prefix):
+        self.stdout.write(f"{log_prefix}    - Motor de leitura pandas para {spec.nome}.")
+        ausentes, _, descartadas = carregar_com_pandas(spec, infile, upserter, constantes, self.SAO_PAULO_TZ, observador=observador)
+        if ausentes:
+            self.stdout.write(self.style.WARNING(f"{log_prefix}    - Colunas ausentes no arquivo {spec.nome} (gravadas como nulas): {', '.join(ausentes)}"))
+        if descartadas:
+            self.stdout.write(self.style.WARNING(f"{log_prefix}    - {descartadas} linhas puladas por conter valores nulos na chave."))
 
-        # Monta a query de deleção para fins de log
-        delete_query_log = f"""DELETE FROM "public"."api_consumoasset" WHERE "configuracao_id" = {config.id} AND "consumption_date" >= '{start_date_obj.isoformat()}' AND "consumption_date" <= '{end_date_obj.isoformat()}';"""
-        self.stdout.write(f"{log_prefix}    - Executando query de deleção: {delete_query_log}")
+    def load_summary_csv(self, csv_source, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
+        self.load_export_csv(EXPORT_SPECS['SUMMARY'], csv_source, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=log_prefix)
 
-        deleted_count, _ = ConsumoAsset.objects.filter(**deletion_filter).delete()
-        self.stdout.write(f"{log_prefix}    - {deleted_count} registros antigos de ASSET deletados.")
-        try:
-            with open(csv_path, mode='r', encoding='utf-8') as infile:
-                reader = csv.DictReader(infile)
-                for i, row in enumerate(reader):
-                    lookup_params = {
-                        'configuracao': config, 'meter_id': self._clean_value(row.get('Meter ID')), 'consumption_date': self._safe_cast(row.get('Date'), datetime),
-                        'asset_name': self._clean_value(row.get('Asset Name')), 'asset_type': self._clean_value(row.get('Asset Type')),
-                        'project_name': self._clean_value(row.get('Project')), 'folder_name': self._clean_value(row.get('Folder')),
-                        'org_id': self._clean_value(row.get('Org ID')), 'runtime_environment': self._clean_value(row.get('Environment Name')),
-                        'tier': self._clean_value(row.get('Tier')), 'ipu_per_unit': self._safe_cast(row.get('IPU Per Unit'), Decimal)
-                    }
-                    if not all([lookup_params['meter_id'], lookup_params['consumption_date'], lookup_params['org_id']]):
-                        self.stdout.write(self.style.WARNING(f"{log_prefix}      [Linha {i+1}] Pulando linha por conter valores nulos na chave."))
-                        continue
-                    defaults_params = {
-                        'data_extracao': execution_timestamp, 'meter_name': self._clean_value(row.get('Meter Name')), 'org_type': self._clean_value(row.get('Org Type')),
-                        'environment_type': self._clean_value(row.get('Environment Type')), 'usage': self._safe_cast(row.get('Usage'), Decimal),
-                        'consumption_ipu': self._safe_cast(row.get('Consumption (IPUs)'), Decimal)
-                    }
-                    ConsumoAsset.objects.update_or_create(**lookup_params, defaults=defaults_params)
-            self.stdout.write(self.style.SUCCESS(f"{log_prefix}    - Dados de ASSET populados com sucesso."))
-        except Exception as e:
-            self.stderr.write(f"{log_prefix}    - Erro ao processar CSV de Asset: {e}")
-            raise
+    def load_project_folder_csv(self, csv_source, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
+        self.load_export_csv(EXPORT_SPECS['PROJECT_FOLDER'], csv_source, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=log_prefix)
 
-    @transaction.atomic
-    def load_cdi_job_csv(self, csv_path, config, meter_id, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
-        self.stdout.write(f"{log_prefix}    - Populando tabela 'ConsumoCdiJobExecucao' com: {csv_path}")
-        # Filtro de deleção corrigido para incluir o meter_id, evitando apagar dados de outros meters.
-        deletion_filter = {'configuracao': config, 'start_time__gte': start_date_obj, 'end_time__lte': end_date_obj, 'meter_id': meter_id}
+    def load_asset_csv(self, csv_source, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
+        # Os meters (CDI/CAI) são descobertos na mesma leitura do arquivo usada na carga
+        coletor = ColetorMeters()
+        self.load_export_csv(EXPORT_SPECS['ASSET'], csv_source, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix=log_prefix, observador=coletor)
+        self.stdout.write(f"{log_prefix}    - Encontrados {len(coletor.meters)} meters únicos após o filtro.")
+        return coletor.meters
 
-        # Monta a query de deleção para fins de log
-        delete_query_log = f"""DELETE FROM "public"."api_consumocdijobexecucao" WHERE "configuracao_id" = {config.id} AND "start_time" >= '{start_date_obj.isoformat()}' AND "end_time" <= '{end_date_obj.isoformat()}' AND "meter_id" = '{meter_id}';"""
-        self.stdout.write(f"{log_prefix}    - Executando query de deleção: {delete_query_log}")
+    def load_cdi_job_csv(self, csv_source, config, meter_id, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
+        self.load_export_csv(EXPORT_SPECS['CDI_JOB'], csv_source, config, execution_timestamp, start_date_obj, end_date_obj, meter_id=meter_id, log_prefix=log_prefix)
 
-        deleted_count, _ = ConsumoCdiJobExecucao.objects.filter(**deletion_filter).delete()
-        self.stdout.write(f"{log_prefix}    - {deleted_count} registros antigos de CDI JOB deletados.")
-        try:
-            with open(csv_path, mode='r', encoding='utf-8') as infile:
-                reader = csv.DictReader(infile)
-                for i, row in enumerate(reader):
-                    lookup_params = {
-                        'configuracao': config, 'task_id': self._clean_value(row.get('Task ID')), 'task_run_id': self._clean_value(row.get('Task Run ID')),
-                        'org_id': self._clean_value(row.get('Org ID')), 'environment_id': self._clean_value(row.get('Environment ID')),
-                        'start_time': self._safe_cast(row.get('Start Time'), datetime), 'end_time': self._safe_cast(row.get('End Time'), datetime)
-                    }
-                    if not all(lookup_params.values()):
-                        self.stdout.write(self.style.WARNING(f"{log_prefix}      [Linha {i+1}] Pulando linha por conter valores nulos na chave."))
-                        continue
-                    defaults_params = {
-                        'data_extracao': execution_timestamp,
-                        'meter_id': meter_id, # Populando a nova coluna
-                        'meter_id_ref': meter_id, 'task_name': self._clean_value(row.get('Task Name')),
-                        'task_object_name': self._clean_value(row.get('Task Object Name')), 'task_type': self._clean_value(row.get('Task Type')),
-                        'project_name': self._clean_value(row.get('Project Name')), 'folder_name': self._clean_value(row.get('Folder Name')),
-                        'environment_name': self._clean_value(row.get('Environment')), 'cores_used': self._safe_cast(row.get('Cores Used'), Decimal),
-                        'status': self._clean_value(row.get('Status')), 'metered_value_ipu': self._safe_cast(row.get('Metered Value'), Decimal),
-                        'audit_time': self._safe_cast(row.get('Audit Time'), datetime), 'obm_task_time_seconds': self._safe_cast(row.get('OBM Task Time(s)'), int),
-                    }
-                    ConsumoCdiJobExecucao.objects.update_or_create(**lookup_params, defaults=defaults_params)
-            self.stdout.write(self.style.SUCCESS(f"{log_prefix}    - Dados de JOB (CDI) para o meter {meter_id} populados com sucesso."))
-        except Exception as e:
-            self.stderr.write(f"{log_prefix}    - Erro ao processar CSV de Job (CDI): {e}")
-            raise
+    def load_cai_asset_summary_csv(self, csv_source, config, meter_id, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
+        self.load_export_csv(EXPORT_SPECS['CAI_SUMMARY'], csv_source, config, execution_timestamp, start_date_obj, end_date_obj, meter_id=meter_id, log_prefix=log_prefix)
 
-    @transaction.atomic
-    def load_cai_asset_summary_csv(self, csv_path, config, meter_id, execution_timestamp, start_date_obj, end_date_obj, log_prefix=""):
-        self.stdout.write(f"{log_prefix}    - Populando tabela 'ConsumoCaiAssetSumario' com: {csv_path}")
-        # Filtro de deleção corrigido para incluir o meter_id, evitando apagar dados de outros meters.
-        deletion_filter = {'configuracao': config, 'execution_date__gte': start_date_obj, 'execution_date__lte': end_date_obj, 'meter_id': meter_id}
+    def _load_export_csv(self, csv_source, config, start_date_obj, end_date_obj, spec, meter_id, log_prefix):
+        # Para ASSET retorna os meters encontrados no arquivo; para os demais, None
+        execution_timestamp = timezone.now()
+        # Com as tabelas particionadas, as linhas da janela já caem na partição da configuração/mês.
+        # Fora da transação da carga, para não segurar os bloqueios do ATTACH até o fim dela.
+        particoes.garantir_particoes(spec.model._meta.db_table, [config.pk], start_date_obj, end_date_obj)
+        if spec.nome == "ASSET":
+            return self.load_asset_csv(csv_source, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix)
+        self.load_export_csv(spec, csv_source, config, execution_timestamp, start_date_obj, end_date_obj, meter_id=meter_id, log_prefix=log_prefix)
+        return None
 
-        # Monta a query de deleção para fins de log
-        delete_query_log = f"""DELETE FROM "public"."api_consumocaiassetsumario" WHERE "configuracao_id" = {config.id} AND "execution_date" >= '{start_date_obj.isoformat()}' AND "execution_date" <= '{end_date_obj.isoformat()}' AND "meter_id" = '{meter_id}';"""
-        self.stdout.write(f"{log_prefix}    - Executando query de deleção: {delete_query_log}")
+    def run_export_flow(self, api_client, start_date_str, end_date_str, config, file_paths, start_date_obj, end_date_obj, job_type=None, meter_id=None, file_prefix="", export_spec=None, log_prefix=""):
+        export_name = job_type or f"meterId_{meter_id}"
+        export_spec = export_spec or EXPORT_SPECS[job_type]
+        self.stdout.write(f"\n{log_prefix} --- Iniciando fluxo de exportação para: {export_name} ---")
+        with tracing.span("exportacao", config, export_spec.nome, meter_id) as exportacao:
+            entrada_cache = self.entrada_cache(config, job_type, meter_id, start_date_obj, end_date_obj)
+            em_cache, resultado = self.carregar_do_cache(entrada_cache, config, start_date_obj, end_date_obj, export_spec, job_type=job_type, meter_id=meter_id, log_prefix=log_prefix)
+            if em_cache:
+                return resultado
+            job_id = self.criar_job_exportacao(api_client, start_date_str, end_date_str, config, job_type=job_type, meter_id=meter_id, log_prefix=log_prefix, entrada_cache=entrada_cache)
+            if not job_id:
+                exportacao.status = "FAILED"
+                return None
+            with tracing.span("aguardar_job", config, export_spec.nome, meter_id, job_id=job_id) as espera:
+                final_status = api_client.check_job_status(job_id, export_name, config.pk)
+                espera.status = final_status
+            self.registrar_status_job(config, export_name, job_id, final_status)
+            if final_status != "SUCCESS":
+                exportacao.status = "FAILED"
+                return None
+            return self.baixar_e_carregar(api_client, job_id, config, file_paths, start_date_obj, end_date_obj, export_spec, job_type=job_type, meter_id=meter_id, file_prefix=file_prefix, log_prefix=log_prefix, entrada_cache=entrada_cache)
+
+    def entrada_cache(self, config, job_type, meter_id, start_date_obj, end_date_obj):
+        if self.cache_exportacoes is None:
+            return None
+        return self.cache_exportacoes.entrada(config, job_type or f"meterId_{meter_id}", start_date_obj, end_date_obj)
 
-        deleted_count, _ = ConsumoCaiAssetSumario.objects.filter(**deletion_filter).delete()
-        self.stdout.write(f"{log_prefix}    - {deleted_count} registros antigos de CAI ASSET SUMMARY deletados.")
+    def carregar_do_cache(self, entrada_cache, config, start_date_obj, end_date_obj, export_spec, job_type=None, meter_id=None, log_prefix=""):
+        # Retorna (True, resultado da carga) quando a exportação da janela já está no cache
+        caminho = entrada_cache.artefato() if entrada_cache else None
+        if caminho is None:
+            return False, None
+        export_name = job_type or f"meterId_{meter_id}"
+        self.stdout.write(self.style.SUCCESS(f"{log_prefix} Exportação '{export_name}' da janela encontrada no cache ({caminho}). Pulando criação do job e download."))
+        metrics.registrar_cache(config, export_spec.nome, meter_id, "artefato")
+        registrar_log(configuracao=config, etapa="EXPORT_CACHE", status="SUCCESS", detalhes=f"Exportação '{export_name}' reaproveitada do cache ({entrada_cache.chave}).")
         try:
-            with open(csv_path, mode='r', encoding='utf-8') as infile:
-                reader = csv.DictReader(infile)
-                for i, row in enumerate(reader):
-                    lookup_params = {
-                        'configuracao': config, 'org_id': self._clean_value(row.get('Org ID')), 'executed_asset': self._clean_value(row.get('Executed asset')),
-                        'execution_date': self._safe_cast(row.get('Date (in UTC)'), datetime), 'execution_env': self._clean_value(row.get('Execution env')),
-                        'status': self._clean_value(row.get('status')), 'invoked_by': self._clean_value(row.get('Invoked by'))
-                    }
-                    if not all(lookup_params.values()):
-                        self.stdout.write(self.style.WARNING(f"{log_prefix}      [Linha {i+1}] Pulando linha por conter valores nulos na chave."))
-                        continue
-                    defaults_params = {
-                        'data_extracao': execution_timestamp,
-                        'meter_id': meter_id, # Populando a nova coluna
-                        'execution_type': self._clean_value(row.get('Execution type')),
-                        'execution_count': self._safe_cast(row.get('Execution count'), int),
-                        'total_execution_time_hours': self._safe_cast(row.get('Total Execution time (in hours)'), Decimal),
-                        'avg_execution_time_seconds': self._safe_cast(row.get('Average Execution time (in seconds)'), Decimal)
-                    }
-                    ConsumoCaiAssetSumario.objects.update_or_create(**lookup_params, defaults=defaults_params)
-            self.stdout.write(self.style.SUCCESS(f"{log_prefix}    - Dados de JOB (CAI) para o meter {meter_id} populados com sucesso."))
+            return True, self._carregar_zip(caminho, config, start_date_obj, end_date_obj, export_spec, meter_id, log_prefix, entrada_cache, origem="cache")
         except Exception as e:
-            self.stderr.write(f"{log_prefix}    - Erro ao processar CSV de Job (CAI): {e}")
-            raise
+            self._falha_carga(config, export_name, e, log_prefix)
+            return True, None
+
+    def criar_job_exportacao(self, api_client, start_date_str, end_date_str, config, job_type=None, meter_id=None, log_prefix="", entrada_cache=None):
+        tipo, meter = rotulos_exportacao(job_type, meter_id)
+        with tracing.etapa("criar_job", config, tipo, meter) as etapa:
+            job_id = self._reaproveitar_job(api_client, entrada_cache, config, job_type or f"meterId_{meter_id}", log_prefix)
+            if job_id:
+                etapa.anotar(reaproveitado=True)
+                metrics.registrar_cache(config, tipo, meter, "job")
+                return job_id
+            job_id = self._criar_job_exportacao(api_client, start_date_str, end_date_str, config, job_type, meter_id, log_prefix)
+            if not job_id:
+                etapa.status = "FAILED"
+            elif entrada_cache is not None:
+                entrada_cache.registrar_job(job_id)
+            return job_id
 
-    def get_filtered_meters_from_csv(self, csv_path, log_prefix=""):
-        self.stdout.write(f"{log_prefix}    - Lendo meters do arquivo: {csv_path}")
-        allowed_meter_names = {"Application Integration", "Application Integration with Advanced Serverless", "Data Integration", "Data Integration with Advanced Serverless"}
-        meters = {}
+    def _reaproveitar_job(self, api_client, entrada_cache, config, export_name, log_prefix=""):
+        # Job da mesma janela criado por uma execução anterior (dentro do TTL do cache) que ainda
+        # está em andamento ou terminou com sucesso: evita exportar tudo de novo
+        job_id = entrada_cache.job_pendente() if entrada_cache else None
+        if not job_id:
+            return None
         try:
-            with open(csv_path, mode='r', encoding='utf-8') as infile:
-                reader = csv.DictReader(infile)
-                for row in reader:
-                    meter_name = row.get('Meter Name')
-                    meter_id = row.get('Meter ID')
-                    if meter_name in allowed_meter_names and meter_id:
-                        meters[meter_id] = meter_name
-            self.stdout.write(f"{log_prefix}    - Encontrados {len(meters)} meters únicos após o filtro.")
-            return meters
-        except Exception as e:
-            self.stderr.write(f"{log_prefix}    - Erro ao ler meters do CSV: {e}")
-            return {}
+            status = api_client.consultar_status_job(job_id)
+        except requests.exceptions.RequestException as e:
+            self.stdout.write(self.style.WARNING(f"{log_prefix} Não foi possível consultar o job {job_id} de '{export_name}' do cache ({e}). Criando um novo."))
+            return None
+        if not status or (status in STATUS_FINAIS and status != "SUCCESS"):
+            self.stdout.write(f"{log_prefix} Job {job_id} de '{export_name}' do cache terminou com status {status}. Criando um novo.")
+            return None
+        self.stdout.write(self.style.SUCCESS(f"{log_prefix} Reaproveitando o job {job_id} de '{export_name}' criado em uma execução anterior (status {status})."))
+        registrar_log(configuracao=config, etapa="EXPORT_JOB", status="SUCCESS", detalhes=f"Job para '{export_name}' reaproveitado do cache. ID: {job_id}")
+        return job_id
 
-    def run_export_flow(self, api_client, start_date_str, end_date_str, config, file_paths, start_date_obj, end_date_obj, job_type=None, meter_id=None, file_prefix="", job_loader=None, log_prefix=""):
+    def _criar_job_exportacao(self, api_client, start_date_str, end_date_str, config, job_type=None, meter_id=None, log_prefix=""):
         export_name = job_type or f"meterId_{meter_id}"
-        export_suffix = job_type or f"meterId_{meter_id}"
-        self.stdout.write(f"\n{log_prefix} --- Iniciando fluxo de exportação para: {export_name} ---")
-        job_id = None
         max_attempts = 3
         for attempt in range(1, max_attempts + 1):
             try:
                 job_id = api_client.export_metering_data(start_date=start_date_str, end_date=end_date_str, job_type=job_type, meter_id=meter_id)
                 if job_id:
-                    ExtracaoLog.objects.create(configuracao=config, etapa="EXPORT_JOB", status="SUCCESS", detalhes=f"Job para '{export_name}' criado com sucesso. ID: {job_id}")
-                    break
+                    registrar_log(configuracao=config, etapa="EXPORT_JOB", status="SUCCESS", detalhes=f"Job para '{export_name}' criado com sucesso. ID: {job_id}")
+                    return job_id
             except requests.exceptions.RequestException as e:
                 self.stderr.write(self.style.ERROR(f"{log_prefix} Tentativa {attempt} de {max_attempts} falhou ao criar job para '{export_name}': {e}"))
                 if attempt == max_attempts:
-                    ExtracaoLog.objects.create(configuracao=config, etapa="EXPORT_JOB", status="FAILED", detalhes=f"Falha ao criar job para '{export_name}' após {max_attempts} tentativas.", mensagem_erro=str(e), resposta_api=e.response.text if e.response else None)
+                    registrar_log(configuracao=config, etapa="EXPORT_JOB", status="FAILED", detalhes=f"Falha ao criar job para '{export_name}' após {max_attempts} tentativas.", mensagem_erro=str(e), resposta_api=e.response.text if e.response else None)
                     return None
                 time.sleep(10)
-        if job_id:
-            final_status = api_client.check_job_status(job_id)
-            ExtracaoLog.objects.create(configuracao=config, etapa="CHECK_STATUS", status=final_status, detalhes=f"Status final do job '{export_name}' (ID: {job_id}) foi {final_status}.")
-            if final_status == "SUCCESS":
-                try:
-                    download_filename = f"export_{export_name.lower().replace(' ', '_')}_{job_id}.zip"
-                    download_path = os.path.join(file_paths['downloads'], download_filename)
+        return None
+
+    def registrar_status_job(self, config, export_name, job_id, final_status):
+        registrar_log(configuracao=config, etapa="CHECK_STATUS", status=final_status, detalhes=f"Status final do job '{export_name}' (ID: {job_id}) foi {final_status}.")
+
+    def baixar_e_carregar(self, api_client, job_id, config, file_paths, start_date_obj, end_date_obj, export_spec, job_type=None, meter_id=None, file_prefix="", log_prefix="", entrada_cache=None):
+        # Para ASSET retorna os meters encontrados no arquivo; para os demais, None
+        export_name = job_type or f"meterId_{meter_id}"
+        export_suffix = job_type or f"meterId_{meter_id}"
+        rotulos = (config, export_spec.nome, meter_id)
+        try:
+            if entrada_cache is not None:
+                # O ZIP vai para o cache (retomando um download parcial) e a carga lê direto dele
+                with tracing.etapa("download", *rotulos) as etapa:
+                    total_bytes = api_client.download_export_retomavel(job_id, entrada_cache.preparar_download(job_id))
+                    zip_path = entrada_cache.concluir(job_id) if total_bytes else None
+                    if zip_path:
+                        etapa.anotar(bytes=total_bytes)
+                if zip_path:
+                    metrics.registrar_download(*rotulos, etapa.bytes)
+                    return self._carregar_zip(zip_path, config, start_date_obj, end_date_obj, export_spec, meter_id, log_prefix, entrada_cache)
+            elif self.stream_exports:
+                with tracing.etapa("download", *rotulos) as etapa:
+                    zip_buffer = api_client.download_export_buffer(job_id)
+                    if zip_buffer:
+                        zip_buffer.seek(0, os.SEEK_END)
+                        etapa.anotar(bytes=zip_buffer.tell())
+                        zip_buffer.seek(0)
+                if zip_buffer:
+                    metrics.registrar_download(*rotulos, etapa.bytes)
+                    with zip_buffer, abrir_csv_do_zip(zip_buffer) as csv_stream, tracing.etapa("carga", *rotulos):
+                        return self._load_export_csv(csv_stream, config, start_date_obj, end_date_obj, export_spec, meter_id, log_prefix)
+            else:
+                download_filename = f"export_{export_name.lower().replace(' ', '_')}_{job_id}.zip"
+                download_path = os.path.join(file_paths['downloads'], download_filename)
+                with tracing.etapa("download", *rotulos) as etapa:
                     zip_path = api_client.download_export_file(job_id, download_path)
                     if zip_path:
+                        etapa.anotar(bytes=os.path.getsize(zip_path))
+                if zip_path:
+                    metrics.registrar_download(*rotulos, etapa.bytes)
+                    with tracing.etapa("unzip", *rotulos) as etapa:
                         csv_path = self.unzip_file(zip_path, file_paths['arquivos'], export_suffix, file_prefix, log_prefix)
-                        if csv_path:
-                            execution_timestamp = timezone.now()
-                            if job_type == "SUMMARY": self.load_summary_csv(csv_path, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix)
-                            elif job_type == "PROJECT_FOLDER": self.load_project_folder_csv(csv_path, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix)
-                            elif job_type == "ASSET":
-                                self.load_asset_csv(csv_path, config, execution_timestamp, start_date_obj, end_date_obj, log_prefix)
-                                return csv_path
-                            elif meter_id and job_loader:
-                                job_loader(csv_path, config, meter_id, execution_timestamp, start_date_obj, end_date_obj, log_prefix)
-                except Exception as e:
-                    self.stderr.write(self.style.ERROR(f"{log_prefix}    - Erro CRÍTICO ao popular dados: {e}"))
-                    ExtracaoLog.objects.create(configuracao=config, etapa="LOAD_CSV", status="FAILED", detalhes=f"Falha ao carregar dados para '{export_name}'", mensagem_erro=str(e))
+                        if not csv_path:
+                            etapa.status = "FAILED"
+                    if csv_path:
+                        with tracing.etapa("carga", *rotulos):
+                            return self._load_export_csv(csv_path, config, start_date_obj, end_date_obj, export_spec, meter_id, log_prefix)
+        except Exception as e:
+            self._falha_carga(config, export_name, e, log_prefix)
         return None
 
+    def _carregar_zip(self, zip_path, config, start_date_obj, end_date_obj, export_spec, meter_id, log_prefix, entrada_cache=None, **atributos):
+        with open(zip_path, 'rb') as arquivo, abrir_csv_do_zip(arquivo) as csv_stream, tracing.etapa("carga", config, export_spec.nome, meter_id, **atributos):
+            resultado = self._load_export_csv(csv_stream, config, start_date_obj, end_date_obj, export_spec, meter_id, log_prefix)
+        if entrada_cache is not None:
+            # Carga gravada: a próxima execução exporta a janela de novo (ela pode ter dados
+            # novos, como o dia corrente) em vez de recarregar este arquivo
+            entrada_cache.descartar()
+        return resultado
+
+    def _falha_carga(self, config, export_name, erro, log_prefix=""):
+        self.stderr.write(self.style.ERROR(f"{log_prefix}    - Erro CRÍTICO ao popular dados: {erro}"))
+        registrar_log(configuracao=config, etapa="LOAD_CSV", status="FAILED", detalhes=f"Falha ao carregar dados para '{export_name}'", mensagem_erro=str(erro))
+
     def run_summary_asset_jobs_flow(self, api_client, start_date_str, end_date_str, config, file_paths, start_date_obj, end_date_obj, log_prefix):
         self.run_export_flow(api_client, start_date_str, end_date_str, config, file_paths, start_date_obj, end_date_obj, job_type="SUMMARY", log_prefix=log_prefix)
-        asset_csv_path = self.run_export_flow(api_client, start_date_str, end_date_str, config, file_paths, start_date_obj, end_date_obj, job_type="ASSET", log_prefix=log_prefix)
-        if asset_csv_path and os.path.exists(asset_csv_path):
-            asset_basename = os.path.splitext(os.path.basename(asset_csv_path))[0]
-            asset_prefix = asset_basename.removesuffix('_ASSET') + '_'
-            cdi_meter_id = "a2nB20h1o0lc7k3P9xtWS8"
-            cai_meter_ids = {"bN6mes5n4GGciiMkuoDlCz", "3uIRkIV5Rt9lBbAPzeR5Kj"}
-            meters = self.get_filtered_meters_from_csv(asset_csv_path, log_prefix)
-            if not meters:
-                self.stdout.write(f"{log_prefix} Nenhum meter (CDI/CAI) encontrado no arquivo de Asset para processar.")
-            else:
-                self.stdout.write(f"\n{log_prefix} Iniciando extração detalhada para {len(meters)} meters encontrados...")
-                for meter_id, meter_name in meters.items():
-                    job_loader_func = None
-                    if meter_id == cdi_meter_id: job_loader_func = self.load_cdi_job_csv
-                    elif meter_id in cai_meter_ids: job_loader_func = self.load_cai_asset_summary_csv
-                    if job_loader_func:
-                        self.run_export_flow(api_client, start_date_str, end_date_str, config, file_paths, start_date_obj, end_date_obj, meter_id=meter_id, file_prefix=asset_prefix, job_loader=job_loader_func, log_prefix=log_prefix)
-                    else:
-                        self.stdout.write(self.style.WARNING(f"{log_prefix}    - Meter ID {meter_id} ({meter_name}) não possui um loader definido. Pulando."))
-        else:
+        meters = self.run_export_flow(api_client, start_date_str, end_date_str, config, file_paths, start_date_obj, end_date_obj, job_type="ASSET", log_prefix=log_prefix)
+        # Agrupa os CSVs dos meters pela janela de extração do ASSET correspondente
+        asset_prefix = f"{start_date_obj:%Y%m%d}_{end_date_obj:%Y%m%d}_"
+        for meter_id, meter_spec in self.meters_para_exportar(meters, config, log_prefix):
+            self.run_export_flow(api_client, start_date_str, end_date_str, config, file_paths, start_date_obj, end_date_obj, meter_id=meter_id, file_prefix=asset_prefix, export_spec=meter_spec, log_prefix=log_prefix)
+
+    def meters_para_exportar(self, meters, config, log_prefix=""):
+        # Recebe o retorno da carga do ASSET e devolve [(meter_id, spec)] dos meters com loader
+        if meters is None:
             self.stderr.write(self.style.ERROR(f"{log_prefix} Arquivo de ASSET não foi gerado ou encontrado. Fluxo de jobs (CDI/CAI) não pode continuar."))
-            ExtracaoLog.objects.create(configuracao=config, etapa="EXPORT_JOB", status="FAILED", detalhes="Falha ao gerar ou localizar arquivo de ASSET.")
+            registrar_log(configuracao=config, etapa="EXPORT_JOB", status="FAILED", detalhes="Falha ao gerar ou localizar arquivo de ASSET.")
+            return []
+        if not meters:
+            self.stdout.write(f"{log_prefix} Nenhum meter (CDI/CAI) encontrado no arquivo de Asset para processar.")
+            return []
+        self.stdout.write(f"\n{log_prefix} Iniciando extração detalhada para {len(meters)} meters encontrados...")
+        exportar = []
+        for meter_id, meter_name in meters.items():
+            meter_spec = METER_SPECS.get(meter_id)
+            if meter_spec:
+                exportar.append((meter_id, meter_spec))
+            else:
+                self.stdout.write(self.style.WARNING(f"{log_prefix}    - Meter ID {meter_id} ({meter_name}) não possui um loader definido. Pulando."))
+        return exportar
 
     def _execute_extraction_for_period(self, api_client, config, file_paths, log_prefix, period_start, period_end):
+        with tracing.span("janela", config, inicio=f"{period_start:%Y-%m-%d}", fim=f"{period_end:%Y-%m-%d}") as janela:
+            sucesso = self._executar_periodo(api_client, config, file_paths, log_prefix, period_start, period_end)
+            if not sucesso:
+                janela.status = "FAILED"
+            return sucesso
+
+    def _executar_periodo(self, api_client, config, file_paths, log_prefix, period_start, period_end):
         try:
             # A API da Informatica espera datas em UTC
             start_date_str = period_start.astimezone(timezone.utc).strftime("%Y-%m-%dT00:00:00Z")
@@ -502,28 +784,40 @@ class Command(BaseCommand):
             # Os filtros do Django devem usar objetos aware no timezone da aplicação (São Paulo)
             start_date_for_filter = period_start.replace(hour=0, minute=0, second=0, microsecond=0)
             end_date_for_filter = period_end.replace(hour=23, minute=59, second=59, microsecond=999999)
+            if self.orchestrator == 'async':
+                semaforo = semaforo_do_pod(config.iics_pod_url, self.max_jobs_per_pod)
+                orquestrador = OrquestradorJanela(self, api_client, config, file_paths, semaforo, log_prefix)
+                orquestrador.executar(start_date_str, end_date_str, start_date_for_filter, end_date_for_filter)
+                return True
             with ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"{log_prefix}_sub") as sub_executor:
-                future_asset_chain = sub_executor.submit(self.run_summary_asset_jobs_flow, api_client, start_date_str, end_date_str, config, file_paths, start_date_for_filter, end_date_for_filter, log_prefix)
-                future_project = sub_executor.submit(self.run_export_flow, api_client, start_date_str, end_date_str, config, file_paths, start_date_for_filter, end_date_for_filter, job_type="PROJECT_FOLDER", log_prefix=log_prefix)
+                future_asset_chain = sub_executor.submit(tracing.em_contexto(_fechando_conexao(self.run_summary_asset_jobs_flow)), api_client, start_date_str, end_date_str, config, file_paths, start_date_for_filter, end_date_for_filter, log_prefix)
+                future_project = sub_executor.submit(tracing.em_contexto(_fechando_conexao(self.run_export_flow)), api_client, start_date_str, end_date_str, config, file_paths, start_date_for_filter, end_date_for_filter, job_type="PROJECT_FOLDER", log_prefix=log_prefix)
                 future_asset_chain.result()
                 future_project.result()
             return True
         except Exception as e:
             self.stderr.write(self.style.ERROR(f"{log_prefix} Falha crítica ao executar extração para o período de {period_start.date()} a {period_end.date()}: {e}"))
-            ExtracaoLog.objects.create(configuracao=config, etapa="EXECUCAO_LOTE", status="FAILED", mensagem_erro=str(e))
+            registrar_log(configuracao=config, etapa="EXECUCAO_LOTE", status="FAILED", mensagem_erro=str(e))
             return False
 
     def processar_configuracao(self, config):
+        with tracing.span("configuracao", config):
+            self._processar_configuracao(config)
+
+    def _processar_configuracao(self, config):
         start_time = time.monotonic()
         log_prefix = f"[{config.apelido_configuracao} | {config.cliente.nome_cliente}]"
         self.stdout.write(f"\n>> Processando: {log_prefix}")
+        api_client = None
+        carregou = False
         try:
             self._cleanup_config_files(config)
             arquivos_dir, downloads_dir = self._get_config_specific_paths(config)
             file_paths = {'arquivos': arquivos_dir, 'downloads': downloads_dir}
-            api_client = InformaticaAPIClient(config.iics_pod_url, config.iics_username, config.iics_password, self, log_prefix)
-            if not api_client.login(): return
-            ExtracaoLog.objects.create(configuracao=config, etapa="LOGIN", status="SUCCESS")
+            api_client = InformaticaAPIClient(config.iics_pod_url, config.iics_username, config.iics_password, self, log_prefix, configuracao=config, sessoes=cache_sessoes(), max_conexoes=self._conexoes_por_cliente())
+            with tracing.etapa("login", config):
+                if not api_client.login(): return
+            registrar_log(configuracao=config, etapa="LOGIN", status="SUCCESS")
             
             # Toda a lógica de datas será baseada no fuso horário de São Paulo
             now_in_sao_paulo = timezone.now().astimezone(self.SAO_PAULO_TZ)
@@ -544,48 +838,132 @@ class Command(BaseCommand):
             total_days = (overall_end_date - overall_start_date).days
             self.stdout.write(f"{log_prefix} Período total a ser processado: de {overall_start_date.date()} a {overall_end_date.date()} ({total_days + 1} dias).")
             
-            all_runs_successful = True
             if total_days > 30:
-                self.stdout.write(f"{log_prefix} Período maior que 30 dias. A extração será dividida em lotes.")
-                current_start = overall_start_date
-                # Corrigido para '<=' para garantir que o último dia do intervalo seja processado.
-                while current_start.date() <= overall_end_date.date():
-                    current_end = current_start + timedelta(days=30)
-                    if current_end > overall_end_date:
-                        current_end = overall_end_date
-                    success = self._execute_extraction_for_period(api_client, config, file_paths, log_prefix, current_start, current_end)
-                    if not success:
-                        all_runs_successful = False
-                        self.stderr.write(self.style.ERROR(f"{log_prefix} Falha na extração do lote. O processo para esta configuração será abortado."))
-                        break
-                    self.stdout.write(self.style.SUCCESS(f"{log_prefix} Lote de {current_start.date()} a {current_end.date()} concluído com sucesso."))
-                    current_start = current_end + timedelta(days=1)
+                self.stdout.write(f"{log_prefix} Período maior que 30 dias. A extração será dividida em lotes (até {self.max_parallel_windows} em paralelo).")
             else:
                 self.stdout.write(f"{log_prefix} Período de 30 dias ou menos. Realizando extração completa.")
-                success = self._execute_extraction_for_period(api_client, config, file_paths, log_prefix, overall_start_date, overall_end_date)
-                if not success:
-                    all_runs_successful = False
+            janelas = self._janelas_extracao(overall_start_date, overall_end_date)
+            carregou = True
+            resultados = self._executar_janelas(api_client, config, file_paths, log_prefix, janelas)
+            carregadas = [janela for janela, ok in zip(janelas, resultados) if ok]
+            if carregadas:
+                self._atualizar_rollups_configuracao(config, carregadas[0][0], carregadas[-1][1] + DIA_APOS_JANELA, log_prefix)
 
-            if all_runs_successful:
+            # O marcador só avança até o fim da maior sequência de lotes bem-sucedidos a partir
+            # do primeiro; um lote com falha no meio não descarta os anteriores
+            concluidas = 0
+            while concluidas < len(janelas) and resultados[concluidas]:
+                concluidas += 1
+            if concluidas == len(janelas):
+                marcador = overall_end_date.date()
+            elif concluidas:
+                marcador = janelas[concluidas - 1][1].date()
+            else:
+                marcador = None
+
+            if marcador is not None:
                 # Salva a data (sem hora) do final da extração bem-sucedida (no fuso de São Paulo)
-                config.ultima_extracao_enddate = overall_end_date.date()
+                config.ultima_extracao_enddate = marcador
                 config.save()
-                self.stdout.write(self.style.SUCCESS(f"{log_prefix} Extração concluída. Marcador 'ultima_extracao_enddate' atualizado para {overall_end_date.date()}"))
-                
+                if concluidas == len(janelas):
+                    self.stdout.write(self.style.SUCCESS(f"{log_prefix} Extração concluída. Marcador 'ultima_extracao_enddate' atualizado para {marcador}"))
+                else:
+                    self.stderr.write(self.style.WARNING(f"{log_prefix} Extração parcial: {concluidas} de {len(janelas)} lotes concluídos em sequência. Marcador 'ultima_extracao_enddate' atualizado para {marcador}"))
+
                 # Após a carga bem-sucedida, atualiza os ciclos de faturamento
                 self._atualizar_ciclos_faturamento(config, log_prefix)
             else:
                 self.stderr.write(self.style.ERROR(f"{log_prefix} Extração falhou. O marcador 'ultima_extracao_enddate' não será atualizado."))
         except Exception as e:
             self.stderr.write(self.style.ERROR(f"{log_prefix} Ocorreu um erro inesperado durante o fluxo: {e}"))
-            ExtracaoLog.objects.create(configuracao=config, etapa="FLUXO_GERAL", status="FAILED", mensagem_erro=str(e))
+            registrar_log(configuracao=config, etapa="FLUXO_GERAL", status="FAILED", mensagem_erro=str(e))
         finally:
             end_time = time.monotonic()
             duration = timedelta(seconds=end_time - start_time)
             self.stdout.write(self.style.SUCCESS(f"{log_prefix} Processo concluído em {duration}"))
+            # Usada pelo agendador para ordenar a fila da próxima execução
+            ConfiguracaoIDMC.objects.filter(pk=config.pk).update(ultima_duracao_segundos=end_time - start_time)
+            metrics.registrar_configuracao(config, end_time - start_time)
+            if carregou:
+                # Mesmo com falha no meio: as janelas que terminaram já estão gravadas
+                try:
+                    agregacoes.invalidar(config.pk)
+                except Exception as e:
+                    self.stderr.write(f"{log_prefix} Não foi possível invalidar o cache das agregações: {e}")
+            if api_client is not None:
+                try:
+                    api_client.liberar_sessao()
+                except Exception as e:
+                    self.stderr.write(f"{log_prefix} Não foi possível gravar o último uso da sessão da API: {e}")
             connection.close()
 
+    def _janelas_extracao(self, overall_start_date, overall_end_date):
+        # Lotes de até 30 dias cobrindo o período, na ordem cronológica
+        if (overall_end_date - overall_start_date).days <= 30:
+            return [(overall_start_date, overall_end_date)]
+        janelas = []
+        current_start = overall_start_date
+        # Corrigido para '<=' para garantir que o último dia do intervalo seja processado.
+        while current_start.date() <= overall_end_date.date():
+            current_end = current_start + timedelta(days=30)
+            if current_end > overall_end_date:
+                current_end = overall_end_date
+            janelas.append((current_start, current_end))
+            current_start = current_end + timedelta(days=1)
+        return janelas
+
+    def _executar_janelas(self, api_client, config, file_paths, log_prefix, janelas):
+        # Executa os lotes em paralelo (até max_parallel_windows) e retorna o sucesso de cada um,
+        # na mesma ordem de janelas. Depois de uma falha, os lotes seguintes que ainda não
+        # começaram são cancelados: não poderiam mais avançar o marcador.
+        resultados = [False] * len(janelas)
+
+        def executar(indice):
+            period_start, period_end = janelas[indice]
+            try:
+                success = self._execute_extraction_for_period(api_client, config, file_paths, log_prefix, period_start, period_end)
+            finally:
+                if len(janelas) > 1:
+                    connection.close()
+            if success:
+                self.stdout.write(self.style.SUCCESS(f"{log_prefix} Lote de {period_start.date()} a {period_end.date()} concluído com sucesso."))
+            else:
+                self.stderr.write(self.style.ERROR(f"{log_prefix} Falha na extração do lote de {period_start.date()} a {period_end.date()}."))
+            return success
+
+        if len(janelas) == 1:
+            resultados[0] = executar(0)
+            return resultados
+        # O worker da própria configuração roda um lote; os demais vêm do orçamento do agendador
+        extras = min(self.max_parallel_windows, len(janelas)) - 1
+        if self.agendador:
+            extras = self.agendador.emprestar_workers(extras)
+        try:
+            with ThreadPoolExecutor(max_workers=1 + extras, thread_name_prefix=f"{log_prefix}_lote") as executor:
+                futures = {executor.submit(tracing.em_contexto(executar), indice): indice for indice in range(len(janelas))}
+                primeira_falha = len(janelas)
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        # Cancelado abaixo: o resultado continua False
+                        continue
+                    indice = futures[future]
+                    resultados[indice] = future.result()
+                    if not resultados[indice] and indice < primeira_falha:
+                        primeira_falha = indice
+                        for outro, outro_indice in futures.items():
+                            if outro_indice > indice and outro.cancel():
+                                self.stderr.write(self.style.WARNING(f"{log_prefix} Lote de {janelas[outro_indice][0].date()} a {janelas[outro_indice][1].date()} cancelado após a falha de um lote anterior."))
+        finally:
+            if self.agendador:
+                self.agendador.devolver_workers(extras)
+        return resultados
+
     def _atualizar_ciclos_faturamento(self, config, log_prefix=""):
+        with tracing.etapa("ciclo_faturamento", config) as etapa:
+            if not self._atualizar_ciclos(config, log_prefix):
+                etapa.status = "FAILED"
+
+    def _atualizar_ciclos(self, config, log_prefix=""):
         self.stdout.write(f"{log_prefix} 6. Atualizando ciclos de faturamento...")
         try:
             # Busca todos os períodos de faturamento distintos para a configuração atual
@@ -614,18 +992,141 @@ class Command(BaseCommand):
                         self.stdout.write(f"{log_prefix}    - Ciclo de faturamento atualizado: Ciclo {ciclo.ciclo_id} ({ciclo.billing_period_start_date} a {ciclo.billing_period_end_date})")
 
             self.stdout.write(self.style.SUCCESS(f"{log_prefix} Ciclos de faturamento atualizados com sucesso."))
+            return True
         except Exception as e:
             self.stderr.write(self.style.ERROR(f"{log_prefix} Erro ao atualizar ciclos de faturamento: {e}"))
-            ExtracaoLog.objects.create(configuracao=config, etapa="CICLO_FATURAMENTO", status="FAILED", mensagem_erro=str(e))
+            registrar_log(configuracao=config, etapa="CICLO_FATURAMENTO", status="FAILED", mensagem_erro=str(e))
+            return False
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS("==== INICIANDO ROTINA DE EXTRAÇÃO DE CONSUMO IICS ===="))
-        configs_para_processar = list(ConfiguracaoIDMC.objects.filter(ativo=True))
+        self.batch_size = options['batch_size']
+        self.loader_modes = self._parse_por_tipo(options['loader_mode'], '--loader-mode', self.LOADER_MODES)
+        self.parser_engines = self._parse_por_tipo(options['parser_engine'], '--parser-engine', self.PARSER_ENGINES)
+        if 'pandas' in self.parser_engines.values() and not pandas_disponivel():
+            raise CommandError("O motor 'pandas' foi solicitado, mas a biblioteca pandas não está instalada.")
+        self.stream_exports = options['stream_exports']
+        self.orchestrator = options['orchestrator']
+        if options['max_jobs_per_pod'] < 1:
+            raise CommandError("--max-jobs-per-pod deve ser maior ou igual a 1.")
+        self.max_jobs_per_pod = options['max_jobs_per_pod']
+        if options['max_parallel_windows'] < 1:
+            raise CommandError("--max-parallel-windows deve ser maior ou igual a 1.")
+        self.max_parallel_windows = options['max_parallel_windows']
+        if options['max_workers'] < 1 or options['max_configs_per_pod'] < 1:
+            raise CommandError("--max-workers e --max-configs-per-pod devem ser maiores ou iguais a 1.")
+        self._dimensionar_pool(options['max_workers'])
+        self._preparar_cache(options['no_export_cache'])
+        configs = ConfiguracaoIDMC.objects.filter(ativo=True).select_related('cliente')
+        if options['config_id']:
+            configs = configs.filter(pk__in=options['config_id'])
+        configs_para_processar = list(configs)
         if not configs_para_processar:
             self.stdout.write(self.style.WARNING("Nenhuma configuração ativa encontrada no banco de dados. Saindo."))
             return
-        MAX_WORKERS = 5
-        self.stdout.write(f"Encontradas {len(configs_para_processar)} configurações para processar. Iniciando com até {MAX_WORKERS} workers paralelos.")
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            executor.map(self.processar_configuracao, configs_para_processar)
-        self.stdout.write(self.style.SUCCESS("\n==== ROTINA DE EXTRAÇÃO FINALIZADA ===="))
\ No newline at end of file
+        self._preparar_particoes(configs_para_processar)
+        self.agendador = AgendadorConfiguracoes(self.processar_configuracao, max_workers=options['max_workers'], max_por_pod=options['max_configs_per_pod'], ao_despachar=self._registrar_espera_fila)
+        self.stdout.write(f"Encontradas {len(configs_para_processar)} configurações para processar. Iniciando com até {self.agendador.max_workers} workers e {self.agendador.max_por_pod} configurações por pod.")
+        sigterm_anterior = self._encerrar_em_sigterm()
+        try:
+            with tracing.span("execucao", workers=self.agendador.max_workers, configuracoes=len(configs_para_processar)) as execucao:
+                execucoes = self.agendador.executar_todas(configs_para_processar)
+            self.stdout.write(f"Spans da execução gravados com execucao_id={execucao.execucao_id} (veja: manage.py trace_critical_path {execucao.execucao_id}).")
+        finally:
+            # Grava os logs ainda na fila, inclusive quando a execução é interrompida
+            encerrar_registradores()
+            self._escrever_metricas(options['metrics_textfile'])
+            if sigterm_anterior is not None:
+                signal.signal(signal.SIGTERM, sigterm_anterior)
+        self._reportar_agendamento(execucoes)
+        self._reportar_pool()
+        self.stdout.write(self.style.SUCCESS("\n==== ROTINA DE EXTRAÇÃO FINALIZADA ===="))
+
+    def _preparar_cache(self, desativado):
+        if desativado:
+            self.cache_exportacoes = None
+            return
+        self.cache_exportacoes = CacheExportacoes.das_configuracoes()
+        removidas, liberados = self.cache_exportacoes.podar()
+        self.stdout.write(
+            f"Cache de exportações em {self.cache_exportacoes.diretorio}: {removidas} entradas removidas "
+            f"({liberados / 1024 / 1024:.1f} MB), {self.cache_exportacoes.tamanho_total() / 1024 / 1024:.1f} MB em uso."
+        )
+
+    def _preparar_particoes(self, configs):
+        # Partições do mês atual e dos próximos; sem particionamento (ex.: SQLite) não faz nada
+        try:
+            criadas = particoes.criar_particoes_a_frente([config.pk for config in configs])
+        except Exception as e:
+            self.stderr.write(self.style.WARNING(f"Não foi possível criar as partições à frente das tabelas de consumo: {e}"))
+            return
+        total = sum(len(novas) for novas in criadas.values())
+        if total:
+            self.stdout.write(f"{total} partições criadas à frente nas tabelas de consumo.")
+
+    def _escrever_metricas(self, caminho):
+        if not caminho:
+            return
+        try:
+            if metrics.escrever_textfile(caminho):
+                self.stdout.write(f"Métricas da execução gravadas em {caminho}.")
+        except OSError as e:
+            self.stderr.write(self.style.WARNING(f"Não foi possível gravar as métricas em {caminho}: {e}"))
+
+    def _encerrar_em_sigterm(self):
+        # SIGTERM (ex.: docker stop) vira SystemExit, para os finally rodarem antes do processo sair
+        if threading.current_thread() is not threading.main_thread():
+            return None
+        def sair(signum, frame):
+            # Os workers ainda terminam o que estão fazendo; os logs já enfileirados não esperam por eles
+            descarregar_registradores()
+            raise SystemExit(128 + signum)
+        return signal.signal(signal.SIGTERM, sair)
+
+    def _conexoes_por_cliente(self):
+        # Exportações que um cliente da API pode ter em andamento ao mesmo tempo, mais as
+        # consultas de status: no modo async o semáforo do pod limita os jobs; no modo threads
+        # cada lote roda a cadeia SUMMARY/ASSET e o PROJECT_FOLDER em paralelo
+        if self.orchestrator == 'async':
+            return self.max_jobs_per_pod + CONSULTAS_SIMULTANEAS
+        return 2 * self.max_parallel_windows + CONSULTAS_SIMULTANEAS
+
+    def _dimensionar_pool(self, max_workers):
+        # Cada worker usa a própria thread mais, no modo async, até max_jobs_per_pod threads de
+        # criação de job e carga; no modo threads, até max_parallel_windows lotes, cada um com a
+        # sua thread e as duas do _sub. As consultas do poller compartilhado entram uma única vez
+        if not settings.DB_POOL_ENABLED:
+            return
+        if self.orchestrator == 'async':
+            por_worker = 1 + self.max_jobs_per_pod
+        else:
+            por_worker = 1 + 3 * self.max_parallel_windows
+        tamanho = max_workers * por_worker + CONSULTAS_SIMULTANEAS
+        definir_tamanho_maximo(tamanho)
+        self.stdout.write(f"Pool de conexões do banco dimensionado para {tamanho} conexões ({max_workers} workers).")
+
+    def _reportar_pool(self):
+        for alias, pool in pools_ativos().items():
+            stats = pool.estatisticas()
+            espera_media = stats['espera_total_segundos'] / stats['retiradas'] if stats['retiradas'] else 0
+            self.stdout.write(
+                f"\nPool de conexões '{alias}': {stats['retiradas']} retiradas, {stats['conexoes_criadas']} conexões abertas "
+                f"(máx. {stats['tamanho_maximo']}), {stats['esperas']} esperas por conexão livre "
+                f"(média {espera_media * 1000:.1f}ms, máxima {stats['espera_maxima_segundos'] * 1000:.1f}ms), "
+                f"{stats['timeouts']} timeouts, {stats['falhas_verificacao']} conexões descartadas na verificação."
+            )
+
+    def _registrar_espera_fila(self, config, espera):
+        self.stdout.write(f"[{config.apelido_configuracao} | {config.cliente.nome_cliente}] Iniciando após {espera:.1f}s na fila do agendador.")
+        registrar_log(configuracao=config, etapa="FILA", status="SUCCESS", detalhes=f"Aguardou {espera:.1f}s na fila do agendador (pod {config.iics_pod_url}).")
+
+    def _reportar_agendamento(self, execucoes):
+        if not execucoes:
+            return
+        self.stdout.write("\nResumo do agendamento (na ordem de início):")
+        self.stdout.write(f"  {'Configuração':<40} {'Fila (s)':>10} {'Duração (s)':>12}  Pod")
+        for execucao in sorted(execucoes, key=lambda e: e.espera_segundos):
+            nome = f"{execucao.config.apelido_configuracao} | {execucao.config.cliente.nome_cliente}"
+            self.stdout.write(f"  {nome[:40]:<40} {execucao.espera_segundos:>10.1f} {execucao.duracao_segundos:>12.1f}  {execucao.pod}")
+        esperas = [e.espera_segundos for e in execucoes]
+        self.stdout.write(f"  Espera média na fila: {sum(esperas) / len(esperas):.1f}s; máxima: {max(esperas):.1f}s")
\ No newline at end of file
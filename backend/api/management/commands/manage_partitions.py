@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ingestion import particoes
+from api.models import ConfiguracaoIDMC
+
+
+class Command(BaseCommand):
+    help = 'Cria com antecedência as partições mensais das tabelas de consumo e realoca as linhas que caíram na partição DEFAULT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=particoes.MESES_A_FRENTE_PADRAO, help='Meses, além do atual, com partição criada para cada configuração ativa.')
+        parser.add_argument('--list', action='store_true', help='Só lista as partições existentes, com linhas estimadas e tamanho.')
+
+    def handle(self, *args, **options):
+        tabelas = [tabela for tabela in particoes.TABELAS_PARTICIONADAS if particoes.particionada(tabela)]
+        if not tabelas:
+            raise CommandError("Nenhuma tabela de consumo está particionada (o particionamento exige PostgreSQL e a migration 0021).")
+        if options['list']:
+            self._listar(tabelas)
+            return
+        if options['months_ahead'] < 0:
+            raise CommandError("--months-ahead deve ser maior ou igual a 0.")
+        ids = list(ConfiguracaoIDMC.objects.filter(ativo=True).values_list('pk', flat=True))
+        criadas = particoes.criar_particoes_a_frente(ids, options['months_ahead'])
+        realocadas = particoes.realocar_padrao()
+        for tabela in tabelas:
+            novas = criadas.get(tabela, [])
+            movidas = realocadas.get(tabela, [])
+            self.stdout.write(
+                f"{tabela}: {len(novas)} partições criadas à frente para {len(ids)} configurações ativas; "
+                f"{len(movidas)} partições criadas para {sum(linhas for _, linhas in movidas)} linhas que estavam na DEFAULT."
+            )
+        self.stdout.write(self.style.SUCCESS("Partições atualizadas."))
+
+    def _listar(self, tabelas):
+        for tabela in tabelas:
+            linhas = particoes.resumo(tabela)
+            total = sum(tamanho for _, _, _, tamanho in linhas)
+            self.stdout.write(f"\n{tabela}: {len(linhas)} partições, {total / 1024 / 1024:.1f} MB")
+            for nome, limites, estimadas, tamanho in linhas:
+                self.stdout.write(f"  {nome:<45} {estimadas:>12} linhas {tamanho / 1024 / 1024:>9.1f} MB  {limites}")
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from api import agregacoes
+from api.ingestion import rollups
+from api.models import ConfiguracaoIDMC
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os rollups de consumo (diário por meter, diário por projeto/pasta e por ciclo de faturamento) a partir das tabelas de consumo, ou confere se estão consistentes com elas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config-id', type=int, action='append', default=[], help='Processa apenas as configurações com estes IDs (pode repetir). Padrão: todas.')
+        parser.add_argument('--rollup', action='append', choices=list(rollups.ROLLUPS), default=[], help='Rollups processados (pode repetir). Padrão: todos.')
+        parser.add_argument('--check', action='store_true', help='Não grava nada: compara os rollups com a agregação das tabelas de consumo e falha se houver diferença.')
+
+    def handle(self, *args, **options):
+        configs = ConfiguracaoIDMC.objects.order_by('pk')
+        if options['config_id']:
+            configs = configs.filter(pk__in=options['config_id'])
+        selecionados = [rollups.ROLLUPS[nome] for nome in options['rollup'] or rollups.ROLLUPS]
+        if options['check']:
+            self._verificar(configs, selecionados)
+            return
+        for config in configs:
+            for rollup in selecionados:
+                apagadas, gravadas = rollup.reconstruir(config)
+                self.stdout.write(f"[{config.apelido_configuracao}] {rollup.nome}: {gravadas} linhas gravadas ({apagadas} anteriores apagadas).")
+            agregacoes.invalidar(config.pk)
+        self.stdout.write(self.style.SUCCESS("Rollups reconstruídos."))
+
+    def _verificar(self, configs, selecionados):
+        inconsistentes = 0
+        for config in configs:
+            for rollup in selecionados:
+                resultado = rollup.verificar(config)
+                diferencas = resultado['faltando'] + resultado['sobrando'] + resultado['divergentes']
+                if not diferencas:
+                    self.stdout.write(f"[{config.apelido_configuracao}] {rollup.nome}: OK")
+                    continue
+                inconsistentes += 1
+                self.stdout.write(self.style.WARNING(
+                    f"[{config.apelido_configuracao}] {rollup.nome}: {resultado['faltando']} faltando, "
+                    f"{resultado['sobrando']} sobrando, {resultado['divergentes']} divergentes"
+                ))
+                for tipo, chave, esperado, gravado in resultado['exemplos']:
+                    self.stdout.write(f"    {tipo} {chave}: esperado {esperado}, gravado {gravado}")
+        if inconsistentes:
+            raise CommandError(f"{inconsistentes} rollups inconsistentes com as tabelas de consumo; rode rebuild_rollups sem --check para reconstruí-los.")
+        self.stdout.write(self.style.SUCCESS("Rollups consistentes com as tabelas de consumo."))
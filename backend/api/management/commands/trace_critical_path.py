@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.extraction.tracing import caminho_critico
+from api.models import SpanExtracao
+
+
+def descrever_span(span):
+    partes = [span.configuracao.apelido_configuracao if span.configuracao_id else None, span.tipo_exportacao, span.meter_id]
+    if span.nome == 'janela':
+        partes.append(f"{span.atributos.get('inicio')} a {span.atributos.get('fim')}")
+    return ' | '.join(p for p in partes if p)
+
+
+class Command(BaseCommand):
+    help = 'Mostra o caminho crítico (onde foi o tempo de parede) de uma execução do fetch_ipu_data a partir dos spans gravados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('execucao_id', nargs='?', help='execucao_id da execução. Padrão: a mais recente.')
+        parser.add_argument('--top', type=int, default=10, help='Quantidade de etapas mais lentas listadas.')
+
+    def handle(self, *args, **options):
+        execucao_id = options['execucao_id']
+        if not execucao_id:
+            raiz = SpanExtracao.objects.filter(parent_id__isnull=True).order_by('-inicio').first()
+            if raiz is None:
+                raise CommandError("Nenhuma execução com spans gravados.")
+            execucao_id = raiz.execucao_id
+        spans = list(SpanExtracao.objects.filter(execucao_id=execucao_id).select_related('configuracao'))
+        if not spans:
+            raise CommandError(f"Nenhum span encontrado para a execução {execucao_id}.")
+        caminho = caminho_critico(spans)
+        if not caminho:
+            raise CommandError(f"O span raiz da execução {execucao_id} não foi gravado (execução interrompida?).")
+        raiz = caminho[0][1]
+        total = raiz.duracao_segundos or 1e-9
+
+        self.stdout.write(f"Execução {execucao_id}: início {raiz.inicio:%Y-%m-%d %H:%M:%S}, {raiz.duracao_segundos:.1f}s, {len(spans)} spans.")
+        self.stdout.write("\nCaminho crítico:")
+        self.stdout.write(f"  {'Span':<45} {'Início (s)':>10} {'Duração (s)':>12} {'% total':>8} {'Próprio (s)':>12}")
+        for nivel, span in caminho:
+            # Tempo do span que não está coberto pelos seus passos no caminho
+            proprio = span.duracao_segundos - sum(passo.duracao_segundos for _, passo in caminho if passo.parent_id == span.span_id)
+            rotulo = ('  ' * nivel + span.nome)[:45]
+            inicio = (span.inicio - raiz.inicio).total_seconds()
+            self.stdout.write(f"  {rotulo:<45} {inicio:>10.1f} {span.duracao_segundos:>12.1f} {100 * span.duracao_segundos / total:>7.1f}% {proprio:>12.1f}")
+            descricao = descrever_span(span)
+            if descricao or span.status != 'SUCCESS':
+                self.stdout.write(f"  {'  ' * nivel}  {descricao} [{span.status}]")
+
+        por_etapa = defaultdict(lambda: [0, 0.0])
+        for span in spans:
+            por_etapa[span.nome][0] += 1
+            por_etapa[span.nome][1] += span.duracao_segundos
+        self.stdout.write("\nTempo somado por tipo de span (inclui trechos em paralelo):")
+        for nome, (quantidade, segundos) in sorted(por_etapa.items(), key=lambda item: -item[1][1]):
+            self.stdout.write(f"  {nome:<20} {quantidade:>6} spans {segundos:>12.1f}s")
+
+        folhas = [s for s in spans if s.nome not in ('execucao', 'configuracao', 'janela', 'exportacao')]
+        self.stdout.write("\nEtapas mais lentas:")
+        for span in sorted(folhas, key=lambda s: -s.duracao_segundos)[:options['top']]:
+            extras = []
+            if span.linhas is not None:
+                extras.append(f"{span.linhas} linhas")
+            if span.bytes is not None:
+                extras.append(f"{span.bytes / 1024 / 1024:.1f} MB")
+            self.stdout.write(f"  {span.duracao_segundos:>10.1f}s  {span.nome:<18} {descrever_span(span)} {', '.join(extras)}")
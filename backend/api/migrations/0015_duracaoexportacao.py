@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_consumocaiassetsumario_meter_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuracaoExportacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_exportacao', models.CharField(help_text='Ex: SUMMARY, ASSET, meterId_<id>', max_length=100)),
+                ('duracao_media_segundos', models.FloatField(help_text='Média móvel exponencial da duração dos jobs')),
+                ('desvio_medio_segundos', models.FloatField(default=0, help_text='Média móvel exponencial do desvio absoluto')),
+                ('amostras', models.IntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('configuracao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duracoes_exportacao', to='api.configuracaoidmc')),
+            ],
+            options={
+                'verbose_name_plural': 'Durações de Exportação',
+                'db_table': 'api_duracaoexportacao',
+                'unique_together': {('configuracao', 'tipo_exportacao')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_duracaoexportacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuracaoidmc',
+            name='ultima_duracao_segundos',
+            field=models.FloatField(blank=True, help_text='Duração da última execução do fetch_ipu_data, usada na ordem do agendador', null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_configuracaoidmc_ultima_duracao_segundos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='extracaolog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
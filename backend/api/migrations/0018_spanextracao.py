@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_extracaolog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpanExtracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('execucao_id', models.CharField(db_index=True, help_text='span_id do span raiz da execução', max_length=32)),
+                ('span_id', models.CharField(max_length=32, unique=True)),
+                ('parent_id', models.CharField(blank=True, db_index=True, max_length=32, null=True)),
+                ('nome', models.CharField(help_text='Ex: execucao, configuracao, janela, exportacao, download, carga', max_length=50)),
+                ('tipo_exportacao', models.CharField(blank=True, max_length=50, null=True)),
+                ('meter_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('inicio', models.DateTimeField()),
+                ('duracao_segundos', models.FloatField()),
+                ('status', models.CharField(default='SUCCESS', max_length=10)),
+                ('linhas', models.BigIntegerField(blank=True, null=True)),
+                ('bytes', models.BigIntegerField(blank=True, null=True)),
+                ('atributos', models.JSONField(blank=True, default=dict)),
+                ('configuracao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='spans', to='api.configuracaoidmc')),
+            ],
+            options={
+                'verbose_name': 'Span de Extração',
+                'verbose_name_plural': 'Spans de Extração',
+                'db_table': 'api_spanextracao',
+                'ordering': ['inicio'],
+            },
+        ),
+    ]
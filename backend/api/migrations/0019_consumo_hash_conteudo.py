@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_spanextracao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consumoasset',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumocaiassetsumario',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumocdijobexecucao',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumoprojectfolder',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumosummary',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_consumo_hash_conteudo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessaoIICS',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iics_pod_url', models.TextField(help_text='Pod e usuário do login; se mudarem na configuração a sessão é descartada')),
+                ('iics_username', models.TextField()),
+                ('session_id', models.TextField()),
+                ('base_api_url', models.TextField()),
+                ('criada_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_uso', models.DateTimeField(default=django.utils.timezone.now)),
+                ('configuracao', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sessao_iics', to='api.configuracaoidmc')),
+            ],
+            options={
+                'verbose_name_plural': 'Sessões IICS',
+                'db_table': 'api_sessaoiics',
+            },
+        ),
+    ]
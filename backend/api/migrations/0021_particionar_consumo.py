@@ -0,0 +1,31 @@
+# Converte as tabelas de consumo que crescem sem limite em tabelas particionadas por
+# configuração e mês (api.ingestion.particoes). Só tem efeito no PostgreSQL.
+
+from django.db import migrations
+
+from api.ingestion import particoes
+
+
+def particionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabela in particoes.TABELAS_PARTICIONADAS:
+        particoes.converter_tabela(schema_editor.connection, tabela)
+
+
+def desparticionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabela in particoes.TABELAS_PARTICIONADAS:
+        particoes.reverter_tabela(schema_editor.connection, tabela)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_sessaoiics'),
+    ]
+
+    operations = [
+        migrations.RunPython(particionar, desparticionar),
+    ]
@@ -0,0 +1,99 @@
+# Adiciona o hash_chave às tabelas de consumo e o preenche nas linhas existentes
+# (api.ingestion.chaves). A 0023 troca o UNIQUE da chave natural pelo UNIQUE com o hash.
+#
+# O UNIQUE antigo deixava passar linhas repetidas com nulo em alguma coluna da chave (NULL não
+# conflita com NULL); no hash o nulo é um valor, então essas repetições são removidas aqui,
+# mantendo a gravada por último (maior id).
+
+from django.db import migrations, models
+
+from api.ingestion import chaves
+
+# Chave natural de cada modelo nesta migration (CHAVE_NATURAL) e a coluna de data do novo UNIQUE
+CHAVES = {
+    'consumosummary': ('consumption_date', ('org_id', 'meter_id', 'consumption_date')),
+    'consumoprojectfolder': ('consumption_date', ('consumption_date', 'project_name', 'folder_path', 'org_id')),
+    'consumoasset': ('consumption_date', ('meter_id', 'consumption_date', 'asset_name', 'asset_type', 'project_name', 'folder_name', 'org_id', 'runtime_environment', 'tier', 'ipu_per_unit')),
+    'consumocdijobexecucao': ('start_time', ('task_id', 'task_run_id', 'org_id', 'environment_id', 'start_time', 'end_time')),
+    'consumocaiassetsumario': ('execution_date', ('org_id', 'executed_asset', 'execution_date', 'execution_env', 'status', 'invoked_by')),
+}
+LOTE = 5000
+
+
+def _preencher_postgres(model, connection, data, campos):
+    qn = connection.ops.quote_name
+    tabela = qn(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {tabela} SET hash_chave = {chaves.expressao_sql(model, connection, campos)} WHERE hash_chave IS NULL')
+        cursor.execute(
+            f'DELETE FROM {tabela} a USING {tabela} b '
+            f'WHERE a.configuracao_id = b.configuracao_id AND a.{qn(data)} = b.{qn(data)} '
+            f'AND a.hash_chave = b.hash_chave AND a.id < b.id'
+        )
+
+
+def _preencher_python(model, using, data, campos):
+    preencher = chaves.preenchedor(model, (chaves.CAMPO,) + campos, campos)
+    manager = model._base_manager.using(using)
+    vistos, repetidos, pendentes = {}, [], []
+    consulta = manager.order_by('pk').values_list('pk', 'configuracao_id', data, *campos)
+    for pk, configuracao_id, momento, *valores in consulta.iterator(chunk_size=LOTE):
+        hash_chave = preencher((None, *valores))[0]
+        if momento is not None:
+            anterior = vistos.get((configuracao_id, momento, hash_chave))
+            if anterior is not None:
+                repetidos.append(anterior)
+            vistos[(configuracao_id, momento, hash_chave)] = pk
+        pendentes.append(model(pk=pk, hash_chave=hash_chave))
+        if len(pendentes) >= LOTE:
+            manager.bulk_update(pendentes, ['hash_chave'])
+            pendentes = []
+    manager.bulk_update(pendentes, ['hash_chave'])
+    for i in range(0, len(repetidos), LOTE):
+        manager.filter(pk__in=repetidos[i:i + LOTE]).delete()
+
+
+def preencher_hash_chave(apps, schema_editor):
+    connection = schema_editor.connection
+    for nome, (data, campos) in CHAVES.items():
+        model = apps.get_model('api', nome)
+        if connection.vendor == 'postgresql':
+            _preencher_postgres(model, connection, data, campos)
+        else:
+            _preencher_python(model, connection.alias, data, campos)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_particionar_consumo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consumoasset',
+            name='hash_chave',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumocaiassetsumario',
+            name='hash_chave',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumocdijobexecucao',
+            name='hash_chave',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumoprojectfolder',
+            name='hash_chave',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumosummary',
+            name='hash_chave',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(preencher_hash_chave, migrations.RunPython.noop),
+    ]
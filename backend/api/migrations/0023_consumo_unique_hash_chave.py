@@ -0,0 +1,122 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_consumo_hash_chave'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='consumoasset',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumocaiassetsumario',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumocdijobexecucao',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumoprojectfolder',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumosummary',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='consumoasset',
+            name='configuracao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.configuracaoidmc'),
+        ),
+        migrations.AlterField(
+            model_name='consumoasset',
+            name='hash_chave',
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='consumocaiassetsumario',
+            name='configuracao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.configuracaoidmc'),
+        ),
+        migrations.AlterField(
+            model_name='consumocaiassetsumario',
+            name='hash_chave',
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='consumocaiassetsumario',
+            name='meter_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='consumocdijobexecucao',
+            name='configuracao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.configuracaoidmc'),
+        ),
+        migrations.AlterField(
+            model_name='consumocdijobexecucao',
+            name='hash_chave',
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='consumocdijobexecucao',
+            name='meter_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='consumoprojectfolder',
+            name='configuracao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.configuracaoidmc'),
+        ),
+        migrations.AlterField(
+            model_name='consumoprojectfolder',
+            name='hash_chave',
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='consumosummary',
+            name='configuracao',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.configuracaoidmc'),
+        ),
+        migrations.AlterField(
+            model_name='consumosummary',
+            name='hash_chave',
+            field=models.UUIDField(editable=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumoasset',
+            unique_together={('configuracao', 'consumption_date', 'hash_chave')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumocaiassetsumario',
+            unique_together={('configuracao', 'execution_date', 'hash_chave')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumocdijobexecucao',
+            unique_together={('configuracao', 'start_time', 'hash_chave')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumoprojectfolder',
+            unique_together={('configuracao', 'consumption_date', 'hash_chave')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='consumosummary',
+            unique_together={('configuracao', 'consumption_date', 'hash_chave')},
+        ),
+        migrations.AddIndex(
+            model_name='consumocaiassetsumario',
+            index=models.Index(fields=['configuracao', 'meter_id', 'execution_date'], name='api_caisum_cfg_meter_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consumocdijobexecucao',
+            index=models.Index(fields=['configuracao', 'meter_id', 'start_time'], name='api_cdijob_cfg_meter_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_consumo_unique_hash_chave'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoDiarioProjeto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('project_name', models.TextField(blank=True, null=True)),
+                ('folder_name', models.TextField(blank=True, null=True)),
+                ('usage', models.DecimalField(blank=True, decimal_places=10, max_digits=30, null=True)),
+                ('consumption_ipu', models.DecimalField(blank=True, decimal_places=6, max_digits=24, null=True)),
+                ('linhas', models.IntegerField(default=0, help_text='Registros de ConsumoAsset agregados')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('configuracao', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.configuracaoidmc')),
+            ],
+            options={
+                'verbose_name_plural': 'Consumos diários (Projeto/Pasta)',
+                'db_table': 'api_consumodiarioprojeto',
+                'unique_together': {('configuracao', 'dia', 'project_name', 'folder_name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ConsumoDiarioMeter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('meter_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('meter_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('meter_usage', models.DecimalField(blank=True, decimal_places=10, max_digits=30, null=True)),
+                ('consumption_ipu', models.DecimalField(blank=True, decimal_places=12, max_digits=30, null=True)),
+                ('linhas', models.IntegerField(default=0, help_text='Registros de ConsumoSummary agregados')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('configuracao', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.configuracaoidmc')),
+            ],
+            options={
+                'verbose_name_plural': 'Consumos diários (Meter)',
+                'db_table': 'api_consumodiariometer',
+                'unique_together': {('configuracao', 'dia', 'meter_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ConsumoCiclo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_period_start_date', models.DateField()),
+                ('billing_period_end_date', models.DateField()),
+                ('consumption_ipu', models.DecimalField(blank=True, decimal_places=12, max_digits=30, null=True)),
+                ('linhas', models.IntegerField(default=0, help_text='Registros de ConsumoSummary agregados')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('configuracao', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.configuracaoidmc')),
+            ],
+            options={
+                'verbose_name_plural': 'Consumos por ciclo de faturamento',
+                'db_table': 'api_consumociclo',
+                'unique_together': {('configuracao', 'billing_period_start_date', 'billing_period_end_date')},
+            },
+        ),
+    ]
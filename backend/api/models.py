@@ -2,6 +2,7 @@
 
 from django.db import models
 from django.utils import timezone
+from datetime import timedelta
 
 class Clientes(models.Model):
     nome_cliente = models.CharField(max_length=255)
@@ -25,6 +26,7 @@ class ConfiguracaoIDMC(models.Model):
     iics_username = models.TextField()
     iics_password = models.TextField()
     ultima_extracao_enddate = models.DateTimeField(null=True, blank=True, help_text="Marcador da última data final usada na extração")
+    ultima_duracao_segundos = models.FloatField(null=True, blank=True, help_text="Duração da última execução do fetch_ipu_data, usada na ordem do agendador")
     ativo = models.BooleanField(default=True)
     data_criacao = models.DateTimeField(auto_now_add=True)
 
@@ -37,9 +39,14 @@ class ConfiguracaoIDMC(models.Model):
         ordering = ['cliente', 'apelido_configuracao']
 
 class ConsumoSummary(models.Model):
-    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE)
+    # Sem índice próprio no FK nas tabelas de consumo: o UNIQUE (configuracao, <data>, hash_chave) já começa por ele
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, db_index=False)
     data_extracao = models.DateTimeField()
     data_atualizacao = models.DateTimeField(auto_now=True)
+    # Hash das colunas de conteúdo, preenchido pela carga incremental (api.ingestion.incremental)
+    hash_conteudo = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    # Hash da chave natural (CHAVE_NATURAL), usado no UNIQUE no lugar das colunas (api.ingestion.chaves)
+    hash_chave = models.UUIDField(editable=False)
     org_id = models.TextField(null=True, blank=True)
     meter_id = models.CharField(max_length=255, null=True, blank=True)
     meter_name = models.CharField(max_length=255, null=True, blank=True)
@@ -54,15 +61,19 @@ class ConsumoSummary(models.Model):
     org_type = models.CharField(max_length=100, null=True, blank=True)
     ipu_rate = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
 
+    CHAVE_NATURAL = ('org_id', 'meter_id', 'consumption_date')
+
     class Meta:
         db_table = 'api_consumosummary'
         verbose_name_plural = "Consumos (Summary)"
-        unique_together = ('configuracao', 'org_id', 'meter_id', 'consumption_date')
+        unique_together = ('configuracao', 'consumption_date', 'hash_chave')
 
 class ConsumoProjectFolder(models.Model):
-    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE)
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, db_index=False)
     data_extracao = models.DateTimeField()
     data_atualizacao = models.DateTimeField(auto_now=True)
+    hash_conteudo = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    hash_chave = models.UUIDField(editable=False)
     consumption_date = models.DateTimeField(null=True, blank=True)
     project_name = models.TextField(null=True, blank=True)
     folder_path = models.TextField(null=True, blank=True)
@@ -70,15 +81,19 @@ class ConsumoProjectFolder(models.Model):
     org_type = models.CharField(max_length=100, null=True, blank=True)
     total_consumption_ipu = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
 
+    CHAVE_NATURAL = ('consumption_date', 'project_name', 'folder_path', 'org_id')
+
     class Meta:
         db_table = 'api_consumoprojectfolder'
         verbose_name_plural = "Consumos (Project/Folder)"
-        unique_together = ('configuracao', 'consumption_date', 'project_name', 'folder_path', 'org_id')
+        unique_together = ('configuracao', 'consumption_date', 'hash_chave')
 
 class ConsumoAsset(models.Model):
-    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE)
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, db_index=False)
     data_extracao = models.DateTimeField()
     data_atualizacao = models.DateTimeField(auto_now=True)
+    hash_conteudo = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    hash_chave = models.UUIDField(editable=False)
     meter_id = models.CharField(max_length=255, null=True, blank=True)
     meter_name = models.CharField(max_length=255, null=True, blank=True)
     consumption_date = models.DateTimeField(null=True, blank=True)
@@ -95,15 +110,19 @@ class ConsumoAsset(models.Model):
     usage = models.DecimalField(max_digits=24, decimal_places=10, null=True, blank=True)
     consumption_ipu = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
 
+    CHAVE_NATURAL = ('meter_id', 'consumption_date', 'asset_name', 'asset_type', 'project_name', 'folder_name', 'org_id', 'runtime_environment', 'tier', 'ipu_per_unit')
+
     class Meta:
         db_table = 'api_consumoasset'
         verbose_name_plural = "Consumos (Asset)"
-        unique_together = ('configuracao', 'meter_id', 'consumption_date', 'asset_name', 'asset_type', 'project_name', 'folder_name', 'org_id', 'runtime_environment', 'tier', 'ipu_per_unit')
+        unique_together = ('configuracao', 'consumption_date', 'hash_chave')
 
 class ConsumoCdiJobExecucao(models.Model):
-    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE)
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, db_index=False)
     data_extracao = models.DateTimeField()
     data_atualizacao = models.DateTimeField(auto_now=True)
+    hash_conteudo = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    hash_chave = models.UUIDField(editable=False)
     meter_id_ref = models.CharField(max_length=255, null=True, blank=True)
     task_id = models.TextField(null=True, blank=True)
     task_name = models.TextField(null=True, blank=True)
@@ -122,17 +141,23 @@ class ConsumoCdiJobExecucao(models.Model):
     metered_value_ipu = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True)
     audit_time = models.DateTimeField(null=True, blank=True)
     obm_task_time_seconds = models.IntegerField(null=True, blank=True)
-    meter_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    meter_id = models.CharField(max_length=255, null=True, blank=True)
+
+    CHAVE_NATURAL = ('task_id', 'task_run_id', 'org_id', 'environment_id', 'start_time', 'end_time')
 
     class Meta:
         db_table = 'api_consumocdijobexecucao'
         verbose_name_plural = "Consumos (CDI Job)"
-        unique_together = ('configuracao', 'task_id', 'task_run_id', 'org_id', 'environment_id', 'start_time', 'end_time')
+        unique_together = ('configuracao', 'start_time', 'hash_chave')
+        # Filtro da deleção por meter antes da carga (ExportSpec.filtro_delecao)
+        indexes = [models.Index(fields=['configuracao', 'meter_id', 'start_time'], name='api_cdijob_cfg_meter_idx')]
 
 class ConsumoCaiAssetSumario(models.Model):
-    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE)
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, db_index=False)
     data_extracao = models.DateTimeField()
     data_atualizacao = models.DateTimeField(auto_now=True)
+    hash_conteudo = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    hash_chave = models.UUIDField(editable=False)
     org_id = models.TextField(null=True, blank=True)
     execution_type = models.CharField(max_length=255, null=True, blank=True)
     executed_asset = models.TextField(null=True, blank=True)
@@ -143,16 +168,68 @@ class ConsumoCaiAssetSumario(models.Model):
     execution_count = models.BigIntegerField(null=True, blank=True)
     total_execution_time_hours = models.DecimalField(max_digits=18, decimal_places=4, null=True, blank=True)
     avg_execution_time_seconds = models.DecimalField(max_digits=18, decimal_places=4, null=True, blank=True)
-    meter_id = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+    meter_id = models.CharField(max_length=255, null=True, blank=True)
+
+    CHAVE_NATURAL = ('org_id', 'executed_asset', 'execution_date', 'execution_env', 'status', 'invoked_by')
 
     class Meta:
         db_table = 'api_consumocaiassetsumario'
         verbose_name_plural = "Consumos (CAI Summary)"
-        unique_together = ('configuracao', 'org_id', 'executed_asset', 'execution_date', 'execution_env', 'status', 'invoked_by')
+        unique_together = ('configuracao', 'execution_date', 'hash_chave')
+        indexes = [models.Index(fields=['configuracao', 'meter_id', 'execution_date'], name='api_caisum_cfg_meter_idx')]
+
+# Rollups para os dashboards, mantidos pelos loaders do fetch_ipu_data para a janela recém-gravada
+# (api.ingestion.rollups). O dia é o da data de consumo no fuso de settings.TIME_ZONE.
+class ConsumoDiarioMeter(models.Model):
+    # ConsumoSummary por configuração, dia e meter
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, db_index=False)
+    dia = models.DateField()
+    meter_id = models.CharField(max_length=255, null=True, blank=True)
+    meter_name = models.CharField(max_length=255, null=True, blank=True)
+    meter_usage = models.DecimalField(max_digits=30, decimal_places=10, null=True, blank=True)
+    consumption_ipu = models.DecimalField(max_digits=30, decimal_places=12, null=True, blank=True)
+    linhas = models.IntegerField(default=0, help_text="Registros de ConsumoSummary agregados")
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'api_consumodiariometer'
+        verbose_name_plural = "Consumos diários (Meter)"
+        unique_together = ('configuracao', 'dia', 'meter_id')
+
+class ConsumoDiarioProjeto(models.Model):
+    # ConsumoAsset por configuração, dia, projeto e pasta
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, db_index=False)
+    dia = models.DateField()
+    project_name = models.TextField(null=True, blank=True)
+    folder_name = models.TextField(null=True, blank=True)
+    usage = models.DecimalField(max_digits=30, decimal_places=10, null=True, blank=True)
+    consumption_ipu = models.DecimalField(max_digits=24, decimal_places=6, null=True, blank=True)
+    linhas = models.IntegerField(default=0, help_text="Registros de ConsumoAsset agregados")
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'api_consumodiarioprojeto'
+        verbose_name_plural = "Consumos diários (Projeto/Pasta)"
+        unique_together = ('configuracao', 'dia', 'project_name', 'folder_name')
+
+class ConsumoCiclo(models.Model):
+    # ConsumoSummary por configuração e ciclo de faturamento (mesmas datas de CicloFaturamento)
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, db_index=False)
+    billing_period_start_date = models.DateField()
+    billing_period_end_date = models.DateField()
+    consumption_ipu = models.DecimalField(max_digits=30, decimal_places=12, null=True, blank=True)
+    linhas = models.IntegerField(default=0, help_text="Registros de ConsumoSummary agregados")
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'api_consumociclo'
+        verbose_name_plural = "Consumos por ciclo de faturamento"
+        unique_together = ('configuracao', 'billing_period_start_date', 'billing_period_end_date')
 
 class ExtracaoLog(models.Model):
     configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, related_name="logs")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # default em vez de auto_now_add: os logs gravados em lote (api.extraction.logs) guardam o horário do evento
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     etapa = models.CharField(max_length=50, help_text="Ex: LOGIN, EXPORT_JOB, DOWNLOAD, LOAD_CSV")
     status = models.CharField(max_length=10, choices=[('SUCCESS', 'Success'), ('FAILED', 'Failed')])
     detalhes = models.TextField(null=True, blank=True, help_text="Detalhes como job_type, meter_id, etc.")
@@ -167,6 +244,36 @@ class ExtracaoLog(models.Model):
         verbose_name_plural = "Logs de Extração"
         ordering = ['-timestamp']
 
+class SpanExtracao(models.Model):
+    # Um trecho cronometrado do fetch_ipu_data (execução > configuração > janela > exportação > etapa).
+    # Gravado em lote por api.extraction.tracing; parent_id aponta para o span_id do trecho pai.
+    execucao_id = models.CharField(max_length=32, db_index=True, help_text="span_id do span raiz da execução")
+    span_id = models.CharField(max_length=32, unique=True)
+    parent_id = models.CharField(max_length=32, null=True, blank=True, db_index=True)
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, related_name="spans", null=True, blank=True)
+    nome = models.CharField(max_length=50, help_text="Ex: execucao, configuracao, janela, exportacao, download, carga")
+    tipo_exportacao = models.CharField(max_length=50, null=True, blank=True)
+    meter_id = models.CharField(max_length=100, null=True, blank=True)
+    inicio = models.DateTimeField()
+    duracao_segundos = models.FloatField()
+    status = models.CharField(max_length=10, default='SUCCESS')
+    linhas = models.BigIntegerField(null=True, blank=True)
+    bytes = models.BigIntegerField(null=True, blank=True)
+    atributos = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f"{self.nome} ({self.duracao_segundos:.1f}s)"
+
+    @property
+    def fim(self):
+        return self.inicio + timedelta(seconds=self.duracao_segundos)
+
+    class Meta:
+        db_table = 'api_spanextracao'
+        verbose_name = "Span de Extração"
+        verbose_name_plural = "Spans de Extração"
+        ordering = ['inicio']
+
 class CicloFaturamento(models.Model):
     configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, related_name='ciclos_faturamento')
     ciclo_id = models.IntegerField()
@@ -185,3 +292,37 @@ class CicloFaturamento(models.Model):
         return f"{self.configuracao.apelido_configuracao} - Ciclo {self.ciclo_id} ({self.billing_period_start_date} a {self.billing_period_end_date})"
 
 
+
+class DuracaoExportacao(models.Model):
+    # Duração observada dos jobs de exportação, usada pelo poller para não consultar o status cedo demais
+    configuracao = models.ForeignKey(ConfiguracaoIDMC, on_delete=models.CASCADE, related_name='duracoes_exportacao')
+    tipo_exportacao = models.CharField(max_length=100, help_text="Ex: SUMMARY, ASSET, meterId_<id>")
+    duracao_media_segundos = models.FloatField(help_text="Média móvel exponencial da duração dos jobs")
+    desvio_medio_segundos = models.FloatField(default=0, help_text="Média móvel exponencial do desvio absoluto")
+    amostras = models.IntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'api_duracaoexportacao'
+        verbose_name_plural = "Durações de Exportação"
+        unique_together = ('configuracao', 'tipo_exportacao')
+
+    def __str__(self):
+        return f"{self.configuracao.apelido_configuracao} - {self.tipo_exportacao}: {self.duracao_media_segundos:.0f}s"
+
+class SessaoIICS(models.Model):
+    # Sessão da API da IICS reaproveitada entre janelas e execuções (api.extraction.sessions)
+    configuracao = models.OneToOneField(ConfiguracaoIDMC, on_delete=models.CASCADE, related_name='sessao_iics')
+    iics_pod_url = models.TextField(help_text="Pod e usuário do login; se mudarem na configuração a sessão é descartada")
+    iics_username = models.TextField()
+    session_id = models.TextField()
+    base_api_url = models.TextField()
+    criada_em = models.DateTimeField(default=timezone.now)
+    ultimo_uso = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'api_sessaoiics'
+        verbose_name_plural = "Sessões IICS"
+
+    def __str__(self):
+        return f"{self.configuracao.apelido_configuracao} - sessão de {self.criada_em:%Y-%m-%d %H:%M}"
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Paginação keyset (por cursor) das APIs de consumo.
+# As linhas saem ordenadas pelos campos de view.campos_keyset() — a ordem do UNIQUE
+# (configuracao, <data>, hash_chave) das tabelas de consumo — e a página seguinte é lida com
+# "(campos) > (chave da última linha)" em vez de OFFSET: o índice vai direto à posição, então uma
+# página profunda custa o mesmo que a primeira. O cursor devolvido ao cliente é essa chave em
+# base64 (opaco; só vale para a mesma URL com os mesmos filtros).
+import base64
+import binascii
+import json
+import uuid
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _para_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, uuid.UUID):
+        return valor.hex
+    return valor
+
+
+class PaginacaoKeyset(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limite'
+    page_size = 500
+    max_page_size = 5000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limite = self._limite(request)
+        opts = queryset.model._meta
+        self.fields = [opts.get_field(campo) for campo in view.campos_keyset()]
+        # attname: ordenar pelo nome do FK seguiria o Meta.ordering do modelo relacionado (JOIN)
+        queryset = queryset.order_by(*(field.attname for field in self.fields))
+        posicao = self._decodificar(request.query_params.get(self.cursor_query_param))
+        if posicao is not None:
+            queryset = self._depois_de(queryset, posicao)
+        linhas = list(queryset[:self.limite + 1])
+        self.proxima = None
+        if len(linhas) > self.limite:
+            linhas = linhas[:self.limite]
+            self.proxima = [getattr(linhas[-1], field.attname) for field in self.fields]
+        return linhas
+
+    def _limite(self, request):
+        valor = request.query_params.get(self.page_size_query_param)
+        if valor is None:
+            return self.page_size
+        try:
+            limite = int(valor)
+        except ValueError:
+            limite = 0
+        if limite < 1:
+            raise ValidationError({self.page_size_query_param: "Informe um inteiro positivo."})
+        return min(limite, self.max_page_size)
+
+    def _decodificar(self, cursor):
+        if not cursor:
+            return None
+        try:
+            valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            if not isinstance(valores, list) or len(valores) != len(self.fields):
+                raise ValueError(cursor)
+            return [field.to_python(valor) for field, valor in zip(self.fields, valores)]
+        except (ValueError, TypeError, binascii.Error, DjangoValidationError) as e:
+            raise ValidationError({self.cursor_query_param: "Cursor inválido."}) from e
+
+    def _depois_de(self, queryset, posicao):
+        connection = connections[queryset.db]
+        qn = connection.ops.quote_name
+        tabela = qn(queryset.model._meta.db_table)
+        colunas = ', '.join(f"{tabela}.{qn(field.column)}" for field in self.fields)
+        marcadores = ', '.join(['%s'] * len(self.fields))
+        params = [field.get_db_prep_value(valor, connection) for field, valor in zip(self.fields, posicao)]
+        # O filtro redundante na primeira coluna permite a poda de partições, que a comparação de
+        # linha sozinha não faz
+        return queryset.filter(
+            RawSQL(f"({colunas}) > ({marcadores})", params, output_field=BooleanField()),
+            **{f'{self.fields[0].attname}__gte': posicao[0]},
+        )
+
+    def _codificar(self, valores):
+        return base64.urlsafe_b64encode(json.dumps([_para_json(valor) for valor in valores]).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if self.proxima is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self._codificar(self.proxima))
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'first': self.get_first_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
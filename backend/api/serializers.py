@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from functools import lru_cache
+
+from rest_framework import serializers
+
+# Hashes internos da carga (api.ingestion.incremental e api.ingestion.chaves), fora das APIs
+CAMPOS_INTERNOS = ('hash_conteudo', 'hash_chave')
+
+
+def colunas_consumo(model):
+    return [field.name for field in model._meta.concrete_fields if field.name not in CAMPOS_INTERNOS]
+
+
+class ConsumoSerializer(serializers.ModelSerializer):
+    # campos=[...] restringe a resposta a essas colunas (parâmetro "campos" das views de consumo)
+    def __init__(self, *args, campos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nome in set(self.fields) - set(campos):
+                self.fields.pop(nome)
+
+
+@lru_cache(maxsize=None)
+def serializer_consumo(model):
+    meta = type('Meta', (), {'model': model, 'fields': colunas_consumo(model)})
+    return type(f'{model.__name__}Serializer', (ConsumoSerializer,), {'Meta': meta})
@@ -0,0 +1,99 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from api.ingestion.bulk import BulkUpserter, ResultadoLote
+from api.models import Clientes, ConfiguracaoIDMC, ConsumoProjectFolder, ConsumoSummary
+
+DIA = datetime(2025, 3, 1, 3, 0, tzinfo=dt_timezone.utc)
+
+
+class BulkUpserterTests(TestCase):
+    def setUp(self):
+        cliente = Clientes.objects.create(nome_cliente='teste', email_contato='teste@example.com', qnt_ipus_contratadas=0, preco_por_ipu=0)
+        self.config = ConfiguracaoIDMC.objects.create(cliente=cliente, apelido_configuracao='teste', iics_pod_url='', iics_username='', iics_password='')
+        self.lotes = []
+
+    def _upserter(self, batch_size=100):
+        return BulkUpserter(ConsumoSummary, batch_size=batch_size, on_batch=self.lotes.append)
+
+    def _add(self, upserter, meter_id, uso):
+        upserter.add({
+            'configuracao': self.config,
+            'data_extracao': timezone.now(),
+            'org_id': 'org',
+            'meter_id': meter_id,
+            'consumption_date': DIA,
+            'meter_usage': Decimal(uso),
+        })
+
+    def _gravadas(self):
+        return sorted(ConsumoSummary.objects.values_list('meter_id', 'meter_usage'))
+
+    def test_repetida_no_lote_a_ultima_vence(self):
+        upserter = self._upserter()
+        for meter_id, uso in (('a', '1'), ('b', '2'), ('a', '3'), ('a', '4')):
+            self._add(upserter, meter_id, uso)
+        totais = upserter.finish()
+        self.assertEqual((totais.gravados, totais.ignorados), (2, 2))
+        self.assertEqual(self._gravadas(), [('a', Decimal('4')), ('b', Decimal('2'))])
+
+    def test_grava_um_lote_a_cada_batch_size(self):
+        upserter = self._upserter(batch_size=3)
+        for i in range(7):
+            self._add(upserter, f'm{i}', i)
+        self.assertEqual([lote.gravados for lote in self.lotes], [3, 3])
+        totais = upserter.finish()
+        self.assertEqual([(lote.numero, lote.gravados) for lote in self.lotes], [(1, 3), (2, 3), (3, 1)])
+        self.assertEqual(self.lotes, upserter.lotes)
+        self.assertEqual((totais.numero, totais.gravados), (3, 7))
+        self.assertEqual(ConsumoSummary.objects.count(), 7)
+
+    def test_repetidas_nao_contam_para_o_batch_size(self):
+        upserter = self._upserter(batch_size=2)
+        for uso in range(3):
+            self._add(upserter, 'a', uso)
+        self.assertEqual(self.lotes, [])
+        self._add(upserter, 'b', 0)
+        self.assertEqual([(lote.gravados, lote.ignorados) for lote in self.lotes], [(2, 2)])
+
+    def test_lote_so_com_ignorados(self):
+        upserter = self._upserter()
+        upserter.skip(3)
+        totais = upserter.finish()
+        self.assertEqual((totais.numero, totais.gravados, totais.ignorados), (1, 0, 3))
+        self.assertIsNone(upserter.flush())
+
+    def test_totais_sem_distinguir_inseridos(self):
+        upserter = self._upserter(batch_size=2)
+        upserter.distingue_inseridos = False
+        for i in range(3):
+            self._add(upserter, f'm{i}', i)
+        totais = upserter.finish()
+        self.assertEqual(totais.gravados, 3)
+        self.assertIsNone(totais.inseridos)
+        self.assertIsNone(totais.atualizados)
+
+    def test_totais_com_um_lote_sem_distincao(self):
+        upserter = self._upserter()
+        upserter.lotes = [ResultadoLote(1, 2, 2, 0, 0), ResultadoLote(2, 3, None, None, 1)]
+        self.assertEqual(upserter.totais(), ResultadoLote(2, 5, None, None, 1))
+
+    @skipUnless(connection.vendor == 'postgresql', "RETURNING (xmax = 0) é só para o PostgreSQL")
+    def test_distingue_inseridos_e_atualizados(self):
+        # Tabela não particionada: nas particionadas o xmax não pode ser lido
+        def carregar(linhas):
+            upserter = BulkUpserter(ConsumoProjectFolder)
+            self.assertTrue(upserter.distingue_inseridos)
+            for projeto, consumo in linhas:
+                upserter.add({'configuracao': self.config, 'data_extracao': timezone.now(), 'consumption_date': DIA, 'project_name': projeto, 'total_consumption_ipu': Decimal(consumo)})
+            return upserter.finish()
+
+        carregar([('a', '1')])
+        totais = carregar([('a', '5'), ('b', '2')])
+        self.assertEqual((totais.gravados, totais.inseridos, totais.atualizados), (2, 1, 1))
+        self.assertEqual(sorted(ConsumoProjectFolder.objects.values_list('project_name', 'total_consumption_ipu')), [('a', Decimal('5')), ('b', Decimal('2'))])
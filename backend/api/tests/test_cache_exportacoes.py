@@ -0,0 +1,182 @@
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+from datetime import date
+from types import SimpleNamespace
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+
+from api.benchmarks import fake_iics
+from api.benchmarks.fake_iics import ConfiguracaoFake, ServidorFakeIICS
+from api.extraction.cache import CacheExportacoes, sha256_arquivo
+from api.management.commands.fetch_ipu_data import Command, InformaticaAPIClient
+
+CONFIG = SimpleNamespace(pk=1)
+TTL = 3600
+
+
+def _zip(conteudo='a,b\n1,2\n'):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as arquivo_zip:
+        arquivo_zip.writestr('dados.csv', conteudo)
+    return buffer.getvalue()
+
+
+def _escrever(caminho, dados):
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(dados)
+
+
+class _ComDiretorio(SimpleTestCase):
+    def setUp(self):
+        temporario = tempfile.TemporaryDirectory()
+        self.addCleanup(temporario.cleanup)
+        self.diretorio = temporario.name
+
+
+class EntradaCacheTests(_ComDiretorio):
+    def setUp(self):
+        super().setUp()
+        self.cache = CacheExportacoes(self.diretorio, TTL, 10 ** 9)
+        self.entrada = self.cache.entrada(CONFIG, 'SUMMARY', date(2025, 3, 1), date(2025, 3, 30))
+
+    def _parcial(self, dados, job_id='job1'):
+        _escrever(self.entrada.preparar_download(job_id), dados)
+
+    def test_job_pendente_ate_concluir(self):
+        self.entrada.registrar_job('job1')
+        self.assertEqual(self.entrada.job_pendente(), 'job1')
+        self._parcial(_zip())
+        self.assertEqual(self.entrada.job_pendente(), 'job1')
+        caminho = self.entrada.concluir('job1')
+        self.assertIsNone(self.entrada.job_pendente())
+        self.assertEqual(self.entrada.artefato(), caminho)
+        self.assertEqual(self.entrada.metadados()['sha256'], sha256_arquivo(caminho))
+
+    def test_outro_job_descarta_o_parcial(self):
+        self._parcial(b'PK parcial')
+        self.entrada.registrar_job('job2')
+        self.assertFalse(os.path.exists(self.entrada.caminho_parcial))
+        self.assertEqual(self.entrada.job_pendente(), 'job2')
+
+    def test_download_de_outro_job_comeca_do_zero(self):
+        self._parcial(b'PK parcial')
+        caminho = self.entrada.preparar_download('job2')
+        self.assertFalse(os.path.exists(caminho))
+        self.assertEqual(self.entrada.metadados()['job_id'], 'job2')
+
+    def test_zip_invalido_descarta_o_parcial(self):
+        self._parcial(b'nao e um zip')
+        with self.assertRaises(zipfile.BadZipFile):
+            self.entrada.concluir('job1')
+        self.assertFalse(os.path.exists(self.entrada.caminho_parcial))
+        self.assertIsNone(self.entrada.artefato())
+
+    def test_vencida_nao_e_usada(self):
+        self._parcial(_zip())
+        self.entrada.concluir('job1')
+        self.entrada._gravar_metadados(**{**self.entrada.metadados(), 'criado_em': time.time() - TTL - 1})
+        self.assertIsNone(self.entrada.artefato())
+
+    def test_descartar(self):
+        self._parcial(_zip())
+        self.entrada.concluir('job1')
+        self.entrada.descartar()
+        self.assertEqual(os.listdir(os.path.dirname(self.entrada.caminho)), [])
+
+
+class PodarCacheTests(_ComDiretorio):
+    def _entrada(self, cache, dia, estado):
+        entrada = cache.entrada(CONFIG, 'SUMMARY', date(2025, 3, dia), date(2025, 3, dia))
+        if estado == 'completo':
+            _escrever(entrada.preparar_download('job'), _zip('x' * 1000))
+            entrada.concluir('job')
+        else:
+            _escrever(entrada.preparar_download('job'), b'PK' + b'x' * 1000)
+        return entrada
+
+    def _envelhecer(self, entrada, usada_ha=0, criada_ha=0):
+        # Depois de criar todas: concluir() também poda o cache
+        entrada._gravar_metadados(**{**entrada.metadados(), 'criado_em': time.time() - criada_ha})
+        os.utime(entrada.caminho_metadados, (time.time() - usada_ha,) * 2)
+
+    def test_remove_as_vencidas_mesmo_pendentes(self):
+        cache = CacheExportacoes(self.diretorio, TTL, 10 ** 9)
+        vencida, pendente_vencida, vigente = self._entrada(cache, 1, 'completo'), self._entrada(cache, 2, 'parcial'), self._entrada(cache, 3, 'completo')
+        self._envelhecer(vencida, criada_ha=TTL + 1)
+        self._envelhecer(pendente_vencida, criada_ha=TTL + 1)
+        removidas, _ = cache.podar()
+        self.assertEqual(removidas, 2)
+        self.assertIsNone(vencida.metadados())
+        self.assertIsNone(pendente_vencida.metadados())
+        self.assertIsNotNone(vigente.artefato())
+
+    def test_acima_do_limite_remove_a_menos_usada_e_poupa_as_pendentes(self):
+        cache = CacheExportacoes(self.diretorio, TTL, 10 ** 9)
+        pendente, antiga, recente = self._entrada(cache, 1, 'parcial'), self._entrada(cache, 2, 'completo'), self._entrada(cache, 3, 'completo')
+        self._envelhecer(pendente, usada_ha=400)
+        self._envelhecer(antiga, usada_ha=300)
+        self._envelhecer(recente, usada_ha=100)
+        cache.max_bytes = cache.tamanho_total() - 1
+        removidas, liberados = cache.podar()
+        self.assertEqual(removidas, 1)
+        self.assertGreater(liberados, 0)
+        self.assertIsNone(antiga.metadados())
+        self.assertEqual(pendente.job_pendente(), 'job')
+        self.assertIsNotNone(recente.artefato())
+
+
+class DownloadRetomavelTests(_ComDiretorio):
+    def setUp(self):
+        super().setUp()
+        # Arquivo de algumas centenas de KB: o corte na metade deixa blocos inteiros no parcial
+        self.servidor = ServidorFakeIICS(ConfiguracaoFake(latencia_job=(0, 0), linhas_padrao=20000)).iniciar()
+        self.addCleanup(self.servidor.parar)
+        self.cliente = InformaticaAPIClient(self.servidor.url, 'usuario', 'senha', Command(stdout=io.StringIO(), stderr=io.StringIO()))
+        self.cliente.login()
+        self.job_id = self.cliente.export_metering_data('2025-01-01T00:00:00Z', '2025-12-31T00:00:00Z', job_type='ASSET')
+        self.conteudo = self.servidor.estado.zip_do_job(self.servidor.estado.jobs[self.job_id])
+        self.caminho = os.path.join(self.diretorio, 'exportacao.zip.part')
+
+    def _baixar(self, max_tentativas=3):
+        return self.cliente.download_export_retomavel(self.job_id, self.caminho, max_tentativas=max_tentativas)
+
+    def _arquivo(self):
+        with open(self.caminho, 'rb') as arquivo:
+            return arquivo.read()
+
+    def test_retoma_com_range_apos_corte(self):
+        self.servidor.estado.config.taxa_corte_download = 1.0
+        with self.assertRaises(requests.exceptions.RequestException):
+            self._baixar(max_tentativas=1)
+        parcial = len(self._arquivo())
+        self.assertGreater(parcial, 0)
+        self.assertLess(parcial, len(self.conteudo))
+        self.servidor.estado.config.taxa_corte_download = 0.0
+        self.assertEqual(self._baixar(), len(self.conteudo))
+        self.assertEqual(self._arquivo(), self.conteudo)
+        self.assertEqual(self.servidor.chamadas['download_retomado'], 1)
+
+    def test_tentativas_dentro_da_mesma_chamada(self):
+        # Com metade dos downloads cortados, as tentativas seguintes continuam de onde pararam
+        self.servidor.estado.config.taxa_corte_download = 0.5
+        self.assertEqual(self._baixar(max_tentativas=20), len(self.conteudo))
+        self.assertEqual(self._arquivo(), self.conteudo)
+
+    def test_parcial_completo_recebe_416(self):
+        _escrever(self.caminho, self.conteudo)
+        self.assertEqual(self._baixar(), len(self.conteudo))
+        self.assertEqual(self._arquivo(), self.conteudo)
+        self.assertEqual(self.servidor.chamadas.get('download_retomado', 0), 0)
+
+    def test_servidor_sem_range_recomeca_o_arquivo(self):
+        _escrever(self.caminho, b'bytes de outro download')
+        # Servidor que ignora o Range e responde 200 com o arquivo inteiro
+        with mock.patch.object(fake_iics, '_RANGE', re.compile(r'(?!)')):
+            self.assertEqual(self._baixar(), len(self.conteudo))
+        self.assertEqual(self._arquivo(), self.conteudo)
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from api.ingestion import chaves
+from api.models import ConsumoAsset
+
+CAMPOS = ConsumoAsset.CHAVE_NATURAL
+FUSO_SP = dt_timezone(timedelta(hours=-3))
+# Linha base da chave natural de ConsumoAsset; cada caso troca um ou mais valores
+BASE = {
+    'meter_id': 'm1',
+    'consumption_date': datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+    'asset_name': 'Tarefa diária',
+    'asset_type': 'MTT',
+    'project_name': 'Projeto',
+    'folder_name': 'Pasta',
+    'org_id': 'org1',
+    'runtime_environment': 'env',
+    'tier': 'T1',
+    'ipu_per_unit': Decimal('0.125'),
+}
+CASOS = [
+    {},
+    {'consumption_date': datetime(2025, 3, 1, 0, 0, tzinfo=FUSO_SP)},
+    {'consumption_date': datetime(2024, 12, 31, 23, 59, 59, 999999, tzinfo=FUSO_SP)},
+    {'ipu_per_unit': Decimal('0.0000005')},
+    {'ipu_per_unit': Decimal('0.0000015')},
+    {'ipu_per_unit': Decimal('-0.0000005')},
+    {'ipu_per_unit': Decimal('-0.0000004')},
+    {'ipu_per_unit': Decimal('-0')},
+    {'ipu_per_unit': Decimal('1E+2')},
+    {'ipu_per_unit': Decimal('123456789012.1234564999')},
+    {'ipu_per_unit': None, 'asset_name': None, 'consumption_date': None},
+    {'asset_name': ''},
+    {'asset_name': 'n'},
+    {'asset_name': "com 'aspas', \\barra e\x1fseparador"},
+]
+
+
+def _hash_python(valores):
+    preencher = chaves.preenchedor(ConsumoAsset, [*CAMPOS, chaves.CAMPO])
+    return preencher((*(valores[campo] for campo in CAMPOS), None))[-1]
+
+
+def _tipo_sql(field):
+    if field.get_internal_type() == 'DateTimeField':
+        return 'timestamptz'
+    if field.get_internal_type() == 'DecimalField':
+        # Sem escala, como na staging do COPY
+        return 'numeric'
+    return 'text'
+
+
+def _hash_sql(valores):
+    qn = connection.ops.quote_name
+    opts = ConsumoAsset._meta
+    colunas = [f"%s::{_tipo_sql(opts.get_field(campo))} AS {qn(opts.get_field(campo).column)}" for campo in CAMPOS]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {chaves.expressao_sql(ConsumoAsset, connection)} FROM (SELECT {', '.join(colunas)}) AS linha",
+            [valores[campo] for campo in CAMPOS],
+        )
+        return cursor.fetchone()[0]
+
+
+class HashChavePythonTests(SimpleTestCase):
+    def test_decimal_empate_arredonda_para_longe_do_zero(self):
+        self.assertEqual(_hash_python({**BASE, 'ipu_per_unit': Decimal('0.0000005')}), _hash_python({**BASE, 'ipu_per_unit': Decimal('0.000001')}))
+        self.assertEqual(_hash_python({**BASE, 'ipu_per_unit': Decimal('-0.0000005')}), _hash_python({**BASE, 'ipu_per_unit': Decimal('-0.000001')}))
+
+    def test_zero_negativo(self):
+        self.assertEqual(_hash_python({**BASE, 'ipu_per_unit': Decimal('-0.0000004')}), _hash_python({**BASE, 'ipu_per_unit': Decimal('0')}))
+
+    def test_mesmo_instante_em_outro_fuso(self):
+        sp = BASE['consumption_date'].astimezone(FUSO_SP)
+        self.assertEqual(_hash_python({**BASE, 'consumption_date': sp}), _hash_python(BASE))
+
+    def test_nulo_diferente_de_texto(self):
+        self.assertNotEqual(_hash_python({**BASE, 'asset_name': None}), _hash_python({**BASE, 'asset_name': ''}))
+        self.assertNotEqual(_hash_python({**BASE, 'asset_name': None}), _hash_python({**BASE, 'asset_name': 'n'}))
+
+
+@skipUnless(connection.vendor == 'postgresql', "expressao_sql é só para o PostgreSQL")
+class HashChaveSqlTests(TestCase):
+    def test_python_e_sql_concordam(self):
+        for caso in CASOS:
+            valores = {**BASE, **caso}
+            with self.subTest(caso=caso):
+                self.assertEqual(str(_hash_sql(valores)), str(_hash_python(valores)))
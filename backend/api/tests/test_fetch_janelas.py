@@ -0,0 +1,102 @@
+import io
+import threading
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from api.extraction import logs
+from api.management.commands.fetch_ipu_data import Command
+from api.models import Clientes, ConfiguracaoIDMC
+
+# Último marcador 120 dias atrás: quatro lotes de até 31 dias
+DIAS_DESDE_O_MARCADOR = 120
+
+
+class _Saida(io.StringIO):
+    # stderr que avisa quando o comando cancela os lotes seguintes a uma falha
+    def __init__(self):
+        super().__init__()
+        self.cancelou = threading.Event()
+
+    def write(self, texto):
+        if 'cancelado' in texto:
+            self.cancelou.set()
+        return super().write(texto)
+
+
+# TransactionTestCase: o comando fecha a conexão ao final de cada configuração
+class MarcadorJanelasTests(TransactionTestCase):
+    def setUp(self):
+        cliente = Clientes.objects.create(nome_cliente='teste', email_contato='teste@example.com', qnt_ipus_contratadas=0, preco_por_ipu=0)
+        self.inicio = (timezone.now().astimezone(Command.SAO_PAULO_TZ) - timedelta(days=DIAS_DESDE_O_MARCADOR)).date()
+        self.config = ConfiguracaoIDMC.objects.create(
+            cliente=cliente, apelido_configuracao='teste', iics_pod_url='https://pod.example.com', iics_username='u', iics_password='p',
+            ultima_extracao_enddate=self.inicio,
+        )
+        self.stderr = _Saida()
+        self.command = Command(stdout=io.StringIO(), stderr=self.stderr)
+        self.command.max_parallel_windows = 2
+        self.janelas = []
+        self._lock = threading.Lock()
+
+    def _processar(self, resultado):
+        # resultado(início da janela) -> sucesso do lote
+        def extrair(api_client, config, file_paths, log_prefix, period_start, period_end):
+            with self._lock:
+                self.janelas.append((period_start, period_end))
+            return resultado(period_start)
+
+        cliente_api = mock.Mock()
+        cliente_api.login.return_value = True
+        # Sem gravar logs: a limpeza do TransactionTestCase pode vir antes da gravação em segundo plano
+        with logs.suspenso(), mock.patch('api.management.commands.fetch_ipu_data.InformaticaAPIClient', return_value=cliente_api), \
+                mock.patch.object(self.command, '_get_config_specific_paths', return_value=('arquivos', 'downloads')), \
+                mock.patch.object(self.command, '_cleanup_config_files'), \
+                mock.patch.object(self.command, '_atualizar_rollups_configuracao'), \
+                mock.patch.object(self.command, '_atualizar_ciclos_faturamento') as ciclos, \
+                mock.patch.object(self.command, '_execute_extraction_for_period', side_effect=extrair):
+            self.command._processar_configuracao(self.config)
+        self.config.refresh_from_db()
+        self.janelas.sort()
+        return ciclos
+
+    def _marcador(self):
+        # DateTimeField com a data gravada pelo comando (meia-noite)
+        return self.config.ultima_extracao_enddate.date()
+
+    def _todas(self):
+        inicio = timezone.make_aware(datetime.combine(self.inicio, datetime.min.time()), Command.SAO_PAULO_TZ)
+        return self.command._janelas_extracao(inicio, timezone.now().astimezone(Command.SAO_PAULO_TZ))
+
+    def test_todas_as_janelas_concluidas(self):
+        ciclos = self._processar(lambda inicio: True)
+        self.assertEqual(len(self.janelas), 4)
+        self.assertEqual(self._marcador(), timezone.now().astimezone(Command.SAO_PAULO_TZ).date())
+        ciclos.assert_called_once()
+
+    def test_falha_no_meio_para_o_marcador_e_cancela_as_seguintes(self):
+        todas = self._todas()
+        self.assertEqual(len(todas), 4)
+
+        def resultado(inicio):
+            if inicio == todas[1][0]:
+                return False
+            # Os lotes que começaram seguram os workers até o cancelamento: a quarta janela
+            # ainda está na fila quando a falha da segunda chega
+            self.stderr.cancelou.wait(10)
+            return True
+
+        ciclos = self._processar(resultado)
+        inicios = [inicio for inicio, _ in self.janelas]
+        self.assertEqual(inicios[:2], [todas[0][0], todas[1][0]])
+        self.assertNotIn(todas[3][0], inicios)
+        self.assertEqual(self._marcador(), todas[0][1].date())
+        ciclos.assert_called_once()
+
+    def test_falha_na_primeira_nao_atualiza_o_marcador(self):
+        todas = self._todas()
+        ciclos = self._processar(lambda inicio: inicio != todas[0][0])
+        self.assertEqual(self._marcador(), self.inicio)
+        ciclos.assert_not_called()
@@ -0,0 +1,103 @@
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Clientes, ConfiguracaoIDMC, ConsumoSummary
+from api.paginacao import PaginacaoKeyset
+
+URL = '/api/consumo/summary/'
+INICIO = datetime(2025, 3, 1, 3, 0, tzinfo=dt_timezone.utc)
+
+
+class PaginacaoKeysetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cliente = Clientes.objects.create(nome_cliente='teste', email_contato='teste@example.com', qnt_ipus_contratadas=0, preco_por_ipu=0)
+        cls.configs = [
+            ConfiguracaoIDMC.objects.create(cliente=cliente, apelido_configuracao=f'teste{i}', iics_pod_url='', iics_username='', iics_password='')
+            for i in range(2)
+        ]
+        agora = timezone.now()
+        # Várias linhas por dia: o desempate da ordem fica com o hash_chave
+        ConsumoSummary.objects.bulk_create([
+            ConsumoSummary(
+                configuracao=config, data_extracao=agora, hash_chave=uuid.uuid4(), org_id='org', meter_id=f'm{i}',
+                consumption_date=INICIO + timedelta(days=i // 7), meter_usage=Decimal(i),
+            )
+            for config in cls.configs for i in range(300)
+        ])
+        cls.usuario = User.objects.create_user('teste')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _paginar(self, **params):
+        ids, url, paginas = [], URL, 0
+        while url:
+            resposta = self.client.get(url, params if paginas == 0 else None)
+            self.assertEqual(resposta.status_code, 200, resposta.content)
+            ids += [linha['id'] for linha in resposta.data['results']]
+            url = resposta.data['next']
+            paginas += 1
+        return ids, paginas
+
+    def test_percorre_todas_as_linhas_uma_vez_com_configuracao(self):
+        config = self.configs[1]
+        ids, paginas = self._paginar(configuracao=config.pk, limite=137)
+        self.assertEqual(paginas, 3)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), set(ConsumoSummary.objects.filter(configuracao=config).values_list('id', flat=True)))
+
+    def test_percorre_todas_as_linhas_uma_vez_sem_configuracao(self):
+        ids, paginas = self._paginar(limite=137)
+        self.assertEqual(paginas, 5)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), set(ConsumoSummary.objects.values_list('id', flat=True)))
+
+    def test_limite_invalido(self):
+        for limite in ('0', '-1', 'abc'):
+            with self.subTest(limite=limite):
+                self.assertEqual(self.client.get(URL, {'limite': limite}).status_code, 400)
+
+    def test_cursor_invalido(self):
+        def codificar(valores):
+            return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+        cursores = [
+            'não é base64',
+            codificar({'a': 1}),
+            codificar([1, INICIO.isoformat()]),
+            codificar([1, INICIO.isoformat(), 'não é uuid']),
+            codificar(['x', INICIO.isoformat(), uuid.uuid4().hex]),
+        ]
+        for cursor in cursores:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(URL, {'cursor': cursor}).status_code, 400)
+
+    def test_cursor_preserva_uuid_e_data_hora(self):
+        paginacao = PaginacaoKeyset()
+        opts = ConsumoSummary._meta
+        paginacao.fields = [opts.get_field(nome) for nome in ('configuracao', 'consumption_date', 'hash_chave')]
+        valores = [7, datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone(timedelta(hours=-3))), uuid.uuid4()]
+        self.assertEqual(paginacao._decodificar(paginacao._codificar(valores)), valores)
+
+    def test_campos_mantem_as_colunas_do_keyset(self):
+        config = self.configs[0]
+        # Uma consulta por página: as colunas do cursor não ficam adiadas pelo only()
+        with self.assertNumQueries(1):
+            resposta = self.client.get(URL, {'configuracao': config.pk, 'campos': 'meter_id', 'limite': 137})
+        self.assertEqual(set(resposta.data['results'][0]), {'meter_id'})
+        meters = [linha['meter_id'] for linha in resposta.data['results']]
+        url = resposta.data['next']
+        while url:
+            resposta = self.client.get(url)
+            meters += [linha['meter_id'] for linha in resposta.data['results']]
+            url = resposta.data['next']
+        self.assertEqual(sorted(meters), sorted(f'm{i}' for i in range(300)))
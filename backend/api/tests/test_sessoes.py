@@ -0,0 +1,110 @@
+import io
+import time
+from datetime import timedelta
+
+import requests
+from django.test import TestCase
+from django.utils import timezone
+
+from api.benchmarks.fake_iics import ConfiguracaoFake, ServidorFakeIICS
+from api.extraction.sessions import CacheSessoes
+from api.management.commands.fetch_ipu_data import Command, InformaticaAPIClient
+from api.models import Clientes, ConfiguracaoIDMC, SessaoIICS
+
+OCIOSIDADE = 3600
+
+
+class _ComConfiguracao(TestCase):
+    def setUp(self):
+        cliente = Clientes.objects.create(nome_cliente='teste', email_contato='teste@example.com', qnt_ipus_contratadas=0, preco_por_ipu=0)
+        self.config = ConfiguracaoIDMC.objects.create(
+            cliente=cliente, apelido_configuracao='teste', iics_pod_url='https://pod1.example.com', iics_username='u1', iics_password='p',
+        )
+
+
+class CacheSessoesTests(_ComConfiguracao):
+    def setUp(self):
+        super().setUp()
+        self.cache = CacheSessoes(OCIOSIDADE)
+        self.cache.guardar(self.config, 'sessao1', 'https://base1.example.com')
+
+    def _editar(self, **campos):
+        ConfiguracaoIDMC.objects.filter(pk=self.config.pk).update(**campos)
+        self.config.refresh_from_db()
+
+    def test_reaproveita_em_memoria_e_da_tabela(self):
+        self.assertEqual(self.cache.obter(self.config).session_id, 'sessao1')
+        # Próxima execução: processo novo, só a tabela
+        self.assertEqual(CacheSessoes(OCIOSIDADE).obter(self.config).session_id, 'sessao1')
+
+    def test_pod_ou_usuario_alterado_descarta_a_sessao(self):
+        for campos in ({'iics_pod_url': 'https://pod2.example.com'}, {'iics_username': 'u2'}):
+            with self.subTest(campos=campos):
+                original = {'iics_pod_url': self.config.iics_pod_url, 'iics_username': self.config.iics_username}
+                self._editar(**campos)
+                self.assertIsNone(self.cache.obter(self.config))
+                self.assertIsNone(CacheSessoes(OCIOSIDADE).obter(self.config))
+                self._editar(**original)
+
+    def test_novo_login_apos_alteracao_substitui_a_sessao(self):
+        self._editar(iics_username='u2')
+        self.cache.guardar(self.config, 'sessao2', 'https://base1.example.com')
+        self.assertEqual(self.cache.obter(self.config).session_id, 'sessao2')
+        self.assertEqual(SessaoIICS.objects.get(configuracao=self.config).iics_username, 'u2')
+
+    def test_ociosa_nao_e_usada(self):
+        SessaoIICS.objects.filter(configuracao=self.config).update(ultimo_uso=timezone.now() - timedelta(seconds=OCIOSIDADE + 1))
+        self.assertIsNone(CacheSessoes(OCIOSIDADE).obter(self.config))
+
+    def test_invalidar_outra_sessao_nao_descarta_a_atual(self):
+        self.cache.invalidar(self.config, 'sessao_antiga')
+        self.assertEqual(self.cache.obter(self.config).session_id, 'sessao1')
+        self.cache.invalidar(self.config, 'sessao1')
+        self.assertIsNone(self.cache.obter(self.config))
+        self.assertFalse(SessaoIICS.objects.filter(configuracao=self.config).exists())
+
+
+class RenovacaoSessaoTests(_ComConfiguracao):
+    DURACAO_SESSAO = 0.2
+
+    def setUp(self):
+        super().setUp()
+        self.servidor = ServidorFakeIICS(ConfiguracaoFake(latencia_job=(0, 0), duracao_sessao=self.DURACAO_SESSAO)).iniciar()
+        self.addCleanup(self.servidor.parar)
+        self.cache = CacheSessoes(OCIOSIDADE)
+        self.cliente = InformaticaAPIClient(
+            self.servidor.url, 'usuario', 'senha', Command(stdout=io.StringIO(), stderr=io.StringIO()), configuracao=self.config, sessoes=self.cache,
+        )
+
+    def _exportar(self):
+        return self.cliente.export_metering_data('2025-03-01T00:00:00Z', '2025-03-31T00:00:00Z', job_type='SUMMARY')
+
+    def test_sessao_expirada_faz_um_novo_login_e_repete_a_requisicao(self):
+        self.cliente.login()
+        sessao_expirada = self.cliente.session_id
+        time.sleep(self.DURACAO_SESSAO + 0.1)
+        self.assertTrue(self._exportar())
+        chamadas = self.servidor.chamadas
+        self.assertEqual((chamadas['login'], chamadas['sessao_recusada'], chamadas['criar_job']), (2, 1, 2))
+        # O cache passa a guardar a sessão do novo login
+        self.assertNotEqual(self.cliente.session_id, sessao_expirada)
+        self.assertEqual(self.cache.obter(self.config).session_id, self.cliente.session_id)
+        self.assertEqual(SessaoIICS.objects.get(configuracao=self.config).session_id, self.cliente.session_id)
+
+    def test_recusa_apos_o_novo_login_nao_repete_de_novo(self):
+        self.servidor.estado.config.duracao_sessao = 0
+        self.cliente.login()
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self._exportar()
+        chamadas = self.servidor.chamadas
+        self.assertEqual((chamadas['login'], chamadas['sessao_recusada'], chamadas['criar_job']), (2, 2, 2))
+
+    def test_login_reaproveita_a_sessao_guardada(self):
+        self.servidor.estado.config.duracao_sessao = None
+        self.cliente.login()
+        outro = InformaticaAPIClient(
+            self.servidor.url, 'usuario', 'senha', Command(stdout=io.StringIO(), stderr=io.StringIO()), configuracao=self.config, sessoes=CacheSessoes(OCIOSIDADE),
+        )
+        outro.login()
+        self.assertEqual(outro.session_id, self.cliente.session_id)
+        self.assertEqual(self.servidor.chamadas['login'], 1)
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.test import SimpleTestCase
+
+from api.extraction.tracing import caminho_critico
+from api.models import SpanExtracao
+
+INICIO = datetime(2025, 8, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _span(span_id, pai, inicio, duracao):
+    return SpanExtracao(span_id=span_id, parent_id=pai, nome=span_id, inicio=INICIO + timedelta(seconds=inicio), duracao_segundos=duracao)
+
+
+class CaminhoCriticoTests(SimpleTestCase):
+    def test_volta_do_ultimo_filho_pelos_irmaos_em_sequencia(self):
+        # Três janelas em paralelo e o ciclo de faturamento logo depois da mais lenta: o ciclo
+        # termina por último, mas o tempo está na janela 2
+        spans = [
+            _span('execucao', None, 0, 50),
+            _span('configuracao', 'execucao', 1, 48),
+            _span('login', 'configuracao', 1, 1),
+            _span('janela_1', 'configuracao', 2, 15),
+            _span('janela_2', 'configuracao', 2, 46),
+            _span('janela_3', 'configuracao', 2, 20),
+            _span('ciclo_faturamento', 'configuracao', 48, 0.01),
+            _span('criar_job', 'janela_2', 2, 1),
+            _span('aguardar_job', 'janela_2', 3, 30),
+            _span('carga', 'janela_2', 33, 15),
+            _span('download_paralelo', 'janela_2', 10, 5),
+        ]
+        caminho = caminho_critico(spans)
+        self.assertEqual(
+            [(nivel, span.span_id) for nivel, span in caminho],
+            [
+                (0, 'execucao'),
+                (1, 'configuracao'),
+                (2, 'login'),
+                (2, 'janela_2'),
+                (3, 'criar_job'),
+                (3, 'aguardar_job'),
+                (3, 'carga'),
+                (2, 'ciclo_faturamento'),
+            ],
+        )
+
+    def test_spans_sem_duracao(self):
+        spans = [
+            _span('execucao', None, 0, 3),
+            _span('a', 'execucao', 1, 0),
+            _span('b', 'execucao', 1, 0),
+            _span('c', 'execucao', 1, 2),
+        ]
+        # Termina mesmo com spans que acabam no mesmo instante em que começam
+        ids = [span.span_id for _, span in caminho_critico(spans)]
+        self.assertEqual(ids[0], 'execucao')
+        self.assertEqual(sorted(ids[1:3]), ['a', 'b'])
+        self.assertEqual(ids[3], 'c')
+
+    def test_sem_raiz(self):
+        self.assertEqual(caminho_critico([_span('janela', 'configuracao', 0, 1)]), [])
@@ -0,0 +1,15 @@
+from django.urls import path
+
+from api import views
+from api.ingestion.schemas import EXPORT_SPECS
+
+# /api/consumo/summary/, /api/consumo/project-folder/, /api/consumo/asset/, /api/consumo/cdi-job/, /api/consumo/cai-summary/
+urlpatterns = [
+    path(f"consumo/{nome.lower().replace('_', '-')}/", views.ConsumoListView.as_view(spec=spec), name=f"consumo-{nome.lower().replace('_', '-')}")
+    for nome, spec in EXPORT_SPECS.items()
+]
+urlpatterns += [
+    path(f"consumo/{nome.lower().replace('_', '-')}/exportar/", views.ConsumoExportView.as_view(spec=spec), name=f"consumo-{nome.lower().replace('_', '-')}-exportar")
+    for nome, spec in EXPORT_SPECS.items()
+]
+urlpatterns.append(path('consumo/agregado/', views.AgregacaoConsumoView.as_view(), name='consumo-agregado'))
@@ -1,3 +1,186 @@
-from django.shortcuts import render
+import hmac
+from datetime import datetime, time as dt_time, timedelta
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api import agregacoes, exportacao_consumo
+from api.extraction.metrics import exposicao_web
+from api.paginacao import PaginacaoKeyset
+from api.serializers import colunas_consumo, serializer_consumo
+
+CONTENT_TYPE_PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _acesso_metricas(request):
+    if request.user.is_authenticated:
+        return True
+    token = settings.METRICS_TOKEN
+    if not token:
+        return False
+    esquema, _, valor = request.headers.get('Authorization', '').partition(' ')
+    return esquema.lower() == 'bearer' and hmac.compare_digest(valor.strip().encode(), token.encode())
+
+
+def metrics(request):
+    if not _acesso_metricas(request):
+        response = HttpResponse("Autenticação necessária.\n", status=401, content_type='text/plain; charset=utf-8')
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(exposicao_web(settings.METRICS_TEXTFILE), content_type=CONTENT_TYPE_PROMETHEUS)
+
+
+def _momento(params, nome, fim=False):
+    # Data (dia inteiro no fuso de settings.TIME_ZONE) ou data/hora ISO 8601.
+    # Retorna (momento, inclusivo): no fim de uma data, o limite é o início do dia seguinte.
+    valor = params.get(nome)
+    if not valor:
+        return None, True
+    erro = ValidationError({nome: "Use uma data (AAAA-MM-DD) ou data/hora ISO 8601."})
+    try:
+        # A data antes: no Python 3.11 o parse_datetime também aceita 'AAAA-MM-DD' (meia-noite)
+        dia = parse_date(valor) if len(valor) == 10 else None
+        momento = None if dia else parse_datetime(valor)
+    except ValueError:
+        raise erro
+    if dia is not None:
+        if fim:
+            dia += timedelta(days=1)
+        return datetime.combine(dia, dt_time.min, tzinfo=timezone.get_default_timezone()), not fim
+    if momento is None:
+        raise erro
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento, timezone.get_default_timezone())
+    return momento, True
+
+
+class ConsumoListView(generics.ListAPIView):
+    # Linhas de uma tabela de consumo (spec: api.ingestion.schemas.ExportSpec), paginadas por
+    # keyset (api.paginacao) na ordem do UNIQUE (configuracao, <data>, hash_chave). Parâmetros:
+    #   configuracao            id da ConfiguracaoIDMC
+    #   inicio, fim             sobre a data da spec; datas valem pelo dia inteiro
+    #   meter_id, project_name  nas tabelas que têm a coluna
+    #   campos                  colunas devolvidas, separadas por vírgula (padrão: todas)
+    #   limite, cursor          tamanho da página e posição (o "next" da página anterior)
+    # Linhas sem data ficam de fora: não têm posição no keyset.
+    spec = None
+    pagination_class = PaginacaoKeyset
+    FILTROS_TEXTO = ('meter_id', 'project_name')
+
+    def get_serializer_class(self):
+        return serializer_consumo(self.spec.model)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('campos', self.campos())
+        return super().get_serializer(*args, **kwargs)
+
+    def campos(self):
+        valor = self.request.query_params.get('campos')
+        if not valor:
+            return None
+        campos = [campo.strip() for campo in valor.split(',') if campo.strip()]
+        invalidos = sorted(set(campos) - set(colunas_consumo(self.spec.model)))
+        if invalidos:
+            raise ValidationError({'campos': f"Campos inexistentes: {', '.join(invalidos)}."})
+        return campos
+
+    def campos_keyset(self):
+        # Com uma configuração só, ela é constante e sai da chave (a ordem continua a do índice)
+        campos = (self.spec.campo_inicio, 'hash_chave')
+        if 'configuracao' in self.request.query_params:
+            return campos
+        return ('configuracao', *campos)
+
+    def get_queryset(self):
+        params = self.request.query_params
+        model = self.spec.model
+        campo_data = self.spec.campo_inicio
+        filtros = {f'{campo_data}__isnull': False}
+        if 'configuracao' in params:
+            try:
+                filtros['configuracao_id'] = int(params['configuracao'])
+            except ValueError:
+                raise ValidationError({'configuracao': "Informe o id numérico da configuração."})
+        inicio, _ = _momento(params, 'inicio')
+        if inicio is not None:
+            filtros[f'{campo_data}__gte'] = inicio
+        fim, inclusivo = _momento(params, 'fim', fim=True)
+        if fim is not None:
+            filtros[f'{campo_data}__lte' if inclusivo else f'{campo_data}__lt'] = fim
+        colunas = colunas_consumo(model)
+        for campo in self.FILTROS_TEXTO:
+            if campo not in params:
+                continue
+            if campo not in colunas:
+                raise ValidationError({campo: f"Filtro indisponível para {self.spec.nome}."})
+            filtros[campo] = params[campo]
+        queryset = model.objects.filter(**filtros)
+        campos = self.campos()
+        if campos is not None:
+            # As colunas do keyset também: o cursor da próxima página sai da última linha
+            queryset = queryset.only(*campos, *self.campos_keyset())
+        return queryset
+
+
+class ConsumoExportView(ConsumoListView):
+    # A tabela inteira que passa pelos filtros de ConsumoListView, num arquivo só (sem paginação),
+    # gerado em fluxo (api.exportacao_consumo). formato: csv (padrão), csv.gz ou parquet.
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in exportacao_consumo.FORMATOS:
+            raise ValidationError({'formato': f"Use um de: {', '.join(exportacao_consumo.FORMATOS)}."})
+        if formato == 'parquet' and not exportacao_consumo.pyarrow_disponivel():
+            raise ValidationError({'formato': "Parquet indisponível: a biblioteca pyarrow não está instalada."})
+        colunas = self.campos() or colunas_consumo(self.spec.model)
+        content_type, extensao = exportacao_consumo.FORMATOS[formato]
+        response = StreamingHttpResponse(
+            exportacao_consumo.gerar(formato, self.get_queryset(), colunas),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.spec.nome.lower()}.{extensao}"'
+        return response
+
+
+class AgregacaoConsumoView(APIView):
+    # IPU por período e grupo de uma configuração (api.agregacoes), com cache. Parâmetros:
+    #   configuracao   id da ConfiguracaoIDMC (obrigatório)
+    #   periodo        dia (padrão), semana, mes ou ciclo (de faturamento)
+    #   agrupar        meter, project, environment ou org (padrão: total do período)
+    #   inicio, fim    datas (AAAA-MM-DD) de consumo, inclusive
+    def get(self, request):
+        params = request.query_params
+        try:
+            configuracao_id = int(params['configuracao'])
+        except (KeyError, ValueError):
+            raise ValidationError({'configuracao': "Informe o id numérico da configuração."})
+        periodo = params.get('periodo', 'dia')
+        if periodo not in agregacoes.PERIODOS:
+            raise ValidationError({'periodo': f"Use um de: {', '.join(agregacoes.PERIODOS)}."})
+        agrupar = params.get('agrupar') or None
+        if agrupar not in agregacoes.FONTES:
+            raise ValidationError({'agrupar': f"Use um de: {', '.join(nome for nome in agregacoes.FONTES if nome)}."})
+        datas = {}
+        for nome in ('inicio', 'fim'):
+            valor = params.get(nome)
+            try:
+                datas[nome] = parse_date(valor) if valor else None
+            except ValueError:
+                datas[nome] = None
+            if valor and datas[nome] is None:
+                raise ValidationError({nome: "Use uma data (AAAA-MM-DD)."})
+        resultados, do_cache = agregacoes.agregar(configuracao_id, agrupar, periodo, datas['inicio'], datas['fim'])
+        return Response({
+            'configuracao': configuracao_id,
+            'periodo': periodo,
+            'agrupar': agrupar,
+            'cache': do_cache,
+            'results': resultados,
+        })
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# Pool de conexões do PostgreSQL compartilhado pelas threads do processo (web e comandos).
+# As conexões são reaproveitadas entre threads: connection.close() do Django devolve a conexão
+# ao pool em vez de fechá-la. Quem pede uma conexão com o pool cheio espera (até timeout) e o
+# tempo de espera entra nas estatísticas.
+import threading
+import time
+from collections import deque
+
+try:
+    from psycopg2 import extensions as pg_extensions
+except ImportError:
+    pg_extensions = None
+
+TAMANHO_MAXIMO_PADRAO = 10
+TIMEOUT_ESPERA_PADRAO = 30
+VERIFICAR_APOS_OCIOSA_PADRAO = 30
+IDADE_MAXIMA_PADRAO = 1800
+
+
+class PoolEsgotado(Exception):
+    pass
+
+
+class _Entrada:
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.criada_em = time.monotonic()
+        self.devolvida_em = self.criada_em
+
+
+class PoolConexoes:
+    def __init__(self, conectar, tamanho_maximo=TAMANHO_MAXIMO_PADRAO, timeout_espera=TIMEOUT_ESPERA_PADRAO,
+                 verificar_apos_ociosa=VERIFICAR_APOS_OCIOSA_PADRAO, idade_maxima=IDADE_MAXIMA_PADRAO):
+        self.conectar = conectar
+        self.tamanho_maximo = max(1, int(tamanho_maximo))
+        self.timeout_espera = timeout_espera
+        self.verificar_apos_ociosa = verificar_apos_ociosa
+        self.idade_maxima = idade_maxima
+        self._cond = threading.Condition()
+        self._ociosas = deque()
+        self._em_uso = {}
+        self._abrindo = 0
+        self.conexoes_criadas = 0
+        self.conexoes_descartadas = 0
+        self.retiradas = 0
+        self.esperas = 0
+        self.espera_total_segundos = 0.0
+        self.espera_maxima_segundos = 0.0
+        self.timeouts = 0
+        self.falhas_verificacao = 0
+
+    def _total(self):
+        return len(self._ociosas) + len(self._em_uso) + self._abrindo
+
+    def obter(self):
+        inicio = time.monotonic()
+        esperou = False
+        with self._cond:
+            while True:
+                if self._ociosas:
+                    entrada = self._ociosas.pop()
+                    self._abrindo += 1
+                    break
+                if self._total() < self.tamanho_maximo:
+                    entrada = None
+                    self._abrindo += 1
+                    break
+                esperou = True
+                restante = self.timeout_espera - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self.timeouts += 1
+                    raise PoolEsgotado(f"Nenhuma conexão livre no pool após {self.timeout_espera}s (tamanho máximo {self.tamanho_maximo}).")
+                self._cond.wait(restante)
+            espera = time.monotonic() - inicio
+            self.retiradas += 1
+            if esperou:
+                self.esperas += 1
+            self.espera_total_segundos += espera
+            self.espera_maxima_segundos = max(self.espera_maxima_segundos, espera)
+
+        # Enquanto a conexão é verificada ou aberta ela conta em _abrindo, para o pool não passar do máximo
+        if entrada is not None and not self._saudavel(entrada):
+            self._descartar(entrada.conexao)
+            entrada = None
+        if entrada is None:
+            try:
+                entrada = _Entrada(self.conectar())
+            except Exception:
+                with self._cond:
+                    self._abrindo -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.conexoes_criadas += 1
+        with self._cond:
+            self._abrindo -= 1
+            self._em_uso[id(entrada.conexao)] = entrada
+        return entrada.conexao
+
+    def _saudavel(self, entrada):
+        conexao = entrada.conexao
+        agora = time.monotonic()
+        if getattr(conexao, 'closed', 0) or agora - entrada.criada_em > self.idade_maxima:
+            return False
+        if agora - entrada.devolvida_em < self.verificar_apos_ociosa:
+            return True
+        try:
+            with conexao.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not conexao.autocommit:
+                conexao.rollback()
+            return True
+        except Exception:
+            self.falhas_verificacao += 1
+            return False
+
+    def _limpar(self, conexao):
+        # A conexão volta ao pool sem transação aberta
+        if getattr(conexao, 'closed', 0):
+            return False
+        if pg_extensions is not None:
+            status = conexao.get_transaction_status()
+            if status == pg_extensions.TRANSACTION_STATUS_UNKNOWN:
+                return False
+            if status != pg_extensions.TRANSACTION_STATUS_IDLE:
+                conexao.rollback()
+        return True
+
+    def devolver(self, conexao):
+        with self._cond:
+            entrada = self._em_uso.pop(id(conexao), None)
+        if entrada is None:
+            # Conexão que não saiu deste pool (ex.: pool redimensionado ou recriado)
+            self._descartar(conexao)
+            return
+        try:
+            reutilizavel = self._limpar(conexao)
+        except Exception:
+            reutilizavel = False
+        with self._cond:
+            if reutilizavel and self._total() < self.tamanho_maximo:
+                entrada.devolvida_em = time.monotonic()
+                self._ociosas.append(entrada)
+                self._cond.notify()
+                return
+            self._cond.notify()
+        self._descartar(conexao)
+
+    def _descartar(self, conexao):
+        with self._cond:
+            self.conexoes_descartadas += 1
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+    def redimensionar(self, tamanho_maximo):
+        with self._cond:
+            self.tamanho_maximo = max(1, int(tamanho_maximo))
+            excedentes = []
+            while self._ociosas and self._total() > self.tamanho_maximo:
+                excedentes.append(self._ociosas.popleft())
+            self._cond.notify_all()
+        for entrada in excedentes:
+            self._descartar(entrada.conexao)
+
+    def fechar_ociosas(self):
+        with self._cond:
+            ociosas, self._ociosas = list(self._ociosas), deque()
+        for entrada in ociosas:
+            self._descartar(entrada.conexao)
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                'tamanho_maximo': self.tamanho_maximo,
+                'abertas': self._total(),
+                'em_uso': len(self._em_uso),
+                'ociosas': len(self._ociosas),
+                'conexoes_criadas': self.conexoes_criadas,
+                'conexoes_descartadas': self.conexoes_descartadas,
+                'retiradas': self.retiradas,
+                'esperas': self.esperas,
+                'espera_total_segundos': self.espera_total_segundos,
+                'espera_maxima_segundos': self.espera_maxima_segundos,
+                'timeouts': self.timeouts,
+                'falhas_verificacao': self.falhas_verificacao,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_tamanho_definido = None
+
+
+def pool_para(alias, conectar, opcoes=None):
+    # Um pool por alias de banco, criado na primeira conexão
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            opcoes = opcoes or {}
+            pool = _pools[alias] = PoolConexoes(
+                conectar,
+                tamanho_maximo=_tamanho_definido or opcoes.get('MAX_SIZE', TAMANHO_MAXIMO_PADRAO),
+                timeout_espera=opcoes.get('TIMEOUT', TIMEOUT_ESPERA_PADRAO),
+                verificar_apos_ociosa=opcoes.get('CHECK_AFTER_IDLE', VERIFICAR_APOS_OCIOSA_PADRAO),
+                idade_maxima=opcoes.get('MAX_LIFETIME', IDADE_MAXIMA_PADRAO),
+            )
+        return pool
+
+
+def pools_ativos():
+    with _pools_lock:
+        return dict(_pools)
+
+
+def definir_tamanho_maximo(tamanho):
+    # Usado por processos que sabem quantas threads vão usar o banco (ex.: fetch_ipu_data);
+    # vale para os pools já criados e para os próximos
+    global _tamanho_definido
+    with _pools_lock:
+        _tamanho_definido = max(1, int(tamanho))
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.redimensionar(_tamanho_definido)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Backend PostgreSQL do Django com pool de conexões (core.db.pool).
+# connect() retira uma conexão do pool e close() a devolve, então as threads do fetch_ipu_data e
+# os requests da API reaproveitam conexões já autenticadas em vez de abrir uma por unidade de
+# trabalho. As opções do pool ficam na chave POOL do DATABASES.
+from django.db.backends.postgresql import base
+
+from core.db.pool import pool_para
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def pool(self):
+        conn_params = self.get_connection_params()
+        return pool_para(
+            self.alias,
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            self.settings_dict.get('POOL'),
+        )
+
+    def get_new_connection(self, conn_params):
+        conexao = self.pool().obter()
+        # Conexões reaproveitadas não passam pelo get_new_connection original, que é quem define
+        # o isolation_level do wrapper
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = base.IsolationLevel.READ_COMMITTED if isolation_level is None else base.IsolationLevel(isolation_level)
+        return conexao
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool().devolver(self.connection)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Carrega variáveis do .env
@@ -80,14 +81,27 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Com DB_POOL_ENABLED (padrão), as conexões vêm do pool de core.db.pool e connection.close()
+# devolve a conexão ao pool. O fetch_ipu_data redimensiona o pool conforme --max-workers.
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', '1').lower() in ('1', 'true', 'yes')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.postgresql_pool' if DB_POOL_ENABLED else 'django.db.backends.postgresql',
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('POSTGRES_HOST'),
         'PORT': os.getenv('POSTGRES_PORT'),
+        # Com o pool, cada request/unidade de trabalho devolve a conexão ao final
+        'CONN_MAX_AGE': 0 if DB_POOL_ENABLED else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+            'CHECK_AFTER_IDLE': float(os.getenv('DB_POOL_CHECK_AFTER_IDLE', '30')),
+            'MAX_LIFETIME': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+        },
     }
 }
 
@@ -127,6 +141,44 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Arquivos gerados em execução ficam fora do código-fonte: no docker-compose o diretório backend/
+# é montado no container, e cada execução escreveria no checkout
+DATA_DIR = Path(os.getenv('DATA_DIR', str(Path(tempfile.gettempdir()) / 'monitor_ipu')))
+
+# Métricas Prometheus da última execução do fetch_ipu_data (formato do textfile collector),
+# servidas também em /metrics
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', str(DATA_DIR / 'metrics' / 'fetch_ipu_data.prom'))
+# As métricas trazem apelidos de configuração e meters de todos os clientes: /metrics só responde
+# a usuários autenticados ou, para o Prometheus, com "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Cache dos ZIPs exportados pela IICS (api.extraction.cache): uma nova execução reaproveita, dentro
+# do TTL, a exportação de uma janela cuja carga não terminou; acima do tamanho máximo saem as menos usadas
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', str(DATA_DIR / 'cache_exportacoes'))
+EXPORT_CACHE_TTL_SECONDS = float(os.getenv('EXPORT_CACHE_TTL_SECONDS', str(6 * 3600)))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+
+# Sessões da API da IICS expiram após 30 minutos sem uso; abaixo disso a sessão guardada
+# (api.extraction.sessions) é reaproveitada sem novo login
+IICS_SESSION_IDLE_SECONDS = float(os.getenv('IICS_SESSION_IDLE_SECONDS', str(25 * 60)))
+
+# Cache das agregações da API (api.agregacoes). Em arquivo, e não em memória local, porque a
+# invalidação parte de outro processo (o fetch_ipu_data, ao terminar de carregar uma configuração)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', str(DATA_DIR / 'cache_django')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '5000'))},
+    }
+}
+# Validade das agregações no cache mesmo sem nova carga (alterações feitas por fora do fetch_ipu_data)
+AGREGACOES_CACHE_TIMEOUT = float(os.getenv('AGREGACOES_CACHE_TIMEOUT', str(24 * 3600)))
+
+# APIs de consumo (api.views): dados de todos os clientes, então só para usuários autenticados
+REST_FRAMEWORK = {
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 